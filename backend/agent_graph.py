@@ -7,23 +7,49 @@ from langgraph.graph import StateGraph, END
 from pydantic import BaseModel, Field
 from typing import List, Any, Optional
 import json
+import asyncio
+import hashlib
+import itertools
 
 from langchain.tools import tool
 from langchain_google_genai import ChatGoogleGenerativeAI
 from pydantic import BaseModel
 from langchain.tools import StructuredTool
-from langchain.agents import create_json_chat_agent, AgentExecutor
+from langchain.agents import AgentExecutor
+from langchain.agents.json_chat.prompt import TEMPLATE_TOOL_RESPONSE
+from langchain.agents.output_parsers import JSONAgentOutputParser
+from langchain.agents.output_parsers.tools import ToolsAgentOutputParser
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain_core.output_parsers.json import parse_json_markdown
+from langchain_core.runnables import RunnablePassthrough
+from langchain_core.tools import render_text_description
 from langchain import hub
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 import datetime
 from zoneinfo import ZoneInfo
-from .calendar_tools import get_availability, create_event, update_event, delete_event, list_events, search_events
-from langchain_core.messages import BaseMessage
+from .calendar_tools import event_time, auser_timezone, acheck_availability, afind_free_slots, acreate_event, aupdate_event, adelete_event, abulk_create_events, abulk_update_events, abulk_delete_events, alist_events, asearch_events
+from langchain_core.messages import BaseMessage, AIMessage, HumanMessage
+from langchain_core.language_models import BaseChatModel
+from .event_store import compact_events
+from .llm_cache import LLMCache
+from .fast_path import FAST_PATH_ENABLED, try_fast_path
+from .streaming import message_text
+from .time_context import render_time_context
+from .prompt_cache import PROMPT_CACHE, PromptPrefix, resolve_mode
+from .metrics import llm_metrics_handler, parse_failures, record_tool, timed_node
+import time
+from langchain_core.runnables import RunnableConfig
 from langchain_core.agents import AgentAction, AgentFinish
-import operator
 from typing import TypedDict, Annotated, Union
 from langchain_core.exceptions import OutputParserException
 
+def add_steps(steps: Optional[list], new_steps: Optional[list]) -> list:
+    """Appends tool steps; ``None`` clears them, so each turn starts with an
+    empty scratchpad."""
+    if new_steps is None:
+        return []
+    return (steps or []) + new_steps
+
 class AgentState(TypedDict):
     """
     Represents the state of our agent.
@@ -31,19 +57,36 @@ class AgentState(TypedDict):
     Attributes:
         input: The input string from the user.
         chat_history: The list of previous messages in the conversation.
-        agent_outcome: The outcome of the agent's decision (tool call or final answer).
-        intermediate_steps: A list of (tool_call, tool_output) tuples.
+        agent_outcome: The outcome of the agent's decision (tool call(s) or final answer).
+        intermediate_steps: A list of (tool_call, tool_output, batch) tuples, where batch is
+            the position of the first step of the agent step it came from; pass None to reset it.
+        timezone: The user's IANA timezone; None to use their calendar's.
+        now: The current time in that timezone (ISO 8601), set when the turn starts.
         output: The final string response from the agent.
     """
     input: str
+    timezone: Optional[str]
+    now: Optional[str]
     chat_history: list[BaseMessage]
-    agent_outcome: Union[AgentAction, AgentFinish, None]
-    intermediate_steps: Annotated[list[tuple[AgentAction, str]], operator.add]
+    agent_outcome: Union[AgentAction, List[AgentAction], AgentFinish, None]
+    intermediate_steps: Annotated[list[tuple[AgentAction, str, int]], add_steps]
 
 # Define Pydantic Schemas for Tools
 class CheckAvailabilityArgs(BaseModel):
     start: str
     end: str
+    attendees: Optional[list[str]] = Field(None, description="Email addresses of attendees whose availability should be checked too.")
+
+class FindFreeSlotsArgs(BaseModel):
+    duration_minutes: int = Field(..., description="Length of the meeting in minutes.")
+    start: str = Field(..., description="Start of the search horizon in ISO 8601 format.")
+    end: str = Field(..., description="End of the search horizon in ISO 8601 format.")
+    working_hours_start: str = Field("09:00", description="Start of the working day (HH:MM, local time).")
+    working_hours_end: str = Field("17:00", description="End of the working day (HH:MM, local time).")
+    timezone: Optional[str] = Field(None, description="IANA timezone for the working hours, e.g. 'Europe/Berlin'. Leave out to use the user's timezone.")
+    attendees: Optional[list[str]] = Field(None, description="Email addresses of attendees who must also be free.")
+    include_weekends: bool = Field(False, description="Whether Saturdays and Sundays can be used.")
+    max_results: int = Field(5, description="How many slots to return.")
 
 class CreateEventArgs(BaseModel):
     summary: str
@@ -62,96 +105,181 @@ class UpdateEventArgs(BaseModel):
 class DeleteEventArgs(BaseModel):
     event_id: str = Field(..., description="The ID of the event to delete.")
 
+class BulkCreateEventsArgs(BaseModel):
+    events: list[CreateEventArgs] = Field(..., description="The events to create.")
+
+class BulkUpdateEventsArgs(BaseModel):
+    updates: list[UpdateEventArgs] = Field(..., description="One entry per event to update, each with its event_id and the new values.")
+
+class BulkDeleteEventsArgs(BaseModel):
+    event_ids: list[str] = Field(..., description="The IDs of the events to delete.")
+
 class ListEventsArgs(BaseModel):
     start: str
     end: str
+    max_results: int = Field(50, description="The most events to return; narrow the range to see more.")
 
 class SearchEventArgs(BaseModel):
-    query: str = Field(..., description="The name of the event to search for.")
-
-
-
-def create_agent_graph(service: Resource) -> StateGraph:
-    """Creates the agent graph with the provided Google Calendar service."""
-
-    # Define Tool Functions *inside* this scope to capture the 'service' object
-    def check_availability_func(start: str, end: str) -> str:
-        """Check if the calendar is free between start and end (ISO 8601)."""
-        available = get_availability(service, start, end)
-        return "Available" if available else "Busy"
-
-    def create_event_func(summary: str, start: str, end: str, attendees: list = None, description: str = "") -> str:
-        """Create a calendar event with the given summary (title), time, attendees, and optional description."""
-        event = create_event(service, summary, start, end, attendees, description)
-        return f"Event created: {event.get('htmlLink', '')}"
-
-    def update_event_func(event_id: str, summary: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None, description: Optional[str] = None) -> str:
-        """Update an existing calendar event's summary (title), start/end time, or description."""
-        new_values = {}
-        if summary:
-            new_values['summary'] = summary
-        if start:
-            new_values['start'] = {'dateTime': start, 'timeZone': 'UTC'}
-        if end:
-            new_values['end'] = {'dateTime': end, 'timeZone': 'UTC'}
-        if description:
-            new_values['description'] = description
-        
-        if not new_values:
-            return "No update values provided."
-
-        event = update_event(service, event_id, new_values)
-        return f"Event updated: {event.get('htmlLink', '')}"
-
-    def delete_event_func(event_id: str) -> str:
-        """Delete a calendar event with the given event_id."""
-        delete_event(service, event_id)
-        return "Event deleted."
-
-    def list_events_func(start: str, end: str) -> str:
-        """List calendar events in the specified date range (ISO 8601).
-        Returns a JSON string of the events list. Each event is a dictionary
-        containing details like 'id', 'summary', 'start', and 'end'."""
-        events = list_events(service, start, end)
-        if not events:
-            return "No events found."
-        if isinstance(events, str): # Handle auth error message
-            return events
-        # Return the raw data as a JSON string so the agent can use it, especially the 'id'
-        return json.dumps(events)
-
-    def search_events_func(query: str) -> str:
-        """Search for events by name to find their event_id."""
-        return search_events(service, query)
-
-    def get_current_time_func() -> str:
-        """Returns the current date and time in Indian Standard Time (IST, UTC+05:30) in ISO 8601 format."""
-        return datetime.datetime.now(ZoneInfo("Asia/Kolkata")).isoformat()
-
-    # Create Structured Tools
-    tools = [
-        StructuredTool.from_function(func=check_availability_func, name="check_availability", description="Check if the calendar is free between start and end (ISO 8601).", args_schema=CheckAvailabilityArgs),
-        StructuredTool.from_function(func=create_event_func, name="create_event", description="Create a calendar event with the given summary (title), time, attendees, and optional description.", args_schema=CreateEventArgs),
-        StructuredTool.from_function(func=update_event_func, name="update_event", description="Update an existing calendar event's summary (title), start/end time, or description.", args_schema=UpdateEventArgs),
-        StructuredTool.from_function(func=delete_event_func, name="delete_event", description="Delete a calendar event with the given event_id. Always use search_events to find the event_id first.", args_schema=DeleteEventArgs),
-        StructuredTool.from_function(func=search_events_func, name="search_events", description="Search for events by name to find their event_id.", args_schema=SearchEventArgs),
-        StructuredTool.from_function(func=list_events_func, name="list_events", description="List calendar events in the specified date range (ISO 8601).", args_schema=ListEventsArgs),
-        StructuredTool.from_function(func=get_current_time_func, name="get_current_time", description="Returns the current date and time in Indian Standard Time (IST, UTC+05:30) in ISO 8601 format."),
-    ]
-
-    # Gemini LLM via LangChain
-    llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=os.getenv("GEMINI_API_KEY"))
-
-    # Agent initialization
-    prompt_template = ChatPromptTemplate.from_messages([
-        ("system", """You are a powerful calendar assistant. You have access to a suite of tools to help users manage their Google Calendar.
-IMPORTANT: Before you can delete or update an event, you MUST know its `event_id`. If the user asks to delete an event by name (e.g., "delete the team meeting"), you must first use the `search_events` tool to find the `event_id` for that event. Only after you have the `event_id` can you use the `delete_event` tool.
+    query: str = Field(..., description="The name of the event to search for, or an attendee's name. Partial words and typos are fine.")
+
+
+
+def _calendar_service(config: RunnableConfig) -> Resource:
+    """Returns the per-user Google Calendar service passed in the run config."""
+    return config["configurable"]["service"]
+
+async def _turn_timezone(config: RunnableConfig) -> str:
+    """The timezone fixed for this turn (see ``set_context``), else the calendar's."""
+    return config["configurable"].get("timezone") or await auser_timezone(_calendar_service(config))
+
+# Tool functions read the calendar service from the run config, so the tools
+# (and the compiled graph) can be shared across users and requests. They are
+# async and run the blocking Google API calls on the calendar executor.
+async def check_availability_func(start: str, end: str, config: RunnableConfig, attendees: Optional[list[str]] = None) -> str:
+    """Check if the calendar (and optionally the attendees' calendars) is free between start and end (ISO 8601)."""
+    availability = await acheck_availability(_calendar_service(config), start, end, attendees, await _turn_timezone(config))
+    lines = []
+    if availability['busy']:
+        lines.append("Busy during:")
+        lines += [f"- {busy_start.isoformat()} to {busy_end.isoformat()}" for busy_start, busy_end in availability['busy']]
+    else:
+        lines.append("Available")
+    if availability['conflicts']:
+        lines.append("Conflicting events on your calendar:")
+        lines.append(compact_events(availability['conflicts']))
+    for calendar_id, reason in availability['errors'].items():
+        lines.append(f"Could not check the availability of {calendar_id} ({reason}).")
+    return "\n".join(lines)
+
+async def find_free_slots_func(duration_minutes: int, start: str, end: str, config: RunnableConfig, working_hours_start: str = "09:00",
+                               working_hours_end: str = "17:00", timezone: Optional[str] = None, attendees: Optional[list[str]] = None,
+                               include_weekends: bool = False, max_results: int = 5) -> str:
+    """Find the earliest free slots of the given length within working hours."""
+    slots = await afind_free_slots(
+        _calendar_service(config), duration_minutes, start, end,
+        working_hours_start=working_hours_start, working_hours_end=working_hours_end,
+        timezone=timezone or await _turn_timezone(config),
+        attendees=attendees, include_weekends=include_weekends, max_results=max_results,
+    )
+    if not slots:
+        return "No free slots found in that time range."
+    return "Free slots:\n" + "\n".join(f"- {slot_start.isoformat()} to {slot_end.isoformat()}" for slot_start, slot_end in slots)
+
+async def create_event_func(summary: str, start: str, end: str, config: RunnableConfig, attendees: list = None, description: str = "") -> str:
+    """Create a calendar event with the given summary (title), time, attendees, and optional description."""
+    event = await acreate_event(_calendar_service(config), summary, start, end, attendees, description, await _turn_timezone(config))
+    return f"Event created: {event.get('htmlLink', '')}"
+
+def _update_values(timezone: str, summary: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None,
+                   description: Optional[str] = None) -> dict:
+    """The fields to patch; times without an offset are local times in ``timezone``."""
+    new_values = {}
+    if summary:
+        new_values['summary'] = summary
+    if start:
+        new_values['start'] = event_time(start, timezone)
+    if end:
+        new_values['end'] = event_time(end, timezone)
+    if description:
+        new_values['description'] = description
+    return new_values
+
+async def update_event_func(event_id: str, config: RunnableConfig, summary: Optional[str] = None, start: Optional[str] = None, end: Optional[str] = None, description: Optional[str] = None) -> str:
+    """Update an existing calendar event's summary (title), start/end time, or description."""
+    new_values = _update_values(await _turn_timezone(config), summary, start, end, description)
+    if not new_values:
+        return "No update values provided."
+
+    event = await aupdate_event(_calendar_service(config), event_id, new_values)
+    return f"Event updated: {event.get('htmlLink', '')}"
+
+async def delete_event_func(event_id: str, config: RunnableConfig) -> str:
+    """Delete a calendar event with the given event_id."""
+    await adelete_event(_calendar_service(config), event_id)
+    return "Event deleted."
+
+def _format_bulk_results(results: list[dict], verb: str) -> str:
+    lines = []
+    for result in results:
+        name = result.get('id') or result.get('summary')
+        if result['ok']:
+            lines.append(f"- {name}: {verb}")
+        else:
+            lines.append(f"- {name}: failed ({result['error']})")
+    succeeded = sum(result['ok'] for result in results)
+    return f"{succeeded} of {len(results)} events {verb}:\n" + "\n".join(lines)
+
+async def bulk_create_events_func(events: list[CreateEventArgs], config: RunnableConfig) -> str:
+    """Create several calendar events at once."""
+    results = await abulk_create_events(_calendar_service(config), [event.model_dump() for event in events],
+                                        await _turn_timezone(config))
+    return _format_bulk_results(results, "created")
+
+async def bulk_update_events_func(updates: list[UpdateEventArgs], config: RunnableConfig) -> str:
+    """Update several calendar events at once."""
+    timezone = await _turn_timezone(config)
+    changes = [(update.event_id, _update_values(timezone, update.summary, update.start, update.end, update.description))
+               for update in updates]
+    # Entries without a field to change aren't sent, but are reported in their place
+    sent = [(event_id, new_values) for event_id, new_values in changes if new_values]
+    results = iter(await abulk_update_events(_calendar_service(config), sent) if sent else [])
+    return _format_bulk_results([
+        next(results) if new_values else {'id': event_id, 'ok': False, 'error': "no update values provided"}
+        for event_id, new_values in changes
+    ], "updated")
+
+async def bulk_delete_events_func(event_ids: list[str], config: RunnableConfig) -> str:
+    """Delete several calendar events at once."""
+    results = await abulk_delete_events(_calendar_service(config), event_ids)
+    return _format_bulk_results(results, "deleted")
+
+async def list_events_func(start: str, end: str, config: RunnableConfig, max_results: int = 50) -> str:
+    """List calendar events in the specified date range (ISO 8601).
+    Returns one line per event with its id, start, end and summary."""
+    # One extra event tells us whether the range holds more than we return
+    events = await alist_events(_calendar_service(config), start, end, max_results + 1, await _turn_timezone(config))
+    if not events:
+        return "No events found."
+    if isinstance(events, str): # Handle auth error message
+        return events
+    # Only the fields the agent needs (especially the 'id'), to keep the scratchpad small
+    result = compact_events(events[:max_results])
+    if len(events) > max_results:
+        result += f"\n(Showing the first {max_results} events; there are more in this range.)"
+    return result
+
+async def search_events_func(query: str, config: RunnableConfig) -> str:
+    """Search for events by name to find their event_id."""
+    return await asearch_events(_calendar_service(config), query)
+
+async def get_current_time_func(config: RunnableConfig) -> str:
+    """Returns the current date and time in the user's timezone in ISO 8601 format."""
+    return datetime.datetime.now(ZoneInfo(await _turn_timezone(config))).isoformat()
+
+# Create Structured Tools
+tools = [
+    StructuredTool.from_function(coroutine=check_availability_func, name="check_availability", description="Check if the calendar is free between start and end (ISO 8601), optionally together with the attendees' calendars. If busy, lists the busy times and conflicting events.", args_schema=CheckAvailabilityArgs),
+    StructuredTool.from_function(coroutine=find_free_slots_func, name="find_free_slots", description="Find the earliest free slots of a given length (in minutes) between start and end (ISO 8601), within working hours and for all attendees. Use this instead of guessing times with check_availability.", args_schema=FindFreeSlotsArgs),
+    StructuredTool.from_function(coroutine=create_event_func, name="create_event", description="Create a calendar event with the given summary (title), time, attendees, and optional description.", args_schema=CreateEventArgs),
+    StructuredTool.from_function(coroutine=update_event_func, name="update_event", description="Update an existing calendar event's summary (title), start/end time, or description.", args_schema=UpdateEventArgs),
+    StructuredTool.from_function(coroutine=delete_event_func, name="delete_event", description="Delete a calendar event with the given event_id. Always use search_events to find the event_id first.", args_schema=DeleteEventArgs),
+    StructuredTool.from_function(coroutine=bulk_create_events_func, name="bulk_create_events", description="Create several calendar events in one call. Each event takes the same fields as create_event.", args_schema=BulkCreateEventsArgs),
+    StructuredTool.from_function(coroutine=bulk_update_events_func, name="bulk_update_events", description="Update several calendar events in one call. Each update takes the same fields as update_event.", args_schema=BulkUpdateEventsArgs),
+    StructuredTool.from_function(coroutine=bulk_delete_events_func, name="bulk_delete_events", description="Delete several calendar events in one call, e.g. to cancel all meetings on a day. Use list_events or search_events to find the event_ids first.", args_schema=BulkDeleteEventsArgs),
+    StructuredTool.from_function(coroutine=search_events_func, name="search_events", description="Search past and upcoming events by name, attendee, location or description to find their event_id. A recurring event comes back once, with its series id (to change or delete every occurrence) and the id of its next occurrence.", args_schema=SearchEventArgs),
+    StructuredTool.from_function(coroutine=list_events_func, name="list_events", description="List calendar events in the specified date range (ISO 8601). Returns one 'id | start | end | summary' line per event.", args_schema=ListEventsArgs),
+    StructuredTool.from_function(coroutine=get_current_time_func, name="get_current_time", description="Returns the current date and time in the user's timezone in ISO 8601 format. The time at the start of the request is already given with the user's message."),
+]
+tools_by_name = {t.name: t for t in tools}
+
+
+SYSTEM_PROMPT = """You are a powerful calendar assistant. You have access to a suite of tools to help users manage their Google Calendar.
 ---
 CRITICAL INSTRUCTIONS FOR DATE AND TIME:
-1. The `get_current_time` tool is your ONLY source of truth for the current date and time.
-2. You MUST ALWAYS use the year provided by this tool when interpreting relative dates like 'today', 'tomorrow', 'next Sunday', or 'next month'.
-3. **Example Scenario**: If the user says "list events for next Sunday" and the `get_current_time` tool returns `2025-06-28T18:45:00`, you MUST calculate the date for the upcoming Sunday in the year 2025. Do NOT default to any other year.
-4. **Strategy**: If a user's request involves a relative date, your first step should be to use the `get_current_time` tool to establish the correct date context before proceeding.
+1. Each user message starts with the current time, the user's timezone and a table of relative dates ('today', 'tomorrow', 'next week', the coming weekdays, ...) already resolved. This is your ONLY source of truth for the current date and time.
+2. You MUST use the dates from this table when interpreting relative dates like 'today', 'tomorrow', 'next Sunday', or 'next month'. Do NOT default to any other year.
+3. **Example Scenario**: If the user says "list events for next Sunday", use the date listed for "Sunday (coming)" and list the events from the start to the end of that day in the user's timezone.
+4. Times without an offset are in the user's timezone; write them with its UTC offset. Only call `get_current_time` if you need the time later in a long task.
 ---
 CRITICAL INSTRUCTIONS FOR MODIFYING EVENTS:
 1. Before you can delete or update an event, you MUST know its `event_id`.
@@ -163,7 +291,7 @@ Respond to the human as helpfully and accurately as possible. You have access to
 
 {tools}
 
-When you receive the result from a tool (especially get_current_time), you MUST use that information to inform your next action. For example, if get_current_time returns a date in 2025, and the user asks to create an event for "next Sunday", you must create the event in 2025. Do not create events in the past unless the user explicitly asks for a past date.
+When you receive the result from a tool, you MUST use that information to inform your next action. Do not create events in the past unless the user explicitly asks for a past date.
 
 Use a json blob to specify a tool by providing an action key (tool name) and an action_input key (tool input).
 
@@ -181,8 +309,8 @@ Here is an example of a valid tool-use response:
   "action": "create_event",
   "action_input": {{
     "summary": "Team Meeting",
-    "start": "2025-07-01T10:00:00",
-    "end": "2025-07-01T11:00:00"
+    "start": "2025-07-01T10:00:00+05:30",
+    "end": "2025-07-01T11:00:00+05:30"
   }}
 }}
 ```
@@ -193,19 +321,205 @@ Here is an example of a valid final answer:
   "action": "Final Answer",
   "action_input": "I have scheduled the event 'Team Meeting' for you tomorrow at 10 AM."
 }}
-"""),
+"""
+
+PARALLEL_TOOL_CALLS_PROMPT = """```
+
+To run several independent tools at once, respond with a json list of blobs instead of a single blob, for example to list two date ranges or to search for several events by name. All the observations are returned together. Only batch actions that do not depend on each other's results, and never put "Final Answer" in a list.
+
+Here is an example of a valid parallel tool-use response:
+```json
+[
+  {{"action": "search_events", "action_input": {{"query": "Standup"}}}},
+  {{"action": "search_events", "action_input": {{"query": "Design review"}}}}
+]
+```
+"""
+
+PARALLEL_TEMPLATE_TOOL_RESPONSE = TEMPLATE_TOOL_RESPONSE.replace(
+    "a json blob with a single action", "a json blob (or a json list of blobs for independent actions)"
+)
+
+# Lets the model return a list of independent actions, which run concurrently
+PARALLEL_TOOL_CALLS = os.getenv("AGENT_PARALLEL_TOOL_CALLS", "true").lower() in ("1", "true", "yes")
+
+# "json" has the model write JSON blobs as taught by SYSTEM_PROMPT; "tools"
+# uses Gemini's native function calling, with the tool schemas sent as
+# function declarations and the much shorter TOOL_CALLING_PROMPT.
+AGENT_ENGINE = os.getenv("AGENT_ENGINE", "json").lower()
+
+TOOL_CALLING_PROMPT = """You are a calendar assistant that manages the user's Google Calendar with the tools provided.
+- Each message starts with the current time, the user's timezone and resolved relative dates; use them for "tomorrow", "next Sunday" and the like, never assume the year.
+- Updating or deleting an event needs its event_id: find it with search_events or list_events first.
+- Call independent tools together in one turn.
+- Use ISO 8601 times with the user's UTC offset, and don't create events in the past unless asked.
+Once you have what you need, answer the user in plain text."""
+
+class MultiActionJSONAgentOutputParser(JSONAgentOutputParser):
+    """JSON agent parser that turns a list of json blobs into a list of actions."""
+
+    def parse(self, text: str) -> Union[List[AgentAction], AgentAction, AgentFinish]:
+        try:
+            response = parse_json_markdown(text)
+        except Exception as e:
+            raise OutputParserException(f"Could not parse LLM output: {text}") from e
+        if not isinstance(response, list):
+            return super().parse(text)
+        try:
+            actions = [
+                AgentAction(blob["action"], blob.get("action_input") or {}, text)
+                for blob in response
+                if blob["action"] != "Final Answer"
+            ]
+        except (KeyError, TypeError) as e:
+            raise OutputParserException(f"Could not parse LLM output: {text}") from e
+        if not actions:
+            return super().parse(text)
+        return actions if len(actions) > 1 else actions[0]
+
+def format_scratchpad(intermediate_steps: list[tuple[AgentAction, str, int]], template_tool_response: str = TEMPLATE_TOOL_RESPONSE) -> list[BaseMessage]:
+    """Formats the steps like ``format_log_to_messages``, except that the actions
+    of one parallel batch share an AI message and their observations are
+    returned together in a single reply."""
+    messages = []
+    for _, steps in itertools.groupby(intermediate_steps, key=lambda step: step[2]):
+        steps = list(steps)
+        if len(steps) == 1:
+            observation = steps[0][1]
+        else:
+            observation = "\n\n".join(
+                f"{action.tool} {json.dumps(action.tool_input)} returned:\n{result}" for action, result, _ in steps
+            )
+        messages.append(AIMessage(content=steps[0][0].log))
+        messages.append(HumanMessage(content=template_tool_response.format(observation=observation)))
+    return messages
+
+def render_json_prompt(system_prompt: str, tools) -> str:
+    """The JSON engine's system prompt with the tool list filled in."""
+    return system_prompt.format(
+        tools=render_text_description(list(tools)),
+        tool_names=", ".join([t.name for t in tools]),
+    )
+
+def create_json_agent(llm, prompt: ChatPromptTemplate, parallel_tool_calls: bool = False):
+    """Same runnable as ``create_json_chat_agent``, optionally accepting parallel
+    actions; the tools are described in the (already rendered) prompt."""
+    if parallel_tool_calls:
+        output_parser, template_tool_response = MultiActionJSONAgentOutputParser(), PARALLEL_TEMPLATE_TOOL_RESPONSE
+    else:
+        output_parser, template_tool_response = JSONAgentOutputParser(), TEMPLATE_TOOL_RESPONSE
+    return (
+        RunnablePassthrough.assign(agent_scratchpad=lambda x: format_scratchpad(x["intermediate_steps"], template_tool_response))
+        | prompt
+        | llm.bind(stop=["\nObservation"])
+        | output_parser
+    )
+
+
+class ToolCallingOutputParser(ToolsAgentOutputParser):
+    """Tool calls become actions (always a list); a reply without any is the
+    final answer, flattened to text if the model sent it as content parts."""
+
+    def parse_result(self, result, *, partial: bool = False):
+        outcome = super().parse_result(result, partial=partial)
+        if isinstance(outcome, AgentFinish) and not isinstance(outcome.return_values["output"], str):
+            text = message_text(outcome.return_values["output"])
+            outcome = AgentFinish(return_values={"output": text}, log=text)
+        return outcome
+
+def create_tools_agent(llm, prompt: ChatPromptTemplate, callbacks: Optional[list] = None):
+    """Same runnable as ``create_tool_calling_agent``: ``llm`` has the tools
+    bound and answers with structured tool calls."""
+    return (
+        RunnablePassthrough.assign(agent_scratchpad=lambda x: format_to_tool_messages([(action, observation) for action, observation, _ in x["intermediate_steps"]]))
+        | prompt
+        | llm.with_config(callbacks=callbacks or [])
+        | ToolCallingOutputParser()
+    )
+
+
+def create_agent_graph(parallel_tool_calls: bool = PARALLEL_TOOL_CALLS, llm_cache: Optional[LLMCache] = None,
+                       fast_path: bool = FAST_PATH_ENABLED, llm: Optional[BaseChatModel] = None,
+                       engine: str = AGENT_ENGINE, prompt_cache: str = PROMPT_CACHE,
+                       context_cache_client=None) -> StateGraph:
+    """Creates the agent graph.
+
+    The graph holds no per-user state: compile it once and pass the user's
+    Google Calendar service on each run via
+    ``config={"configurable": {"service": service}}``.
+    With ``parallel_tool_calls`` the model may return a list of independent
+    actions, which are executed concurrently in a single step.
+    With an ``llm_cache``, read-only agent steps that were seen before are
+    answered from the cache instead of calling the model.
+    Each run starts by fixing the user's timezone (``timezone`` in the input,
+    else their primary calendar's) and the current time, which reach the model
+    with the message as a table of resolved relative dates.
+    With ``fast_path``, simple requests (the time, the agenda for a day or
+    week) are answered by a router node without calling the model at all.
+    ``llm`` replaces the Gemini model, e.g. with a scripted fake for benchmarks.
+    ``engine`` picks how the model calls tools: "json" blobs in its text, or
+    "tools" for native function calling (parallel calls always allowed).
+    ``prompt_cache`` picks how the static system prompt and tool declarations
+    are sent (see ``prompt_cache.PROMPT_CACHE``); ``context_cache_client``
+    replaces the Gemini cached-content client.
+    """
+
+    # Gemini LLM via LangChain
+    if llm is None:
+        llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=os.getenv("GEMINI_API_KEY"))
+
+    # Agent initialization. The system prompt (and the tool declarations) are
+    # rendered once here and sent identically on every call.
+    if engine == "tools":
+        system_prompt = TOOL_CALLING_PROMPT
+    elif engine == "json":
+        system_prompt = render_json_prompt(SYSTEM_PROMPT + (PARALLEL_TOOL_CALLS_PROMPT if parallel_tool_calls else ""), tools)
+    else:
+        raise ValueError(f"Unknown agent engine {engine!r}; use 'json' or 'tools'.")
+    prefix = PromptPrefix(system_prompt, tools if engine == "tools" else None, resolve_mode(prompt_cache, llm),
+                          model_name=getattr(llm, "model", None), client=context_cache_client)
+    prompt_template = ChatPromptTemplate.from_messages([
+        *prefix.messages(),
         MessagesPlaceholder(variable_name="chat_history"),
-        ("human", "{input}"),
+        # The time goes with the message, not in the system prompt, so the
+        # system prompt stays the same on every request
+        ("human", "{time_context}\n\n{input}"),
         MessagesPlaceholder(variable_name="agent_scratchpad"),
     ])
-    agent_runnable = create_json_chat_agent(llm, tools, prompt_template)
+    # Model call durations and token counts go to /metrics
+    if engine == "tools":
+        agent_runnable = create_tools_agent(prefix.model(llm), prompt_template, callbacks=[llm_metrics_handler])
+    else:
+        agent_runnable = create_json_agent(prefix.model(llm.with_config(callbacks=[llm_metrics_handler])), prompt_template, parallel_tool_calls)
+    agent_runnable = RunnablePassthrough.assign(
+        time_context=lambda x: render_time_context(datetime.datetime.fromisoformat(x["now"]), x["timezone"])
+    ) | agent_runnable
+    # Cached decisions only apply to the same model and prompt
+    cache_namespace = hashlib.sha256(f"{getattr(llm, 'model', type(llm).__name__)}\n{system_prompt}".encode()).hexdigest()
 
     # Define Graph Nodes
-    def run_agent(state: AgentState):
+    @timed_node("context")
+    async def set_context(state: AgentState, config: RunnableConfig):
+        """Fixes the user's timezone and the current time for the whole turn."""
+        timezone = state.get("timezone") or await auser_timezone(_calendar_service(config))
+        return {"timezone": timezone, "now": datetime.datetime.now(ZoneInfo(timezone)).isoformat(timespec="seconds")}
+
+    @timed_node("agent")
+    async def run_agent(state: AgentState, config: RunnableConfig):
         """Invokes the agent to decide on an action."""
+        cache_key = llm_cache.key(state, cache_namespace) if llm_cache else None
+        if cache_key:
+            cached = llm_cache.get(cache_key)
+            if cached is not None:
+                return {"agent_outcome": cached}
         try:
-            agent_outcome = agent_runnable.invoke(state)
+            # With the run config, callers using astream_events also get the model's tokens
+            agent_outcome = await agent_runnable.ainvoke(state, config=config)
+            prefix.record_call()
+            if cache_key:
+                llm_cache.set(cache_key, agent_outcome)
         except OutputParserException as e:
+            parse_failures.inc(engine=engine)
             raw_output = str(e).removeprefix("Could not parse LLM output: ")
             agent_outcome = AgentFinish(return_values={"output": raw_output}, log=raw_output)
         except Exception as e:
@@ -213,12 +527,36 @@ Here is an example of a valid final answer:
             agent_outcome = AgentFinish(return_values={"output": error_message}, log=error_message)
         return {"agent_outcome": agent_outcome}
 
-    def execute_tools(state: AgentState):
-        """Executes the tool specified by the agent."""
-        agent_action = state["agent_outcome"]
-        tool_to_use = {t.name: t for t in tools}[agent_action.tool]
-        observation = tool_to_use.invoke(agent_action.tool_input)
-        return {"intermediate_steps": [(agent_action, observation)]}
+    async def run_tool(agent_action: AgentAction, config: RunnableConfig):
+        started = time.perf_counter()
+        try:
+            return await tools_by_name[agent_action.tool].ainvoke(agent_action.tool_input, config=config)
+        finally:
+            record_tool(agent_action.tool, time.perf_counter() - started)
+
+    @timed_node("action")
+    async def execute_tools(state: AgentState, config: RunnableConfig):
+        """Executes the tool(s) specified by the agent, concurrently if there are several."""
+        agent_outcome = state["agent_outcome"]
+        agent_actions = agent_outcome if isinstance(agent_outcome, list) else [agent_outcome]
+        # Tools see the turn's timezone, the one the model was told about
+        config = {**config, "configurable": {**config["configurable"], "timezone": state.get("timezone")}}
+        observations = await asyncio.gather(*(run_tool(agent_action, config) for agent_action in agent_actions))
+        # Steps of one batch share its number, so the scratchpad can group them
+        batch = len(state.get("intermediate_steps") or [])
+        return {"intermediate_steps": [(action, observation, batch) for action, observation in zip(agent_actions, observations)]}
+
+    @timed_node("router")
+    async def route(state: AgentState, config: RunnableConfig):
+        """Answers simple requests directly; everything else goes on to the agent."""
+        result = await try_fast_path(state["input"], _calendar_service(config), state["timezone"])
+        if result is None:
+            return {"agent_outcome": None}
+        tool, tool_input, reply = result
+        return {
+            "agent_outcome": AgentFinish(return_values={"output": reply}, log=reply),
+            "intermediate_steps": [(AgentAction(tool=tool, tool_input=tool_input, log=""), reply, 0)],
+        }
 
     def decide(state: AgentState):
         """Determines the next step based on the agent's outcome."""
@@ -229,9 +567,16 @@ Here is an example of a valid final answer:
 
     # Build the graph
     workflow = StateGraph(AgentState)
+    workflow.add_node("context", set_context)
     workflow.add_node("agent", run_agent)
     workflow.add_node("action", execute_tools)
-    workflow.set_entry_point("agent")
+    workflow.set_entry_point("context")
+    if fast_path:
+        workflow.add_node("router", route)
+        workflow.add_edge("context", "router")
+        workflow.add_conditional_edges("router", decide, {"continue": "agent", "end": END})
+    else:
+        workflow.add_edge("context", "agent")
     workflow.add_conditional_edges(
         "agent",
         decide,
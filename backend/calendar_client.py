@@ -0,0 +1,182 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import threading
+import time
+import weakref
+from typing import Awaitable, Callable, Hashable, Optional
+from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
+from .metrics import registry
+
+# Every Calendar API request made by calendar_tools and the event mirror goes
+# through ``execute``: it waits for the user's token bucket (CALENDAR_RATE_LIMIT
+# requests per second, bursts of CALENDAR_RATE_BURST) and retries rate-limit
+# and server errors with exponential backoff and full jitter, so a 429 is
+# absorbed here instead of reaching the model as an error string.
+CALENDAR_RATE_LIMIT = float(os.getenv("CALENDAR_RATE_LIMIT", "10"))
+CALENDAR_RATE_BURST = int(os.getenv("CALENDAR_RATE_BURST", "20"))
+CALENDAR_MAX_RETRIES = int(os.getenv("CALENDAR_MAX_RETRIES", "5"))
+CALENDAR_BACKOFF_BASE = float(os.getenv("CALENDAR_BACKOFF_BASE", "0.5"))
+CALENDAR_BACKOFF_MAX = float(os.getenv("CALENDAR_BACKOFF_MAX", "32"))
+
+# 403s carrying one of these reasons are rate limits, not permission errors
+RATE_LIMIT_REASONS = {"rateLimitExceeded", "userRateLimitExceeded", "quotaExceeded"}
+SERVER_ERRORS = {500, 502, 503, 504}
+
+retries = registry.counter("calendar_retries_total", "Calendar API requests retried after a rate-limit or server error.")
+throttled_seconds = registry.histogram("calendar_throttle_seconds", "Time Calendar API requests waited for the per-user rate limit.")
+coalesced = registry.counter("calendar_coalesced_total", "Calendar reads served by an identical call already in flight.")
+
+class TokenBucket:
+    """Allows ``rate`` requests per second on average and bursts of ``burst``.
+
+    ``acquire`` reserves a token and sleeps until it is due, so waiting callers
+    are served in the order they arrived."""
+
+    def __init__(self, rate: float, burst: int):
+        self.rate, self.burst = rate, burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, tokens: int = 1) -> float:
+        """Takes tokens, blocking until they are due; returns the seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate) - tokens
+            self._updated = now
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait:
+            time.sleep(wait)
+        return wait
+
+_buckets: "weakref.WeakKeyDictionary[Resource, TokenBucket]" = weakref.WeakKeyDictionary()
+_buckets_lock = threading.Lock()
+
+def user_bucket(service: Resource) -> TokenBucket:
+    bucket = _buckets.get(service)
+    if bucket is None:
+        with _buckets_lock:
+            bucket = _buckets.setdefault(service, TokenBucket(CALENDAR_RATE_LIMIT, CALENDAR_RATE_BURST))
+    return bucket
+
+def _reason(error: HttpError) -> str:
+    try:
+        return json.loads(error.content)["error"]["errors"][0]["reason"]
+    except (ValueError, KeyError, IndexError, TypeError):
+        return ""
+
+def is_rate_limited(error: HttpError) -> bool:
+    """True for errors that mean the request was turned away unprocessed."""
+    status = error.resp.status
+    return status == 429 or (status == 403 and _reason(error) in RATE_LIMIT_REASONS)
+
+def is_retryable(error: Exception, idempotent: bool = True) -> bool:
+    """Rate limits can always be retried. Server errors only for idempotent
+    requests: an insert that failed with a 500 may still have gone through."""
+    if not isinstance(error, HttpError):
+        return False
+    return is_rate_limited(error) or (idempotent and error.resp.status in SERVER_ERRORS)
+
+def backoff_delay(attempt: int, error: HttpError = None) -> float:
+    """Exponential backoff with full jitter, or the server's Retry-After if it sent one."""
+    retry_after = error.resp.get("retry-after") if error is not None else None
+    if retry_after:
+        try:
+            return min(float(retry_after), CALENDAR_BACKOFF_MAX)
+        except ValueError:
+            pass
+    return random.uniform(0, min(CALENDAR_BACKOFF_MAX, CALENDAR_BACKOFF_BASE * 2 ** attempt))
+
+def with_retries(service: Resource, call: Callable, idempotent: bool = True, what: str = "request", cost: int = 1):
+    """Runs ``call()`` (one HTTP round trip worth ``cost`` API calls) under the
+    user's rate limit, retrying rate-limit and server errors up to
+    CALENDAR_MAX_RETRIES times."""
+    bucket = user_bucket(service)
+    attempt = 0
+    while True:
+        waited = bucket.acquire(cost)
+        if waited:
+            throttled_seconds.observe(waited)
+        try:
+            return call()
+        except HttpError as e:
+            if attempt >= CALENDAR_MAX_RETRIES or not is_retryable(e, idempotent):
+                raise
+            delay = backoff_delay(attempt, e)
+            retries.inc(status=str(e.resp.status))
+            logging.info("Calendar %s failed with %s, retrying in %.2fs", what, e.resp.status, delay)
+            time.sleep(delay)
+            attempt += 1
+
+def execute(service: Resource, request, idempotent: bool = True):
+    """``request.execute()`` with the rate limit and retries of ``with_retries``."""
+    return with_retries(service, request.execute, idempotent, getattr(request, "methodId", None) or "request")
+
+# The Calendar API accepts at most 50 calls in one batch request
+BATCH_SIZE = 50
+
+def execute_batch(service: Resource, requests: list, idempotent: bool = True) -> list[tuple[Optional[dict], Optional[Exception]]]:
+    """Sends the requests in as few batch HTTP requests as possible.
+
+    Returns a (response, exception) pair per request, in order; one failing
+    call doesn't affect the others. Calls the API turned away with a rate
+    limit error were not applied, so they are sent again after a backoff."""
+    results = [(None, None)] * len(requests)
+
+    def callback(request_id, response, exception):
+        results[int(request_id)] = (response, exception)
+
+    # Every call in a batch counts against the quota, so a batch larger than
+    # the burst would partly be turned away
+    bucket = user_bucket(service)
+    batch_size = min(BATCH_SIZE, bucket.burst) if bucket.rate > 0 else BATCH_SIZE
+    pending = list(range(len(requests)))
+    attempt = 0
+    while True:
+        for offset in range(0, len(pending), batch_size):
+            chunk = pending[offset:offset + batch_size]
+            batch = service.new_batch_http_request(callback=callback)
+            for i in chunk:
+                batch.add(requests[i], request_id=str(i))
+            with_retries(service, batch.execute, idempotent, "batch", cost=len(chunk))
+        pending = [i for i in pending if isinstance(results[i][1], HttpError) and is_rate_limited(results[i][1])]
+        if not pending or attempt >= CALENDAR_MAX_RETRIES:
+            return results
+        retries.inc(len(pending), status=str(results[pending[0]][1].resp.status))
+        time.sleep(backoff_delay(attempt))
+        attempt += 1
+
+class Singleflight:
+    """Shares one in-flight call between concurrent callers asking for the same key.
+
+    The first caller starts the call; callers arriving before it finishes
+    await the same result (or exception). Nothing is kept once it is done,
+    so later callers always see fresh data."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, call: Callable[[], Awaitable]):
+        future = self._calls.get(key)
+        if future is None:
+            future = asyncio.ensure_future(call())
+            self._calls[key] = future
+            future.add_done_callback(lambda done: self._calls.pop(key, None) if self._calls.get(key) is done else None)
+        else:
+            coalesced.inc(function=key[0] if isinstance(key, tuple) else str(key))
+        # One caller giving up (a closed stream) must not cancel the call for the others
+        return await asyncio.shield(future)
+
+_flights: "weakref.WeakKeyDictionary[Resource, Singleflight]" = weakref.WeakKeyDictionary()
+
+def user_singleflight(service: Resource) -> Singleflight:
+    flight = _flights.get(service)
+    if flight is None:
+        flight = _flights.setdefault(service, Singleflight())
+    return flight
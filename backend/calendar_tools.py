@@ -1,83 +1,472 @@
+import asyncio
+import contextvars
 import datetime
+import functools
+import logging
+import os
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional
+from zoneinfo import ZoneInfo
+import numpy as np
 from googleapiclient.discovery import Resource
+from .event_store import EVENT_MIRROR_ENABLED, CompactEvent, get_event_mirror, iter_event_pages, peek_event_mirror, parse_time, is_busy
+from .metrics import timed_calendar_call
+from .calendar_client import execute, execute_batch, user_singleflight
 
-def get_availability(service: Resource, start: str, end: str) -> bool:
-    """Check if the time slot is available."""
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start,
-        timeMax=end,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    events = events_result.get('items', [])
-    return len(events) == 0
-
-def create_event(service: Resource, summary: str, start: str, end: str, attendees: Optional[List[str]] = None, description: str = "") -> dict:
+# Google API calls block on HTTP, so the async variants below run them on this
+# bounded pool rather than on the event loop. Each user (service) may only have
+# a few calls in flight at once so one busy user cannot starve the others.
+CALENDAR_MAX_WORKERS = int(os.getenv("CALENDAR_MAX_WORKERS", "32"))
+CALENDAR_PER_USER_CONCURRENCY = int(os.getenv("CALENDAR_PER_USER_CONCURRENCY", "4"))
+
+_executor = ThreadPoolExecutor(max_workers=CALENDAR_MAX_WORKERS, thread_name_prefix="calendar")
+_user_semaphores: "weakref.WeakKeyDictionary[Resource, asyncio.Semaphore]" = weakref.WeakKeyDictionary()
+
+# Timezone assumed when the user's calendar's can't be read
+DEFAULT_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Kolkata")
+
+# How long the list of a user's other calendars (and their calendar's
+# timezone) is reused before asking the API again
+CALENDAR_LIST_TTL = float(os.getenv("CALENDAR_LIST_TTL", "600"))
+_calendar_lists: "weakref.WeakKeyDictionary[Resource, tuple[float, list[str]]]" = weakref.WeakKeyDictionary()
+_timezones: "weakref.WeakKeyDictionary[Resource, tuple[float, str]]" = weakref.WeakKeyDictionary()
+
+# Events per events().list page when listing or searching the live calendar
+LIST_PAGE_SIZE = int(os.getenv("CALENDAR_LIST_PAGE_SIZE", "250"))
+
+async def run_blocking(service: Resource, func, *args, **kwargs):
+    """Runs ``func(service, *args, **kwargs)`` on the calendar executor, limited per user."""
+    semaphore = _user_semaphores.get(service)
+    if semaphore is None:
+        semaphore = _user_semaphores.setdefault(service, asyncio.Semaphore(CALENDAR_PER_USER_CONCURRENCY))
+    async with semaphore:
+        loop = asyncio.get_running_loop()
+        # Copy the context so context variables are visible inside the worker thread
+        call = functools.partial(contextvars.copy_context().run, func, service, *args, **kwargs)
+        return await loop.run_in_executor(_executor, call)
+
+def iter_events(service: Resource, limit: Optional[int] = None, page_size: int = LIST_PAGE_SIZE, **params):
+    """Yields events of the primary calendar across all result pages.
+
+    Pages are fetched only as the caller consumes them, so stopping early (or
+    passing ``limit``) never downloads the rest of a busy calendar."""
+    if limit is not None:
+        if limit <= 0:
+            return
+        page_size = min(page_size, limit)
+    count = 0
+    for page in iter_event_pages(service, page_size, **params):
+        for event in page.get('items', []):
+            yield event
+            count += 1
+            if count == limit:
+                return
+
+def _synced_mirror(service: Resource):
+    """Returns the user's event mirror after bringing it up to date."""
+    mirror = get_event_mirror(service)
+    mirror.sync(service)
+    return mirror
+
+def find_conflicts(service: Resource, start: str, end: str, timezone: Optional[str] = None) -> list:
+    """Busy events overlapping the time slot, ordered by start time. Times
+    without a UTC offset are local times in ``timezone`` (the user's if not given).
+
+    Events marked as free (transparent) and invitations the user declined
+    don't block time."""
+    tz = _local_zone(service, timezone, start, end)
+    window_start, window_end = parse_local_time(start, tz), parse_local_time(end, tz)
+    if EVENT_MIRROR_ENABLED:
+        return _synced_mirror(service).conflicts(window_start, window_end)
+    events = iter_events(service, timeMin=window_start.isoformat(), timeMax=window_end.isoformat(),
+                         singleEvents=True, orderBy='startTime')
+    return [event for event in events if is_busy(event)]
+
+def _secondary_calendar_ids(service: Resource) -> list[str]:
+    """The user's own calendars besides primary (the ones they can write to and show)."""
+    cached = _calendar_lists.get(service)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    calendar_ids = []
+    page_token = None
+    while True:
+        params = {'pageToken': page_token} if page_token else {}
+        result = execute(service, service.calendarList().list(minAccessRole='writer', **params))
+        calendar_ids += [
+            calendar['id'] for calendar in result.get('items', [])
+            if not calendar.get('primary') and calendar.get('selected')
+        ]
+        page_token = result.get('nextPageToken')
+        if not page_token:
+            break
+    _calendar_lists[service] = (time.monotonic() + CALENDAR_LIST_TTL, calendar_ids)
+    return calendar_ids
+
+def user_timezone(service: Resource) -> str:
+    """The timezone of the user's primary calendar, or DEFAULT_TIMEZONE if it can't be read."""
+    cached = _timezones.get(service)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    mirror = peek_event_mirror(service) if EVENT_MIRROR_ENABLED else None
+    if mirror is not None and mirror.timezone_name:
+        # Learned from the last sync, the same setting without another call
+        return mirror.timezone_name
+    try:
+        timezone = execute(service, service.calendars().get(calendarId='primary', fields='timeZone'))['timeZone']
+        ZoneInfo(timezone)
+    except Exception:
+        logging.warning("Could not read the calendar's timezone, using %s.", DEFAULT_TIMEZONE, exc_info=True)
+        timezone = DEFAULT_TIMEZONE
+    _timezones[service] = (time.monotonic() + CALENDAR_LIST_TTL, timezone)
+    return timezone
+
+def _has_offset(value: str) -> bool:
+    return datetime.datetime.fromisoformat(value.replace('Z', '+00:00')).tzinfo is not None
+
+def parse_local_time(value: str, tz: Optional[datetime.tzinfo]) -> datetime.datetime:
+    """Parses an ISO 8601 time; one without a UTC offset is a local time in ``tz``."""
+    parsed = datetime.datetime.fromisoformat(value.replace('Z', '+00:00'))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=tz or datetime.timezone.utc)
+    return parsed
+
+def _local_zone(service: Resource, timezone: Optional[str], *values: str) -> Optional[ZoneInfo]:
+    """The zone times without an offset are read in: ``timezone``, else the
+    user's calendar's; None (without looking it up) if every value has one."""
+    if all(_has_offset(value) for value in values):
+        return None
+    return ZoneInfo(timezone or user_timezone(service))
+
+def event_time(value: str, timezone: str) -> dict:
+    """An event's start or end: ``value`` with its UTC offset (read in
+    ``timezone`` if it has none) and ``timezone``, which Google shows it in."""
+    return {'dateTime': parse_local_time(value, ZoneInfo(timezone)).isoformat(), 'timeZone': timezone}
+
+def merge_intervals(intervals: list) -> list:
+    """Merges overlapping (start, end) intervals into a sorted, disjoint timeline."""
+    merged = []
+    for start, end in sorted(intervals):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+def query_free_busy(service: Resource, start: datetime.datetime, end: datetime.datetime,
+                    calendar_ids: list[str]) -> tuple[list, dict]:
+    """Busy intervals of several calendars from a single freeBusy request.
+
+    Returns the (start, end) datetimes of every busy block and, for calendars
+    that couldn't be read, the reason Google gave."""
+    result = execute(service, service.freebusy().query(body={
+        'timeMin': start.isoformat(),
+        'timeMax': end.isoformat(),
+        'items': [{'id': calendar_id} for calendar_id in calendar_ids],
+    }))
+    intervals, errors = [], {}
+    for calendar_id, calendar in result.get('calendars', {}).items():
+        if calendar.get('errors'):
+            errors[calendar_id] = calendar['errors'][0].get('reason', 'unknown')
+        for busy in calendar.get('busy', []):
+            intervals.append((parse_time(busy['start']), parse_time(busy['end'])))
+    return intervals, errors
+
+@timed_calendar_call
+def check_availability(service: Resource, start: str, end: str, attendees: Optional[List[str]] = None,
+                       timezone: Optional[str] = None) -> dict:
+    """Checks a time slot across the user's calendars and the attendees' calendars.
+    Times without a UTC offset are local times in ``timezone`` (the user's if not given).
+
+    Returns ``conflicts`` (busy events on the primary calendar, when the event
+    mirror is on), ``busy`` (the merged busy timeline over every calendar) and
+    ``errors`` (calendars whose availability couldn't be read). Everything
+    besides the mirrored primary calendar comes from one freeBusy request."""
+    tz = _local_zone(service, timezone, start, end)
+    window_start, window_end = parse_local_time(start, tz), parse_local_time(end, tz)
+    calendar_ids = _secondary_calendar_ids(service) + list(attendees or [])
+    conflicts, intervals, errors = [], [], {}
+    if EVENT_MIRROR_ENABLED:
+        conflicts = find_conflicts(service, window_start.isoformat(), window_end.isoformat())
+        intervals = get_event_mirror(service).busy_blocks(window_start, window_end)
+    else:
+        calendar_ids.insert(0, 'primary')
+    if calendar_ids:
+        busy, errors = query_free_busy(service, window_start, window_end, calendar_ids)
+        intervals += busy
+    busy = [(max(s, window_start), min(e, window_end)) for s, e in merge_intervals(intervals)]
+    return {'conflicts': conflicts, 'busy': busy, 'errors': errors}
+
+def _working_windows(start: datetime.datetime, end: datetime.datetime, tz: ZoneInfo, day_start: datetime.time,
+                     day_end: datetime.time, include_weekends: bool) -> list[tuple[float, float]]:
+    """Working-hour windows (as POSIX timestamps) of each local day between start and end."""
+    windows = []
+    day = start.astimezone(tz).date()
+    while day <= end.astimezone(tz).date():
+        if include_weekends or day.weekday() < 5:
+            window_start = datetime.datetime.combine(day, day_start, tzinfo=tz)
+            window_end = datetime.datetime.combine(day, day_end, tzinfo=tz)
+            window_start, window_end = max(window_start, start), min(window_end, end)
+            if window_start < window_end:
+                # Candidate slots start on the grid counted from the local start of the working day
+                windows.append((window_start.timestamp(), window_end.timestamp(),
+                                datetime.datetime.combine(day, day_start, tzinfo=tz).timestamp()))
+        day += datetime.timedelta(days=1)
+    return windows
+
+@timed_calendar_call
+def find_free_slots(service: Resource, duration_minutes: int, start: str, end: str, working_hours_start: str = "09:00",
+                    working_hours_end: str = "17:00", timezone: Optional[str] = None, attendees: Optional[List[str]] = None,
+                    include_weekends: bool = False, max_results: int = 5, step_minutes: int = 30) -> list:
+    """Finds the earliest free slots of ``duration_minutes`` between start and end.
+
+    Busy time comes from one ``check_availability`` call over the whole
+    horizon (so it covers attendees too). Candidate start times on a
+    ``step_minutes`` grid inside working hours are then checked against the
+    merged busy timeline all at once with NumPy. Returns up to
+    ``max_results`` non-overlapping (start, end) datetimes in ``timezone``
+    (the user's calendar's if not given), earliest first."""
+    tz = ZoneInfo(timezone or user_timezone(service))
+    horizon_start = max(parse_local_time(start, tz), datetime.datetime.now(datetime.timezone.utc))
+    horizon_end = parse_local_time(end, tz)
+    if horizon_start >= horizon_end:
+        return []
+    duration, step = duration_minutes * 60, step_minutes * 60
+
+    windows = _working_windows(
+        horizon_start, horizon_end, tz,
+        datetime.time.fromisoformat(working_hours_start), datetime.time.fromisoformat(working_hours_end),
+        include_weekends,
+    )
+    if not windows:
+        return []
+    candidates = np.concatenate([
+        np.arange(grid_start + np.ceil((window_start - grid_start) / step) * step, window_end - duration + 1, step)
+        for window_start, window_end, grid_start in windows
+    ])
+    if candidates.size == 0:
+        return []
+
+    busy = check_availability(service, horizon_start.isoformat(), horizon_end.isoformat(), attendees)['busy']
+    busy_starts = np.array([busy_start.timestamp() for busy_start, _ in busy])
+    busy_ends = np.array([busy_end.timestamp() for _, busy_end in busy])
+    # The first busy block ending after each candidate start must begin after the candidate ends
+    following = np.searchsorted(busy_ends, candidates, side='right')
+    next_busy_start = np.append(busy_starts, np.inf)[following]
+    free = candidates[next_busy_start >= candidates + duration]
+
+    slots, last_end = [], -np.inf
+    for slot_start in free:
+        if slot_start >= last_end:
+            slots.append((
+                datetime.datetime.fromtimestamp(slot_start, tz),
+                datetime.datetime.fromtimestamp(slot_start + duration, tz),
+            ))
+            last_end = slot_start + duration
+            if len(slots) == max_results:
+                break
+    return slots
+
+def _event_body(summary: str, start: str, end: str, attendees: Optional[List[str]] = None, description: str = "",
+                timezone: str = DEFAULT_TIMEZONE) -> dict:
     event = {
         'summary': summary,
         'description': description,
-        'start': {'dateTime': start, 'timeZone': 'UTC'},
-        'end': {'dateTime': end, 'timeZone': 'UTC'},
+        'start': event_time(start, timezone),
+        'end': event_time(end, timezone),
     }
     if attendees:
         event['attendees'] = [{'email': email} for email in attendees]
-    created_event = service.events().insert(calendarId='primary', body=event).execute()
+    return event
+
+@timed_calendar_call
+def create_event(service: Resource, summary: str, start: str, end: str, attendees: Optional[List[str]] = None, description: str = "",
+                 timezone: Optional[str] = None) -> dict:
+    """Creates an event on the primary calendar. Times without a UTC offset
+    are local times in ``timezone`` (the user's calendar's if not given)."""
+    event = _event_body(summary, start, end, attendees, description, timezone or user_timezone(service))
+    created_event = execute(service, service.events().insert(calendarId='primary', body=event), idempotent=False)
+    if mirror := peek_event_mirror(service):
+        mirror.apply(created_event)
     return created_event
 
+@timed_calendar_call
 def update_event(service: Resource, event_id: str, new_values: dict) -> dict:
-    event = service.events().get(calendarId='primary', eventId=event_id).execute()
-    event.update(new_values)
-    updated_event = service.events().update(calendarId='primary', eventId=event_id, body=event).execute()
+    """Patches an event; new start and end times are built with ``event_time``."""
+    # patch only sends the changed fields, so there's no need to read the event first
+    updated_event = execute(service, service.events().patch(calendarId='primary', eventId=event_id, body=new_values))
+    if mirror := peek_event_mirror(service):
+        mirror.apply(updated_event)
     return updated_event
 
+@timed_calendar_call
 def delete_event(service, event_id):
     """Deletes an event from the primary calendar."""
     try:
-        service.events().delete(calendarId='primary', eventId=event_id).execute()
+        execute(service, service.events().delete(calendarId='primary', eventId=event_id))
+        if mirror := peek_event_mirror(service):
+            mirror.remove(event_id)
         return f"Event with ID {event_id} deleted successfully."
     except Exception as e:
         return f"An error occurred: {e}"
 
+@timed_calendar_call
+def bulk_create_events(service: Resource, events: list[dict], timezone: Optional[str] = None) -> list[dict]:
+    """Creates several events in batch requests.
+
+    ``events`` holds ``create_event`` keyword arguments, with times read as in
+    ``create_event``. Returns one ``{'summary', 'ok', 'event' | 'error'}``
+    result per event, in order."""
+    timezone = timezone or user_timezone(service)
+    requests = [service.events().insert(calendarId='primary', body=_event_body(**event, timezone=timezone)) for event in events]
+    results = []
+    mirror = peek_event_mirror(service)
+    for event, (response, exception) in zip(events, execute_batch(service, requests, idempotent=False)):
+        if exception is not None:
+            results.append({'summary': event['summary'], 'ok': False, 'error': str(exception)})
+            continue
+        if mirror:
+            mirror.apply(response)
+        results.append({'summary': event['summary'], 'ok': True, 'event': response})
+    return results
+
+@timed_calendar_call
+def bulk_update_events(service: Resource, updates: list[tuple[str, dict]]) -> list[dict]:
+    """Patches several events in batch requests; ``updates`` holds (event_id, new_values) pairs."""
+    requests = [service.events().patch(calendarId='primary', eventId=event_id, body=new_values) for event_id, new_values in updates]
+    results = []
+    mirror = peek_event_mirror(service)
+    for (event_id, _), (response, exception) in zip(updates, execute_batch(service, requests)):
+        if exception is not None:
+            results.append({'id': event_id, 'ok': False, 'error': str(exception)})
+            continue
+        if mirror:
+            mirror.apply(response)
+        results.append({'id': event_id, 'ok': True, 'event': response})
+    return results
+
+@timed_calendar_call
+def bulk_delete_events(service: Resource, event_ids: list[str]) -> list[dict]:
+    """Deletes several events in batch requests, reporting the outcome per event."""
+    requests = [service.events().delete(calendarId='primary', eventId=event_id) for event_id in event_ids]
+    results = []
+    mirror = peek_event_mirror(service)
+    for event_id, (_, exception) in zip(event_ids, execute_batch(service, requests)):
+        if exception is not None:
+            results.append({'id': event_id, 'ok': False, 'error': str(exception)})
+            continue
+        if mirror:
+            mirror.remove(event_id)
+        results.append({'id': event_id, 'ok': True})
+    return results
+
+def _format_search_results(query: str, matches: list[tuple[Optional[str], int, dict]]) -> str:
+    """``matches`` are (series id or None, occurrences, event) triples. A
+    recurring series is one line with the series id, which changes or deletes
+    every occurrence, and the id of the occurrence shown."""
+    if not matches:
+        return f"No events found matching query: '{query}'"
+    lines = ["id | start | end | summary"]
+    for series_id, occurrences, event in matches:
+        compact = CompactEvent.from_api(event)
+        if series_id is None:
+            lines.append(compact.to_line())
+            continue
+        occurrence_id, compact.id = compact.id, series_id
+        lines.append(f"{compact.to_line()} | recurring, {occurrences} occurrences; this one is {occurrence_id}")
+    return "\n".join(lines)
+
+def _collapse_series(events: list[dict]) -> list[tuple[Optional[str], int, dict]]:
+    """Groups API results by recurring series, keeping the first occurrence of each."""
+    groups: dict[str, list] = {}
+    for event in events:
+        groups.setdefault(event.get('recurringEventId') or event['id'], []).append(event)
+    return [(key if first.get('recurringEventId') else None, len(group), first)
+            for key, group in groups.items() for first in group[:1]]
+
+@timed_calendar_call
 def search_events(service, query: str, max_results: int = 10):
-    """Searches for events matching the query."""
-    now = datetime.datetime.utcnow().isoformat() + 'Z'
+    """Searches for events matching the query. With the event mirror, past and
+    future events within the search horizon are looked up locally, with
+    prefix and typo-tolerant matching on titles, attendees, location and
+    description; otherwise upcoming events are searched through the API."""
+    now = datetime.datetime.now(datetime.timezone.utc)
     try:
-        events_result = service.events().list(
-            calendarId='primary',
-            q=query,
-            timeMin=now,
-            maxResults=max_results,
-            singleEvents=True,
-            orderBy='startTime'
-        ).execute()
-        events = events_result.get('items', [])
-        if not events:
-            return f"No upcoming events found matching query: '{query}'"
-        
-        event_list = []
-        for event in events:
-            start = event['start'].get('dateTime', event['start'].get('date'))
-            event_list.append(f"ID: {event['id']}, Summary: {event['summary']}, Start: {start}")
-        return "\n".join(event_list)
+        if EVENT_MIRROR_ENABLED:
+            hits = _synced_mirror(service).search(query, now, max_results)
+            matches = []
+            for hit in hits:
+                event = hit.next_instance(now.timestamp())[2]
+                series = event.get('recurringEventId')
+                matches.append((series, len(hit.instances), event))
+            return _format_search_results(query, matches)
+        events = iter_events(service, limit=max_results, q=query, timeMin=now.isoformat(), singleEvents=True, orderBy='startTime')
+        return _format_search_results(query, _collapse_series(list(events)))
     except Exception as e:
         return f"An error occurred while searching for events: {e}"
 
-def list_events(service: Resource, start_time_str: str, end_time_str: str):
-    """Lists events from the primary calendar within the specified time range."""
-    # Ensure timestamps are in RFC3339 format (what Google API expects)
-    # Add 'Z' for UTC if no timezone is specified.
-    if 'Z' not in start_time_str and '+' not in start_time_str and '-' not in start_time_str[10:]:
-        start_time_str += 'Z'
-    if 'Z' not in end_time_str and '+' not in end_time_str and '-' not in end_time_str[10:]:
-        end_time_str += 'Z'
-
-    events_result = service.events().list(
-        calendarId='primary',
-        timeMin=start_time_str,
-        timeMax=end_time_str,
-        singleEvents=True,
-        orderBy='startTime'
-    ).execute()
-    return events_result.get('items', [])
+@timed_calendar_call
+def list_events(service: Resource, start_time_str: str, end_time_str: str, max_results: Optional[int] = None,
+                timezone: Optional[str] = None):
+    """Lists events from the primary calendar within the specified time range,
+    stopping after ``max_results`` events if given. Times without a UTC offset
+    are local times in ``timezone`` (the user's calendar's if not given)."""
+    tz = _local_zone(service, timezone, start_time_str, end_time_str)
+    start, end = parse_local_time(start_time_str, tz), parse_local_time(end_time_str, tz)
+
+    if EVENT_MIRROR_ENABLED:
+        return _synced_mirror(service).between(start, end)[:max_results]
+
+    # RFC 3339 with an offset, as the API expects
+    events = iter_events(service, limit=max_results, timeMin=start.isoformat(), timeMax=end.isoformat(),
+                         singleEvents=True, orderBy='startTime')
+    return list(events)
+
+# Async variants of the tools above, run on the bounded calendar executor
+async def auser_timezone(service: Resource) -> str:
+    cached = _timezones.get(service)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+    return await run_blocking(service, user_timezone)
+
+async def acheck_availability(service: Resource, start: str, end: str, attendees: Optional[List[str]] = None,
+                             timezone: Optional[str] = None) -> dict:
+    return await run_blocking(service, check_availability, start, end, attendees, timezone)
+
+async def afind_free_slots(service: Resource, duration_minutes: int, start: str, end: str, **kwargs) -> list:
+    return await run_blocking(service, find_free_slots, duration_minutes, start, end, **kwargs)
+
+async def acreate_event(service: Resource, summary: str, start: str, end: str, attendees: Optional[List[str]] = None, description: str = "",
+                        timezone: Optional[str] = None) -> dict:
+    return await run_blocking(service, create_event, summary, start, end, attendees, description, timezone)
+
+async def aupdate_event(service: Resource, event_id: str, new_values: dict) -> dict:
+    return await run_blocking(service, update_event, event_id, new_values)
+
+async def adelete_event(service, event_id):
+    return await run_blocking(service, delete_event, event_id)
+
+async def abulk_create_events(service: Resource, events: list[dict], timezone: Optional[str] = None) -> list[dict]:
+    return await run_blocking(service, bulk_create_events, events, timezone)
+
+async def abulk_update_events(service: Resource, updates: list[tuple[str, dict]]) -> list[dict]:
+    return await run_blocking(service, bulk_update_events, updates)
+
+async def abulk_delete_events(service: Resource, event_ids: list[str]) -> list[dict]:
+    return await run_blocking(service, bulk_delete_events, event_ids)
+
+# Identical reads already in flight for the same user share their result
+async def asearch_events(service, query: str, max_results: int = 10):
+    return await user_singleflight(service).do(
+        ("search_events", query, max_results),
+        lambda: run_blocking(service, search_events, query, max_results),
+    )
+
+async def alist_events(service: Resource, start_time_str: str, end_time_str: str, max_results: Optional[int] = None,
+                       timezone: Optional[str] = None):
+    events = await user_singleflight(service).do(
+        ("list_events", start_time_str, end_time_str, max_results, timezone),
+        lambda: run_blocking(service, list_events, start_time_str, end_time_str, max_results, timezone),
+    )
+    return list(events)
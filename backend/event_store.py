@@ -0,0 +1,429 @@
+import datetime
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import weakref
+from dataclasses import dataclass
+from typing import Callable, Optional
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from googleapiclient.discovery import Resource
+from googleapiclient.errors import HttpError
+from .intervals import IntervalIndex
+from .search_index import SearchHit, SearchIndex
+from .calendar_client import execute
+
+# A local copy of each user's primary calendar, filled by one full sync and then
+# kept current with incremental `events.list(syncToken=...)` calls. Reads are
+# answered from memory; a sync runs first if the mirror is older than
+# EVENT_MIRROR_MAX_STALENESS seconds. Set EVENT_MIRROR_SQLITE_PATH to keep the
+# mirror (and its sync token) on disk across restarts.
+EVENT_MIRROR_ENABLED = os.getenv("EVENT_MIRROR", "true").lower() in ("1", "true", "yes")
+EVENT_MIRROR_MAX_STALENESS = float(os.getenv("EVENT_MIRROR_MAX_STALENESS", "30"))
+EVENT_MIRROR_SQLITE_PATH = os.getenv("EVENT_MIRROR_SQLITE_PATH")
+SYNC_PAGE_SIZE = 2500
+
+# search_events looks names up in a word index over the mirrored events from
+# SEARCH_PAST_DAYS ago to SEARCH_FUTURE_DAYS ahead. It is filled in bulk on
+# first use, kept current as the mirror changes, and rebuilt in the
+# background every SEARCH_INDEX_REFRESH seconds so the horizon moves along.
+SEARCH_PAST_DAYS = float(os.getenv("SEARCH_PAST_DAYS", "90"))
+SEARCH_FUTURE_DAYS = float(os.getenv("SEARCH_FUTURE_DAYS", "365"))
+SEARCH_INDEX_REFRESH = float(os.getenv("SEARCH_INDEX_REFRESH", "3600"))
+
+# Only the event fields the tools use; the rest of the resource (etag, creator,
+# organizer, reminders, conferenceData, ...) is never downloaded.
+EVENT_FIELDS = (
+    "id,status,summary,description,location,start,end,transparency,recurringEventId,htmlLink,"
+    "attendees(email,displayName,self,responseStatus)"
+)
+LIST_FIELDS = f"nextPageToken,nextSyncToken,timeZone,items({EVENT_FIELDS})"
+
+def parse_time(value: str) -> datetime.datetime:
+    """Parses an RFC 3339 timestamp or a date into an aware datetime (UTC if no offset)."""
+    value = value.replace('Z', '+00:00')
+    parsed = datetime.datetime.fromisoformat(value)
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=datetime.timezone.utc)
+    return parsed
+
+def _bound(value: dict, tz: datetime.tzinfo) -> datetime.datetime:
+    if 'dateTime' in value:
+        return parse_time(value['dateTime'])
+    return datetime.datetime.combine(datetime.date.fromisoformat(value['date']), datetime.time(), tzinfo=tz)
+
+def event_bounds(event: dict, tz: datetime.tzinfo = datetime.timezone.utc) -> tuple[datetime.datetime, datetime.datetime]:
+    """Returns the (start, end) of an event. All-day events span whole days
+    from midnight in ``tz``, which should be the calendar's timezone."""
+    return _bound(event['start'], tz), _bound(event['end'], tz)
+
+def iter_event_pages(service: Resource, page_size: int = SYNC_PAGE_SIZE, **params):
+    """Yields pages of ``events().list`` on the primary calendar, requesting
+    the next page only when the caller asks for it."""
+    page_token = None
+    while True:
+        if page_token:
+            params['pageToken'] = page_token
+        page = execute(service, service.events().list(calendarId='primary', maxResults=page_size, fields=LIST_FIELDS, **params))
+        yield page
+        page_token = page.get('nextPageToken')
+        if not page_token:
+            return
+
+def is_busy(event: dict) -> bool:
+    """Whether an event blocks time: not cancelled, not marked free, not declined."""
+    if event.get('status') == 'cancelled' or event.get('transparency') == 'transparent':
+        return False
+    for attendee in event.get('attendees', []):
+        if attendee.get('self') and attendee.get('responseStatus') == 'declined':
+            return False
+    return True
+
+@dataclass(slots=True)
+class CompactEvent:
+    """The few fields of an event the agent needs, serialized as one short line."""
+    id: str
+    summary: str
+    start: str
+    end: str
+    location: str = ""
+    busy: bool = True
+
+    @classmethod
+    def from_api(cls, event: dict) -> "CompactEvent":
+        return cls(
+            id=event['id'],
+            summary=event.get('summary', '(no title)'),
+            start=event['start'].get('dateTime', event['start'].get('date')),
+            end=event['end'].get('dateTime', event['end'].get('date')),
+            location=event.get('location', ''),
+            busy=is_busy(event),
+        )
+
+    def to_line(self) -> str:
+        line = f"{self.id} | {self.start} | {self.end} | {self.summary}"
+        if self.location:
+            line += f" | at {self.location}"
+        if not self.busy:
+            line += " | free"
+        return line
+
+def compact_events(events: list[dict]) -> str:
+    """Serializes events as ``id | start | end | summary`` lines under a header."""
+    return "\n".join(["id | start | end | summary"] + [CompactEvent.from_api(event).to_line() for event in events])
+
+def build_index(events: list[dict], busy_only: bool = False, tz: datetime.tzinfo = datetime.timezone.utc) -> IntervalIndex:
+    """Indexes events by their (start, end) as POSIX timestamps."""
+    intervals = []
+    for event in events:
+        if busy_only and not is_busy(event):
+            continue
+        start, end = event_bounds(event, tz)
+        intervals.append((start.timestamp(), end.timestamp(), event))
+    return IntervalIndex(intervals)
+
+def search_fields(event: dict) -> list[tuple[str, float]]:
+    """The text an event is found by, as (text, weight): the title counts most,
+    then the other attendees' names, then location and description."""
+    fields = [(event.get('summary', ''), 3.0), (event.get('location', ''), 1.0), (event.get('description', ''), 1.0)]
+    for attendee in event.get('attendees', []):
+        if not attendee.get('self'):
+            fields.append((f"{attendee.get('displayName', '')} {attendee.get('email', '').split('@')[0]}", 2.0))
+    return fields
+
+def search_window(now: Optional[datetime.datetime] = None) -> tuple[float, float]:
+    now = now or datetime.datetime.now(datetime.timezone.utc)
+    return ((now - datetime.timedelta(days=SEARCH_PAST_DAYS)).timestamp(),
+            (now + datetime.timedelta(days=SEARCH_FUTURE_DAYS)).timestamp())
+
+def index_for_search(index: SearchIndex, event: dict, window: tuple[float, float], tz: datetime.tzinfo = datetime.timezone.utc):
+    """Adds the event to the index, grouped with its recurring series, or
+    drops it if it lies outside the window."""
+    start, end = event_bounds(event, tz)
+    start, end = start.timestamp(), end.timestamp()
+    if end > window[0] and start < window[1]:
+        index.add(event['id'], event.get('recurringEventId') or event['id'], start, end, search_fields(event), event)
+    else:
+        index.discard(event['id'])
+
+def build_search_index(events: list[dict], window: tuple[float, float], tz: datetime.tzinfo = datetime.timezone.utc) -> SearchIndex:
+    index = SearchIndex()
+    for event in events:
+        index_for_search(index, event, window, tz)
+    return index
+
+class SQLiteEventStore:
+    """Keeps mirrored events and sync tokens in a SQLite file, one row per event."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS events (calendar TEXT, id TEXT, body TEXT, PRIMARY KEY (calendar, id))")
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sync_state (calendar TEXT PRIMARY KEY, sync_token TEXT)")
+
+    def load(self, calendar: str) -> tuple[Optional[str], dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT sync_token FROM sync_state WHERE calendar = ?", (calendar,)).fetchone()
+            rows = self._conn.execute("SELECT id, body FROM events WHERE calendar = ?", (calendar,)).fetchall()
+        return (row[0] if row else None), {event_id: json.loads(body) for event_id, body in rows}
+
+    def save(self, calendar: str, sync_token: Optional[str], changed: list[dict], removed: list[str], replace: bool = False):
+        with self._lock, self._conn:
+            if replace:
+                self._conn.execute("DELETE FROM events WHERE calendar = ?", (calendar,))
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO events (calendar, id, body) VALUES (?, ?, ?)",
+                [(calendar, event['id'], json.dumps(event)) for event in changed],
+            )
+            self._conn.executemany("DELETE FROM events WHERE calendar = ? AND id = ?", [(calendar, event_id) for event_id in removed])
+            if sync_token:
+                self._conn.execute("INSERT OR REPLACE INTO sync_state (calendar, sync_token) VALUES (?, ?)", (calendar, sync_token))
+
+class EventMirror:
+    """In-memory mirror of one user's primary calendar.
+
+    The mirror never holds on to the service; it is passed in to ``sync`` so
+    the mirror goes away together with the user's cached service.
+    """
+
+    def __init__(self, store: Optional[SQLiteEventStore] = None):
+        self.events: dict[str, dict] = {}
+        self.sync_token: Optional[str] = None
+        self.last_sync = 0.0
+        # The calendar's timezone, where all-day events start and end; every
+        # events().list page names it
+        self.timezone: datetime.tzinfo = datetime.timezone.utc
+        self.timezone_name: Optional[str] = None
+        # Set by push.py while a watch channel reports the calendar's changes:
+        # returns how many notifications any worker has received for it, or
+        # None once there is no channel. As long as that count hasn't moved
+        # since the last sync, reads trust the mirror for max_staleness
+        # instead of EVENT_MIRROR_MAX_STALENESS; once it moves they sync
+        self.notifications: Optional[Callable[[], Optional[int]]] = None
+        self.max_staleness: Optional[float] = None
+        self._notifications_seen: Optional[int] = None
+        # Bumped on every change, so derived structures know when to rebuild
+        self.version = 0
+        self.lock = threading.RLock()
+        self._store = store
+        self._calendar: Optional[str] = None
+        self._indexes: dict[bool, tuple[int, IntervalIndex]] = {}
+        self._search: Optional[SearchIndex] = None
+        self._search_window = (0.0, 0.0)
+        self._search_built = 0.0
+        self._search_refreshing = False
+
+    def sync(self, service: Resource, force: bool = False):
+        """Brings the mirror up to date, unless it was synced recently."""
+        with self.lock:
+            # Read before syncing, so a notification arriving meanwhile still counts
+            notified = self.notifications() if self.notifications is not None else None
+            if notified is None or self.max_staleness is None:
+                max_staleness = EVENT_MIRROR_MAX_STALENESS
+            else:
+                max_staleness = self.max_staleness if notified == self._notifications_seen else 0.0
+            if not force and self.sync_token and time.monotonic() - self.last_sync < max_staleness:
+                return
+            if self._store and self._calendar is None:
+                self._calendar = execute(service, service.calendars().get(calendarId='primary'))['id']
+                self.sync_token, self.events = self._store.load(self._calendar)
+                self.version += 1
+            if self.sync_token is None:
+                self._full_sync(service)
+            else:
+                try:
+                    self._incremental_sync(service)
+                except HttpError as e:
+                    if e.resp.status != 410:
+                        raise
+                    # The sync token expired, start over
+                    logging.info("Sync token is no longer valid, doing a full sync.")
+                    self._full_sync(service)
+            self.last_sync = time.monotonic()
+            self._notifications_seen = notified
+
+    def _full_sync(self, service: Resource):
+        events, sync_token = {}, None
+        for page in iter_event_pages(service, singleEvents=True):
+            for event in page.get('items', []):
+                if event.get('status') != 'cancelled':
+                    events[event['id']] = event
+            sync_token = page.get('nextSyncToken', sync_token)
+            self._set_timezone(page.get('timeZone'))
+        self.events, self.sync_token = events, sync_token
+        self.version += 1
+        if self._search is not None:
+            self._refresh_search()
+        if self._store:
+            self._store.save(self._calendar, sync_token, list(events.values()), [], replace=True)
+
+    def _incremental_sync(self, service: Resource):
+        changed, removed, sync_token = {}, set(), self.sync_token
+        for page in iter_event_pages(service, singleEvents=True, syncToken=self.sync_token, showDeleted=True):
+            for event in page.get('items', []):
+                if event.get('status') == 'cancelled':
+                    changed.pop(event['id'], None)
+                    removed.add(event['id'])
+                else:
+                    changed[event['id']] = event
+                    removed.discard(event['id'])
+            sync_token = page.get('nextSyncToken', sync_token)
+            self._set_timezone(page.get('timeZone'))
+        for event_id in removed:
+            self.events.pop(event_id, None)
+            self._unindex(event_id)
+        self.events.update(changed)
+        for event in changed.values():
+            self._index(event)
+        self.sync_token = sync_token
+        if changed or removed:
+            self.version += 1
+        if self._store:
+            self._store.save(self._calendar, sync_token, list(changed.values()), list(removed))
+
+    def _set_timezone(self, name: Optional[str]):
+        """Adopts the calendar's timezone; a change moves every all-day event."""
+        if not name or name == self.timezone_name:
+            return
+        try:
+            self.timezone = ZoneInfo(name)
+        except (ZoneInfoNotFoundError, ValueError):
+            logging.warning("Unknown calendar timezone %r, all-day events stay in %s.", name, self.timezone)
+            return
+        self.timezone_name = name
+        self.version += 1
+        if self._search is not None:
+            self._refresh_search()
+
+    def bounds(self, event: dict) -> tuple[datetime.datetime, datetime.datetime]:
+        """``event_bounds`` in the calendar's timezone."""
+        return event_bounds(event, self.timezone)
+
+    def apply(self, event: dict):
+        """Records an event we just created or updated, without waiting for a sync."""
+        with self.lock:
+            if event.get('status') == 'cancelled':
+                return self.remove(event['id'])
+            if 'recurrence' in event:
+                # A whole series changed; the mirror holds its instances, which
+                # the next read fetches
+                self.last_sync = 0.0
+                return
+            self.events[event['id']] = event
+            self.version += 1
+            self._index(event)
+            if self._store and self._calendar:
+                self._store.save(self._calendar, None, [event], [])
+
+    def remove(self, event_id: str):
+        """Drops an event (or every instance of a recurring series) we just
+        deleted, without waiting for a sync."""
+        with self.lock:
+            if event_id in self.events:
+                removed = [event_id]
+            else:
+                # A recurring series, known only through its instances
+                removed = [other['id'] for other in self.events.values() if other.get('recurringEventId') == event_id]
+            if not removed:
+                return
+            for removed_id in removed:
+                del self.events[removed_id]
+            self.version += 1
+            self._unindex(event_id)
+            if self._store and self._calendar:
+                self._store.save(self._calendar, None, [], removed)
+
+    def _index(self, event: dict):
+        if self._search is not None:
+            index_for_search(self._search, event, self._search_window, self.timezone)
+
+    def _unindex(self, event_id: str):
+        if self._search is not None:
+            self._search.discard(event_id)
+            self._search.discard_group(event_id)
+
+    def search_index(self) -> SearchIndex:
+        """The word index over the mirrored events, filled on first use. Once
+        it is due for a refresh, the current one keeps answering while a new
+        one is built in the background."""
+        with self.lock:
+            if self._search is None:
+                self._search_window = search_window()
+                self._search = build_search_index(list(self.events.values()), self._search_window, self.timezone)
+                self._search_built = time.monotonic()
+            elif time.monotonic() - self._search_built > SEARCH_INDEX_REFRESH:
+                self._refresh_search()
+            return self._search
+
+    def _refresh_search(self):
+        if self._search_refreshing:
+            return
+        self._search_refreshing = True
+        threading.Thread(target=self._rebuild_search, name="search-index", daemon=True).start()
+
+    def _rebuild_search(self):
+        try:
+            while True:
+                with self.lock:
+                    version, events, tz = self.version, list(self.events.values()), self.timezone
+                window = search_window()
+                index = build_search_index(events, window, tz)
+                with self.lock:
+                    # Changes made meanwhile went into the old index only
+                    if self.version == version:
+                        self._search, self._search_window = index, window
+                        self._search_built = time.monotonic()
+                        return
+        except Exception:
+            logging.exception("Rebuilding the search index failed.")
+        finally:
+            self._search_refreshing = False
+
+    def index(self, busy_only: bool = False) -> IntervalIndex:
+        """Interval index over the mirrored events, rebuilt only after changes."""
+        with self.lock:
+            cached = self._indexes.get(busy_only)
+            if cached is None or cached[0] != self.version:
+                cached = self._indexes[busy_only] = (self.version, build_index(list(self.events.values()), busy_only, self.timezone))
+            return cached[1]
+
+    def between(self, start: datetime.datetime, end: datetime.datetime) -> list[dict]:
+        """Events overlapping [start, end), ordered by start time."""
+        return self.index().payloads_overlapping(start.timestamp(), end.timestamp())
+
+    def conflicts(self, start: datetime.datetime, end: datetime.datetime) -> list[dict]:
+        """Busy events overlapping [start, end), ordered by start time."""
+        return self.index(busy_only=True).payloads_overlapping(start.timestamp(), end.timestamp())
+
+    def busy_blocks(self, start: datetime.datetime, end: datetime.datetime) -> list[tuple[datetime.datetime, datetime.datetime]]:
+        """Merged busy time inside [start, end), clipped to it, in start's timezone."""
+        blocks = self.index(busy_only=True).busy_blocks(start.timestamp(), end.timestamp())
+        return [(datetime.datetime.fromtimestamp(s, start.tzinfo), datetime.datetime.fromtimestamp(e, start.tzinfo))
+                for s, e in blocks]
+
+    def search(self, query: str, now: datetime.datetime, max_results: int = 10) -> list[SearchHit]:
+        """Events and recurring series matching the query by title, attendee,
+        location or description, best match first."""
+        index = self.search_index()
+        with self.lock:
+            return index.search(query, now.timestamp(), max_results)
+
+_store = SQLiteEventStore(EVENT_MIRROR_SQLITE_PATH) if EVENT_MIRROR_SQLITE_PATH else None
+_mirrors: "weakref.WeakKeyDictionary[Resource, EventMirror]" = weakref.WeakKeyDictionary()
+_mirrors_lock = threading.Lock()
+
+def get_event_mirror(service: Resource) -> EventMirror:
+    """Returns the user's mirror, creating an empty one on first use."""
+    with _mirrors_lock:
+        mirror = _mirrors.get(service)
+        if mirror is None:
+            mirror = _mirrors[service] = EventMirror(_store)
+        return mirror
+
+def peek_event_mirror(service: Resource) -> Optional[EventMirror]:
+    """Returns the user's mirror if one exists, without creating it."""
+    with _mirrors_lock:
+        return _mirrors.get(service)
@@ -0,0 +1,176 @@
+import datetime
+import logging
+import os
+import re
+import threading
+from collections import Counter
+from dataclasses import dataclass
+from typing import Optional
+from zoneinfo import ZoneInfo
+from googleapiclient.discovery import Resource
+from .calendar_tools import DEFAULT_TIMEZONE, alist_events
+from .event_store import event_bounds, is_busy
+
+# Answers the most common simple questions ("what time is it", "what's on
+# today", "show my events next week") without the language model. The whole
+# message has to match one of the patterns below; anything else, including a
+# simple question with extra instructions attached, goes to the agent.
+FAST_PATH_ENABLED = os.getenv("FAST_PATH", "true").lower() in ("1", "true", "yes")
+FAST_PATH_MAX_EVENTS = int(os.getenv("FAST_PATH_MAX_EVENTS", "25"))
+
+_POLITE = r"(?:(?:hey|hi|ok|okay)[,!]?\s+)?(?:(?:please|pls|can you|could you)\s+)?"
+_END = r"(?:\s+please)?\s*[?.!]*"
+_DAY = r"(?P<day>today|tonight|tomorrow|yesterday|this week|next week)"
+# Where "tonight" starts, unless it's later already
+EVENING_STARTS = datetime.time(17)
+
+_TIME_PATTERNS = [
+    re.compile(_POLITE + r"(?:tell me\s+)?(?:what(?:'s|\s+is)\s+the\s+(?:current\s+)?time(?:\s+now)?|what\s+time\s+is\s+it(?:\s+now)?|current\s+time)" + _END),
+]
+_DATE_PATTERNS = [
+    re.compile(_POLITE + r"(?:tell me\s+)?(?:what(?:'s|\s+is)\s+(?:the\s+)?(?:date|day)(?:\s+today)?|what\s+(?:day|date)\s+is\s+(?:it|today)(?:\s+today)?|(?:what(?:'s|\s+is)\s+)?today'?s\s+date)" + _END),
+]
+_AGENDA_PATTERNS = [
+    re.compile(_POLITE + r"(?:list|show|show me|get|give me|tell me)\s+(?:all\s+)?(?:of\s+)?(?:my\s+)?(?:events|meetings|schedule|agenda|calendar)(?:\s+(?:for|on))?\s+" + _DAY + _END),
+    re.compile(_POLITE + r"what(?:'s|\s+is|\s+do\s+i\s+have)\s+(?:on\s+)?(?:my\s+)?(?:calendar\s+|schedule\s+|agenda\s+)?(?:for\s+|on\s+)?" + _DAY + _END),
+    re.compile(_POLITE + r"(?:what\s+are\s+)?my\s+(?:events|meetings|schedule|agenda|plans)(?:\s+(?:for|on))?\s+" + _DAY + _END),
+    re.compile(_POLITE + r"(?:do\s+i\s+have\s+)?any\s+(?:events|meetings)\s+" + _DAY + _END),
+    re.compile(_POLITE + r"do\s+i\s+have\s+(?:any(?:thing)?\s+)?(?:events\s+|meetings\s+)?" + _DAY + _END),
+]
+
+@dataclass
+class Intent:
+    """A recognized request: ``name`` is "time", "date" or "agenda"."""
+    name: str
+    day: Optional[str] = None
+
+def _normalize(message: str) -> str:
+    return " ".join(message.lower().replace("’", "'").split())
+
+def match_intent(message: str) -> Optional[Intent]:
+    """The intent of a simple message, or None if the agent should handle it."""
+    text = _normalize(message)
+    for pattern in _TIME_PATTERNS:
+        if pattern.fullmatch(text):
+            return Intent("time")
+    for pattern in _DATE_PATTERNS:
+        if pattern.fullmatch(text):
+            return Intent("date")
+    for pattern in _AGENDA_PATTERNS:
+        match = pattern.fullmatch(text)
+        if match:
+            return Intent("agenda", match.group("day"))
+    return None
+
+def day_range(day: str, now: datetime.datetime) -> tuple[datetime.datetime, datetime.datetime, str]:
+    """Start, end and a label for a relative day, in the timezone of ``now``."""
+    today = datetime.datetime.combine(now.date(), datetime.time(), tzinfo=now.tzinfo)
+    one_day = datetime.timedelta(days=1)
+    if day == "today":
+        return today, today + one_day, f"today ({now:%a %d %b})"
+    if day == "tonight":
+        evening = datetime.datetime.combine(now.date(), EVENING_STARTS, tzinfo=now.tzinfo)
+        return max(now, evening), today + one_day, f"tonight ({now:%a %d %b})"
+    if day == "tomorrow":
+        return today + one_day, today + 2 * one_day, f"tomorrow ({today + one_day:%a %d %b})"
+    if day == "yesterday":
+        return today - one_day, today, f"yesterday ({today - one_day:%a %d %b})"
+    monday = today - now.weekday() * one_day
+    if day == "next week":
+        monday += 7 * one_day
+    label = f"{day} ({monday:%d %b} - {monday + 6 * one_day:%d %b})"
+    return monday, monday + 7 * one_day, label
+
+def _format_event(event: dict, tz: ZoneInfo, multi_day: bool) -> str:
+    summary = event.get('summary', '(no title)')
+    if 'date' in event['start']:
+        when = "All day"
+        if multi_day:
+            when = f"{datetime.date.fromisoformat(event['start']['date']):%a %d %b}, all day"
+    else:
+        start, end = (moment.astimezone(tz) for moment in event_bounds(event))
+        when = f"{start:%H:%M}-{end:%H:%M}"
+        if multi_day:
+            when = f"{start:%a %d %b} {when}"
+    line = f"- {when}: {summary}"
+    if event.get('location'):
+        line += f" ({event['location']})"
+    if not is_busy(event):
+        line += " [free]"
+    return line
+
+def format_agenda(events: list[dict], label: str, tz: ZoneInfo, multi_day: bool, truncated: bool) -> str:
+    if not events:
+        return f"You have no events {label}."
+    noun = "event" if len(events) == 1 else "events"
+    count = f"at least {len(events)}" if truncated else str(len(events))
+    lines = [f"You have {count} {noun} {label}:"]
+    lines += [_format_event(event, tz, multi_day) for event in events]
+    if truncated:
+        lines.append("There are more; ask me about a shorter range to see them all.")
+    return "\n".join(lines)
+
+async def answer(intent: Intent, service: Resource, tz_name: str = DEFAULT_TIMEZONE) -> tuple[str, dict, str]:
+    """Answers an intent; returns the tool used, its input and the reply."""
+    tz = ZoneInfo(tz_name)
+    now = datetime.datetime.now(tz)
+    if intent.name == "time":
+        return "get_current_time", {}, f"It's {now:%H:%M} on {now:%A, %d %B %Y} ({tz_name})."
+    if intent.name == "date":
+        return "get_current_time", {}, f"Today is {now:%A, %d %B %Y}."
+    start, end, label = day_range(intent.day, now)
+    tool_input = {"start": start.isoformat(), "end": end.isoformat()}
+    # One extra event tells us whether there are more than we show
+    events = await alist_events(service, tool_input["start"], tool_input["end"], FAST_PATH_MAX_EVENTS + 1)
+    truncated = len(events) > FAST_PATH_MAX_EVENTS
+    reply = format_agenda(events[:FAST_PATH_MAX_EVENTS], label, tz, intent.day.endswith("week"), truncated)
+    return "list_events", tool_input, reply
+
+class FastPathStats:
+    """How often messages were answered without the language model, per intent."""
+
+    def __init__(self):
+        self.taken: Counter = Counter()
+        self.fallbacks = 0
+        self.errors = 0
+        self._lock = threading.Lock()
+
+    def record(self, intent: Optional[str], error: bool = False):
+        with self._lock:
+            if error:
+                self.errors += 1
+            if intent is None or error:
+                self.fallbacks += 1
+            else:
+                self.taken[intent] += 1
+
+    def stats(self) -> dict:
+        with self._lock:
+            taken = sum(self.taken.values())
+            total = taken + self.fallbacks
+            return {
+                "taken": taken,
+                "fallbacks": self.fallbacks,
+                "errors": self.errors,
+                "by_intent": dict(self.taken),
+                "rate": taken / total if total else 0.0,
+            }
+
+fast_path_stats = FastPathStats()
+
+async def try_fast_path(message: str, service: Resource, tz_name: str = DEFAULT_TIMEZONE) -> Optional[tuple[str, dict, str]]:
+    """Answers ``message`` directly if it's a simple request, else returns None."""
+    intent = match_intent(message)
+    if intent is None:
+        fast_path_stats.record(None)
+        return None
+    try:
+        result = await answer(intent, service, tz_name)
+    except Exception:
+        # The agent gets to try (and explain any error) instead
+        logging.exception("Fast path failed for the %s intent, falling back to the agent.", intent.name)
+        fast_path_stats.record(intent.name, error=True)
+        return None
+    fast_path_stats.record(intent.name)
+    logging.info("Fast path answered a %s request (%.0f%% of messages so far).", intent.name, 100 * fast_path_stats.stats()["rate"])
+    return result
@@ -0,0 +1,74 @@
+from bisect import bisect_right
+from typing import Any, Iterable
+
+
+class IntervalIndex:
+    """Static index over half-open intervals ``[start, end)`` with a payload each.
+
+    Intervals are kept in an array sorted by start that doubles as an implicit
+    balanced binary search tree; every node records the largest end in its
+    subtree, so overlap queries run in O(log n + k). The intervals are also
+    merged into disjoint busy blocks for busy-time queries.
+    Build it once per calendar change; it is not updated in place.
+    """
+
+    def __init__(self, intervals: Iterable[tuple[float, float, Any]]):
+        items = sorted(intervals, key=lambda item: item[0])
+        self.starts = [item[0] for item in items]
+        self.ends = [item[1] for item in items]
+        self.payloads = [item[2] for item in items]
+        self._max_end = list(self.ends)
+        self._augment(0, len(items))
+        self._block_starts, self._block_ends = self._merge()
+
+    def _augment(self, lo: int, hi: int) -> float:
+        """Fills in the subtree max end for the node covering [lo, hi)."""
+        if lo >= hi:
+            return float("-inf")
+        mid = (lo + hi) // 2
+        self._max_end[mid] = max(self.ends[mid], self._augment(lo, mid), self._augment(mid + 1, hi))
+        return self._max_end[mid]
+
+    def _merge(self) -> tuple[list[float], list[float]]:
+        block_starts, block_ends = [], []
+        for start, end in zip(self.starts, self.ends):
+            if block_ends and start <= block_ends[-1]:
+                block_ends[-1] = max(block_ends[-1], end)
+            else:
+                block_starts.append(start)
+                block_ends.append(end)
+        return block_starts, block_ends
+
+    def __len__(self) -> int:
+        return len(self.starts)
+
+    def overlapping(self, start: float, end: float) -> list[int]:
+        """Positions of the intervals overlapping [start, end), in start order."""
+        found = []
+        stack = [(0, len(self.starts))]
+        while stack:
+            lo, hi = stack.pop()
+            if lo >= hi:
+                continue
+            mid = (lo + hi) // 2
+            if self._max_end[mid] <= start:
+                continue  # everything in this subtree ends before the window
+            stack.append((lo, mid))
+            if self.starts[mid] < end:
+                if self.ends[mid] > start:
+                    found.append(mid)
+                stack.append((mid + 1, hi))
+        found.sort()
+        return found
+
+    def payloads_overlapping(self, start: float, end: float) -> list[Any]:
+        return [self.payloads[i] for i in self.overlapping(start, end)]
+
+    def busy_blocks(self, start: float, end: float) -> list[tuple[float, float]]:
+        """Merged busy blocks overlapping [start, end), clipped to the window."""
+        blocks = []
+        i = bisect_right(self._block_ends, start)
+        while i < len(self._block_starts) and self._block_starts[i] < end:
+            blocks.append((max(self._block_starts[i], start), min(self._block_ends[i], end)))
+            i += 1
+        return blocks
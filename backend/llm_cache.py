@@ -0,0 +1,192 @@
+import datetime
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from typing import Optional, Union
+from zoneinfo import ZoneInfo
+from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.messages import message_to_dict, messages_from_dict
+from langchain.agents.output_parsers.tools import ToolAgentAction
+from .cache import TTLCache
+
+# Caches the agent's decisions so a repeated turn (the same question asked
+# again, or a retry after the frontend timed out) doesn't call Gemini again.
+# Only decisions that read the calendar are cached: a step is stored when every
+# earlier tool call and the decision itself are read-only or a final answer, so
+# creating, changing or deleting events always goes back to the model. Tool
+# calls themselves are never cached; they are replayed against the calendar.
+# Entries expire after LLM_CACHE_TTL seconds or at midnight in DEFAULT_TIMEZONE,
+# whichever comes first, since answers like "what's on today" depend on the
+# date. Set LLM_CACHE_SQLITE_PATH to keep entries on disk across restarts.
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_SIZE = int(os.getenv("LLM_CACHE_SIZE", "1024"))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "900"))
+LLM_CACHE_SQLITE_PATH = os.getenv("LLM_CACHE_SQLITE_PATH")
+CACHE_TIMEZONE = os.getenv("DEFAULT_TIMEZONE", "Asia/Kolkata")
+
+READ_ONLY_TOOLS = frozenset({"check_availability", "find_free_slots", "list_events", "search_events", "get_current_time"})
+
+AgentOutcome = Union[AgentAction, list[AgentAction], AgentFinish]
+
+def _normalize_text(text: str) -> str:
+    return " ".join(str(text).split()).lower()
+
+def _observation_key(action: AgentAction, observation) -> str:
+    # The clock moves on every call; to the minute is as precise as any answer gets
+    if action.tool == "get_current_time":
+        return str(observation)[:16]
+    return str(observation)
+
+def is_read_only(outcome: AgentOutcome) -> bool:
+    """Whether replaying this outcome can't change the calendar."""
+    if isinstance(outcome, AgentFinish):
+        return True
+    actions = outcome if isinstance(outcome, list) else [outcome]
+    return all(action.tool in READ_ONLY_TOOLS for action in actions)
+
+def seconds_until_midnight(tz: str = CACHE_TIMEZONE) -> float:
+    now = datetime.datetime.now(ZoneInfo(tz))
+    midnight = datetime.datetime.combine(now.date() + datetime.timedelta(days=1), datetime.time(), tzinfo=now.tzinfo)
+    return (midnight - now).total_seconds()
+
+def encode_outcome(outcome: AgentOutcome) -> str:
+    if isinstance(outcome, AgentFinish):
+        return json.dumps({"finish": outcome.return_values, "log": outcome.log})
+    actions = outcome if isinstance(outcome, list) else [outcome]
+    return json.dumps({
+        "actions": [_encode_action(a) for a in actions],
+        "list": isinstance(outcome, list),
+    })
+
+def _encode_action(action: AgentAction) -> dict:
+    encoded = {"tool": action.tool, "tool_input": action.tool_input, "log": action.log}
+    if isinstance(action, ToolAgentAction):
+        # Native tool calls are answered by id, in reply to the model's own message
+        encoded["tool_call_id"] = action.tool_call_id
+        encoded["message_log"] = [message_to_dict(message) for message in action.message_log]
+    return encoded
+
+def _decode_action(data: dict) -> AgentAction:
+    if "tool_call_id" in data:
+        return ToolAgentAction(**dict(data, message_log=messages_from_dict(data["message_log"])))
+    return AgentAction(**data)
+
+def decode_outcome(value: str) -> AgentOutcome:
+    data = json.loads(value)
+    if "finish" in data:
+        return AgentFinish(return_values=data["finish"], log=data["log"])
+    actions = [_decode_action(action) for action in data["actions"]]
+    return actions if data["list"] else actions[0]
+
+class SQLiteLLMCacheStore:
+    """Keeps cached agent decisions in a SQLite file, with a wall-clock expiry per row."""
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS llm_cache (key TEXT PRIMARY KEY, value TEXT, expires_at REAL)")
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            row = self._conn.execute("SELECT value, expires_at FROM llm_cache WHERE key = ?", (key,)).fetchone()
+        if row is None or row[1] <= time.time():
+            return None
+        return row[0]
+
+    def set(self, key: str, value: str, ttl: float):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO llm_cache (key, value, expires_at) VALUES (?, ?, ?)",
+                               (key, value, time.time() + ttl))
+            self._conn.execute("DELETE FROM llm_cache WHERE expires_at <= ?", (time.time(),))
+
+class LLMCache:
+    """Agent decisions keyed on the normalized input, chat history and scratchpad.
+
+    Recently used entries are kept in memory; with a ``store`` they are also
+    written to (and read back from) disk.
+    """
+
+    def __init__(self, maxsize: int = LLM_CACHE_SIZE, ttl: float = LLM_CACHE_TTL,
+                 store: Optional[SQLiteLLMCacheStore] = None):
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.skipped = 0
+        self._memory = TTLCache(maxsize, ttl)
+        self._store = store
+        self._lock = threading.Lock()
+
+    def key(self, state: dict, namespace: str = "") -> Optional[str]:
+        """The cache key for an agent step, or None if the step must not be cached.
+
+        ``namespace`` separates graphs that use a different model or prompt."""
+        steps = state.get("intermediate_steps") or []
+        if not all(action.tool in READ_ONLY_TOOLS for action, *_ in steps):
+            return None
+        payload = {
+            "namespace": namespace,
+            # Also part of the key so entries written to disk yesterday never match today
+            "date": datetime.datetime.now(ZoneInfo(CACHE_TIMEZONE)).date().isoformat(),
+            # Relative dates resolve differently per timezone; the prompt gives the
+            # time to the minute, so an answer that reads the clock keys on it too
+            "timezone": state.get("timezone"),
+            "minute": (state.get("now") or "")[:16],
+            "input": _normalize_text(state.get("input", "")),
+            "history": [(message.type, _normalize_text(message.content)) for message in state.get("chat_history") or []],
+            "steps": [
+                (action.tool, json.dumps(action.tool_input, sort_keys=True, default=str), _observation_key(action, observation), batch)
+                for action, observation, batch in steps
+            ],
+        }
+        return hashlib.sha256(json.dumps(payload, sort_keys=True).encode()).hexdigest()
+
+    def get(self, key: str) -> Optional[AgentOutcome]:
+        value = self._memory.get(key)
+        if value is None and self._store:
+            value = self._store.get(key)
+            if value is not None:
+                self._memory.set(key, value, self._ttl())
+        with self._lock:
+            if value is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+        return decode_outcome(value)
+
+    def set(self, key: str, outcome: AgentOutcome):
+        if not is_read_only(outcome):
+            with self._lock:
+                self.skipped += 1
+            return
+        value, ttl = encode_outcome(outcome), self._ttl()
+        self._memory.set(key, value, ttl)
+        if self._store:
+            self._store.set(key, value, ttl)
+
+    def _ttl(self) -> float:
+        return min(self.ttl, seconds_until_midnight())
+
+    def clear(self):
+        self._memory.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "skipped": self.skipped,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "size": len(self._memory),
+            }
+
+def default_llm_cache() -> Optional[LLMCache]:
+    """The cache configured by the LLM_CACHE_* environment variables, or None if disabled."""
+    if not LLM_CACHE_ENABLED:
+        return None
+    store = SQLiteLLMCacheStore(LLM_CACHE_SQLITE_PATH) if LLM_CACHE_SQLITE_PATH else None
+    return LLMCache(store=store)
@@ -1,14 +1,25 @@
+import asyncio
 import os
-from fastapi import FastAPI, Request, Depends
-from fastapi.responses import StreamingResponse
+from fastapi import FastAPI, Request, Depends, HTTPException
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
 import json
+from typing import Optional
 from fastapi.middleware.cors import CORSMiddleware
 from dotenv import load_dotenv
-from pydantic import BaseModel
-from backend.agent_graph import create_agent_graph
-from backend.oauth import router as oauth_router, get_google_calendar_service
+from pydantic import BaseModel, field_validator
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+from backend.agent_graph import AGENT_ENGINE, create_agent_graph
+from backend.llm_cache import default_llm_cache
+from backend.memory import history_manager
+from backend.streaming import FinalAnswerStreamParser, TextStreamParser
+from backend import metrics
+from backend.fast_path import fast_path_stats
+from backend.oauth import on_user_evicted, user_cache_stats
+from backend.push import watch_channels
+from backend.sessions import Session, create_session_store, new_session_id
+from backend.oauth import router as oauth_router, get_google_calendar_service, refreshed_token_headers
 from langchain_core.messages import HumanMessage, AIMessage
-from langchain_core.agents import AgentAction, AgentFinish
+from langchain_core.agents import AgentFinish
 from googleapiclient.discovery import Resource
 
 # Load env variables from .env file
@@ -38,43 +49,175 @@ async def root():
 
 class ChatRequest(BaseModel):
     message: str
-    history: list
+    # Leave out to start a new conversation; the id comes back in X-Session-Id
+    session_id: Optional[str] = None
+    # Ask for a final {"timings": ...} event with the turn's time breakdown
+    timings: bool = False
+    # IANA timezone, e.g. "Europe/Berlin"; defaults to the user's calendar's
+    timezone: Optional[str] = None
+
+    @field_validator("timezone")
+    @classmethod
+    def known_timezone(cls, value: Optional[str]) -> Optional[str]:
+        if value is not None:
+            try:
+                ZoneInfo(value)
+            except (ZoneInfoNotFoundError, ValueError):
+                raise ValueError(f"Unknown timezone {value!r}")
+        return value
+
+# The graph holds no per-user state, so build and compile it once per process.
+# The user's calendar service is passed in through the run config instead.
+# Repeated read-only turns are answered from the LLM cache (see llm_cache.py).
+llm_cache = default_llm_cache()
+workflow = create_agent_graph(llm_cache=llm_cache)
+compiled_graph = workflow.compile()
+session_store = create_session_store()
+# How the answer text is picked out of the streamed model output
+answer_stream_parser = TextStreamParser if AGENT_ENGINE == "tools" else FinalAnswerStreamParser
+
+_renewals: Optional[asyncio.Task] = None
+
+if watch_channels is not None:
+    # A user leaving the user cache no longer needs their channel from this worker
+    on_user_evicted(lambda key, user: watch_channels.forget(key, user.service))
+
+@app.on_event("startup")
+async def start_watch_renewals():
+    """Replaces Calendar watch channels before they expire (see push.py)."""
+    global _renewals
+    if watch_channels is not None:
+        _renewals = asyncio.create_task(watch_channels.run_renewals())
+
+@app.on_event("shutdown")
+async def stop_watch_channels():
+    if watch_channels is not None:
+        if _renewals is not None:
+            _renewals.cancel()
+        await watch_channels.close_all()
+
+def load_session(session_id: Optional[str], owner: str) -> Session:
+    """The caller's session, or a new one if the id is unknown or has expired.
+    New sessions always get an id from the server, never the client's."""
+    session = session_store.get(session_id) if session_id else None
+    if session is None:
+        return Session(id=new_session_id(), owner=owner)
+    if session.owner != owner:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return session
+
+async def get_agent_response_stream(req: ChatRequest, session: Session, service: Resource):
+    """Streams the agent's response, including tool usage, as Server-Sent Events.
+
+    Events are ``{"tool", "tool_input"}`` and ``{"tool_end"}`` around each tool
+    call, ``{"delta"}`` pieces of the final answer while it is generated, and
+    ``{"response"}`` with the complete answer at the end."""
+
+    turn = metrics.start_turn()
 
-async def get_agent_response_stream(req: ChatRequest, service: Resource):
-    """Streams the agent's response, including tool usage, as Server-Sent Events."""
-    
-    # Create and compile the graph for each request, ensuring it has the correct service
-    compiled_graph = create_agent_graph(service).compile()
-    
     # Convert history to LangChain messages
     history_messages = []
-    # Exclude the last assistant message which is a placeholder/old response
-    for msg in req.history[:-1]: 
+    for msg in session.history:
         if msg["role"] == "user":
             history_messages.append(HumanMessage(content=msg["content"]))
         elif msg["role"] == "assistant":
             history_messages.append(AIMessage(content=msg["content"]))
+    # Older turns are summarized so the prompt stays within the history budget
+    history_messages = await history_manager.compact(history_messages)
 
-    # Define the initial state for the graph
+    # Define the initial state for the graph; the time is set by the graph's
+    # first node
     state = {
         "input": req.message,
         "chat_history": history_messages,
+        "intermediate_steps": None,
+        "timezone": req.timezone,
+        "now": None,
     }
     
-    # Stream the graph execution
-    async for chunk in compiled_graph.astream(state):
-        if "agent" in chunk:
-            agent_outcome = chunk["agent"].get("agent_outcome")
-            if agent_outcome:
-                if isinstance(agent_outcome, AgentAction):
-                    # The agent is using a tool
-                    tool_name = agent_outcome.tool
-                    yield f"data: {json.dumps({'tool': tool_name, 'tool_input': agent_outcome.tool_input})}\n\n"
-                elif isinstance(agent_outcome, AgentFinish):
-                    # The agent has finished
-                    final_response = agent_outcome.return_values["output"]
-                    yield f"data: {json.dumps({'response': final_response})}\n\n"
+    # Stream the graph execution: tool calls as they start and end, and the
+    # final answer token by token as the model writes it
+    config = {"configurable": {"service": service}}
+    final_response = None
+    answer_parser = answer_stream_parser()
+    async for event in compiled_graph.astream_events(state, config=config, version="v2"):
+        kind, node = event["event"], event.get("metadata", {}).get("langgraph_node")
+        if kind == "on_chat_model_start" and node == "agent":
+            # Every agent step is a new model call with its own output
+            answer_parser = answer_stream_parser()
+        elif kind == "on_chat_model_stream" and node == "agent":
+            delta = answer_parser.feed(event["data"]["chunk"].content)
+            if delta:
+                yield f"data: {json.dumps({'delta': delta})}\n\n"
+        elif kind == "on_tool_start":
+            yield f"data: {json.dumps({'tool': event['name'], 'tool_input': event['data'].get('input')}, default=str)}\n\n"
+        elif kind == "on_tool_end":
+            yield f"data: {json.dumps({'tool_end': event['name']})}\n\n"
+        elif kind == "on_chain_end" and event["name"] in ("router", "agent") and node == event["name"]:
+            output = event["data"].get("output") or {}
+            if event["name"] == "router":
+                # Answered by the fast path, which calls the calendar directly
+                for agent_action, *_ in output.get("intermediate_steps") or []:
+                    yield f"data: {json.dumps({'tool': agent_action.tool, 'tool_input': agent_action.tool_input})}\n\n"
+                    yield f"data: {json.dumps({'tool_end': agent_action.tool})}\n\n"
+            agent_outcome = output.get("agent_outcome")
+            if isinstance(agent_outcome, AgentFinish):
+                # The agent has finished; this carries the complete answer
+                final_response = agent_outcome.return_values["output"]
+                yield f"data: {json.dumps({'response': final_response})}\n\n"
+
+    if final_response is not None:
+        session.add_turn(req.message, final_response)
+        session_store.save(session)
+    timings = metrics.finish_turn(turn)
+    if req.timings:
+        yield f"data: {json.dumps({'timings': timings})}\n\n"
 
 @app.post("/chat")
-async def chat_endpoint(req: ChatRequest, service: Resource = Depends(get_google_calendar_service)):
-    return StreamingResponse(get_agent_response_stream(req, service), media_type="text/event-stream")
+async def chat_endpoint(req: ChatRequest, request: Request, service: Resource = Depends(get_google_calendar_service)):
+    session = load_session(req.session_id, getattr(request.state, "user_key", ""))
+    if watch_channels is not None:
+        # Keeps this user's event mirror current from now on
+        watch_channels.watch(service, getattr(request.state, "user_key", ""))
+    return StreamingResponse(
+        get_agent_response_stream(req, session, service),
+        media_type="text/event-stream",
+        headers={**refreshed_token_headers(request), "X-Session-Id": session.id},
+    )
+
+@app.post("/calendar/notifications")
+async def calendar_notifications(request: Request):
+    """Receives Calendar push notifications for the channels in push.py; a
+    change starts a background sync of that user's event mirror."""
+    if watch_channels is None:
+        raise HTTPException(status_code=404, detail="Push notifications are not enabled")
+    return Response(status_code=watch_channels.notify(request.headers))
+
+def _cache_metrics() -> list:
+    """Hit rates of the caches in front of the model, the history summaries and the users."""
+    collected = []
+    if llm_cache is not None:
+        stats = llm_cache.stats()
+        collected.append(("llm_cache_lookups_total", "counter", "LLM response cache lookups.",
+                          [({"result": "hit"}, stats["hits"]), ({"result": "miss"}, stats["misses"])]))
+    fast_path = fast_path_stats.stats()
+    collected.append(("fast_path_messages_total", "counter", "Messages answered by the fast path, by intent, or passed to the agent.",
+                      [({"intent": intent}, count) for intent, count in fast_path["by_intent"].items()]
+                      + [({"intent": "none"}, fast_path["fallbacks"])]))
+    history = history_manager.stats()
+    collected.append(("history_summaries_total", "counter", "Chat history summaries built or reused from the cache.",
+                      [({"result": "built"}, history["summaries_built"]), ({"result": "reused"}, history["summaries_reused"])]))
+    if watch_channels is not None:
+        collected.append(("calendar_watched_users", "gauge", "Users whose calendar this worker watches through push notifications.",
+                          [({}, len(watch_channels))]))
+    users = user_cache_stats()
+    collected.append(("user_cache_lookups_total", "counter", "Cached credentials and Calendar services lookups.",
+                      [({"result": "hit"}, users["hits"]), ({"result": "miss"}, users["misses"])]))
+    return collected
+
+metrics.registry.add_collector(_cache_metrics)
+
+@app.get("/metrics")
+async def metrics_endpoint():
+    """Prometheus text exposition of the timings and counters in metrics.py."""
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
@@ -1,4 +1,151 @@
-from langchain.memory import ConversationBufferMemory
+import hashlib
+import logging
+import os
+from typing import Awaitable, Callable, Optional
+from langchain_core.messages import BaseMessage, HumanMessage
+from .cache import TTLCache
 
-# Simple wrapper for memory, can be extended for more advanced state
-memory = ConversationBufferMemory(memory_key="chat_history", return_messages=True)
+# Keeps the chat history sent to the model within a token budget. The newest
+# messages are passed on as they are; older ones are folded into a running
+# summary. Summaries are cached by a hash of the messages they cover, so each
+# message is summarized once: the next turn only adds what newly fell out of
+# the window to the summary it extends.
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "1500"))
+HISTORY_SUMMARY_TOKENS = int(os.getenv("HISTORY_SUMMARY_TOKENS", "300"))
+HISTORY_SUMMARY_CACHE_SIZE = int(os.getenv("HISTORY_SUMMARY_CACHE_SIZE", "1024"))
+HISTORY_SUMMARY_CACHE_TTL = float(os.getenv("HISTORY_SUMMARY_CACHE_TTL", "86400"))
+
+SUMMARY_PREFIX = "Summary of our earlier conversation:\n"
+# Rough per-message overhead for the role and separators
+MESSAGE_OVERHEAD_TOKENS = 4
+
+SUMMARY_PROMPT = """You keep a running summary of a conversation between a user and their calendar assistant.
+Update the summary with the new messages below. Keep facts needed later in the conversation: event names, ids, dates and times, attendees, and what was decided or done. Use at most {max_words} words and write nothing but the summary.
+
+Current summary:
+{summary}
+
+New messages:
+{messages}"""
+
+Summarizer = Callable[[str, list[BaseMessage]], Awaitable[str]]
+
+def estimate_tokens(text: str) -> int:
+    """About four characters per token, which is close enough for budgeting."""
+    return (len(text) + 3) // 4
+
+def message_tokens(message: BaseMessage) -> int:
+    return estimate_tokens(str(message.content)) + MESSAGE_OVERHEAD_TOKENS
+
+def _speaker(message: BaseMessage) -> str:
+    return "User" if isinstance(message, HumanMessage) else "Assistant"
+
+def _transcript(messages: list[BaseMessage]) -> str:
+    return "\n".join(f"{_speaker(message)}: {message.content}" for message in messages)
+
+def _truncate_front(text: str, max_tokens: int) -> str:
+    """Keeps the end of ``text``: the most recent part of a running summary."""
+    max_chars = max_tokens * 4
+    if len(text) <= max_chars:
+        return text
+    return "..." + text[-max_chars:].split("\n", 1)[-1]
+
+async def extractive_summary(summary: str, messages: list[BaseMessage], max_tokens: int = HISTORY_SUMMARY_TOKENS) -> str:
+    """Appends the start of each message to the summary; no model call."""
+    lines = [summary] if summary else []
+    for message in messages:
+        content = " ".join(str(message.content).split())
+        lines.append(f"{_speaker(message)}: {content[:200]}{'...' if len(content) > 200 else ''}")
+    return _truncate_front("\n".join(lines), max_tokens)
+
+class LLMSummarizer:
+    """Updates the summary with the language model, falling back to an extractive one."""
+
+    def __init__(self, llm=None, max_tokens: int = HISTORY_SUMMARY_TOKENS):
+        self._llm = llm
+        self.max_tokens = max_tokens
+
+    def _model(self):
+        if self._llm is None:
+            from langchain_google_genai import ChatGoogleGenerativeAI
+            self._llm = ChatGoogleGenerativeAI(model="gemini-1.5-flash", google_api_key=os.getenv("GEMINI_API_KEY"), temperature=0)
+        return self._llm
+
+    async def __call__(self, summary: str, messages: list[BaseMessage]) -> str:
+        prompt = SUMMARY_PROMPT.format(max_words=self.max_tokens * 3 // 4, summary=summary or "(none yet)", messages=_transcript(messages))
+        try:
+            result = await self._model().ainvoke(prompt)
+            return _truncate_front(str(result.content).strip(), self.max_tokens)
+        except Exception:
+            logging.exception("Could not summarize the chat history, keeping an extractive summary.")
+            return await extractive_summary(summary, messages, self.max_tokens)
+
+class HistoryManager:
+    """Fits the chat history into ``token_budget`` tokens.
+
+    The most recent messages that fit are kept verbatim (always at least the
+    last one); everything before them is replaced by one summary message.
+    """
+
+    def __init__(self, token_budget: int = HISTORY_TOKEN_BUDGET, summarizer: Optional[Summarizer] = None,
+                 cache: Optional[TTLCache] = None):
+        self.token_budget = token_budget
+        self.summarizer = summarizer or LLMSummarizer()
+        self.cache = cache if cache is not None else TTLCache(HISTORY_SUMMARY_CACHE_SIZE, HISTORY_SUMMARY_CACHE_TTL)
+        self.summaries_built = 0
+        self.summaries_reused = 0
+
+    def split(self, messages: list[BaseMessage]) -> int:
+        """Index of the first message kept verbatim; the ones before get summarized."""
+        # Leave room for the summary itself when anything has to be summarized
+        total = sum(message_tokens(message) for message in messages)
+        if total <= self.token_budget:
+            return 0
+        budget = self.token_budget - HISTORY_SUMMARY_TOKENS - MESSAGE_OVERHEAD_TOKENS
+        used, cutoff = 0, len(messages)
+        while cutoff > 0:
+            used += message_tokens(messages[cutoff - 1])
+            if used > budget and cutoff < len(messages):
+                break
+            cutoff -= 1
+        return cutoff
+
+    @staticmethod
+    def prefix_keys(messages: list[BaseMessage]) -> list[str]:
+        """``keys[i]`` identifies the first ``i`` messages (a rolling hash)."""
+        keys = [hashlib.sha256(b"history").hexdigest()]
+        for message in messages:
+            digest = hashlib.sha256(f"{keys[-1]}\n{message.type}\n{message.content}".encode())
+            keys.append(digest.hexdigest())
+        return keys
+
+    async def summarize(self, messages: list[BaseMessage]) -> str:
+        """The summary of ``messages``, extending the longest already-summarized prefix."""
+        keys = self.prefix_keys(messages)
+        summary = self.cache.get(keys[-1])
+        if summary is not None:
+            self.summaries_reused += 1
+            return summary
+        start, summary = 0, ""
+        for i in range(len(messages) - 1, 0, -1):
+            cached = self.cache.get(keys[i])
+            if cached is not None:
+                start, summary = i, cached
+                break
+        summary = await self.summarizer(summary, messages[start:])
+        self.cache.set(keys[-1], summary)
+        self.summaries_built += 1
+        return summary
+
+    async def compact(self, messages: list[BaseMessage]) -> list[BaseMessage]:
+        """The history to send to the model: a summary (if needed) plus the recent window."""
+        cutoff = self.split(messages)
+        if cutoff == 0:
+            return messages
+        summary = await self.summarize(messages[:cutoff])
+        return [HumanMessage(content=SUMMARY_PREFIX + summary)] + messages[cutoff:]
+
+    def stats(self) -> dict:
+        return {"summaries_built": self.summaries_built, "summaries_reused": self.summaries_reused}
+
+history_manager = HistoryManager()
@@ -0,0 +1,254 @@
+import contextvars
+import functools
+import threading
+import time
+from bisect import bisect_left
+from collections import defaultdict
+from typing import Callable, Optional
+from langchain_core.callbacks import BaseCallbackHandler
+
+# Timing and counters for the agent, its tools and the Calendar API, served in
+# the Prometheus text format by /metrics. Recording a sample is a dictionary
+# lookup and a few additions under a lock, cheap enough to leave on.
+# Each chat turn also collects its own breakdown (TurnTimings) through a
+# context variable, which /chat can send back as a final SSE event.
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _format_labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in labels) + "}"
+
+class Counter:
+    def __init__(self, name: str, help: str):
+        self.name, self.help = name, help
+        self._values: dict[tuple, float] = defaultdict(float)
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] += amount
+
+    def value(self, **labels) -> float:
+        with self._lock:
+            return self._values.get(tuple(sorted(labels.items())), 0.0)
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_format_labels(key)} {value}" for key, value in self._values.items()]
+        return lines
+
+class Histogram:
+    def __init__(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS):
+        self.name, self.help = name, help
+        self.buckets = tuple(buckets)
+        # Per label set: [count per bucket (+Inf last), sum]
+        self._values: dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        i = bisect_left(self.buckets, value)
+        with self._lock:
+            counts = self._values.get(key)
+            if counts is None:
+                counts = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            counts[0][i] += 1
+            counts[1] += value
+
+    def render(self) -> list[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            values = [(key, list(counts[0]), counts[1]) for key, counts in self._values.items()]
+        for key, counts, total in values:
+            cumulative = 0
+            for bound, count in zip(self.buckets + (float("inf"),), counts):
+                cumulative += count
+                le = "+Inf" if bound == float("inf") else repr(bound)
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', le),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {total}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+class Registry:
+    """Metrics plus collectors: functions that report values kept elsewhere
+    (cache hit counts, ...) as ``(name, type, help, [(labels, value), ...])``."""
+
+    def __init__(self):
+        self._metrics: list = []
+        self._collectors: list[Callable[[], list]] = []
+
+    def counter(self, name: str, help: str) -> Counter:
+        metric = Counter(name, help)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, help: str, buckets: tuple = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, help, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def add_collector(self, collector: Callable[[], list]):
+        self._collectors.append(collector)
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines += metric.render()
+        for collector in self._collectors:
+            for name, kind, help, samples in collector():
+                lines += [f"# HELP {name} {help}", f"# TYPE {name} {kind}"]
+                lines += [f"{name}{_format_labels(tuple(sorted(labels.items())))} {value}" for labels, value in samples]
+        return "\n".join(lines) + "\n"
+
+registry = Registry()
+node_seconds = registry.histogram("agent_node_seconds", "Time spent in each agent graph node.")
+tool_seconds = registry.histogram("agent_tool_seconds", "Time spent running each agent tool.")
+calendar_seconds = registry.histogram("calendar_call_seconds", "Time spent in each calendar_tools function, API calls included.")
+calendar_errors = registry.counter("calendar_call_errors_total", "calendar_tools functions that raised.")
+llm_seconds = registry.histogram("llm_call_seconds", "Time spent waiting for the language model.")
+llm_tokens = registry.counter("llm_tokens_total", "Tokens sent to and received from the language model.")
+turn_seconds = registry.histogram("chat_turn_seconds", "Time to answer a chat message.")
+prefix_saved = registry.counter("llm_prefix_tokens_saved_total", "Prompt prefix tokens not paid for, by context cache reads or prompt minimizing.")
+parse_failures = registry.counter("agent_parse_failures_total", "Model replies the agent could not parse, ending the turn.")
+turn_steps = registry.histogram("chat_turn_steps", "Agent graph steps per chat message.", buckets=(1, 2, 3, 4, 5, 6, 8, 10, 15, 20))
+
+class TurnTimings:
+    """Where the time of one chat turn went."""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.sections: dict[str, dict[str, float]] = {"nodes": defaultdict(float), "tools": defaultdict(float),
+                                                      "calendar": defaultdict(float), "llm": defaultdict(float)}
+        self.steps = 0
+        self._lock = threading.Lock()
+
+    def add(self, section: str, name: str, seconds: float):
+        with self._lock:
+            self.sections[section][name] += seconds
+
+    def step(self):
+        with self._lock:
+            self.steps += 1
+
+    def summary(self) -> dict:
+        total = time.perf_counter() - self.started
+        with self._lock:
+            sections = {section: {name: round(value, 4) for name, value in values.items()} for section, values in self.sections.items()}
+        return {
+            "total": round(total, 4),
+            "steps": self.steps,
+            # Time outside the graph nodes: history compaction, streaming, graph bookkeeping
+            "overhead": round(total - sum(sections["nodes"].values()), 4),
+            **sections,
+        }
+
+current_turn: contextvars.ContextVar[Optional[TurnTimings]] = contextvars.ContextVar("current_turn", default=None)
+
+def _record(histogram: Histogram, section: str, name: str, seconds: float, **labels):
+    histogram.observe(seconds, **labels)
+    turn = current_turn.get()
+    if turn is not None:
+        turn.add(section, name, seconds)
+
+def timed_node(name: str):
+    """Times an async graph node and counts it as a step of the turn."""
+    def decorator(node):
+        @functools.wraps(node)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                return await node(*args, **kwargs)
+            finally:
+                _record(node_seconds, "nodes", name, time.perf_counter() - started, node=name)
+                turn = current_turn.get()
+                if turn is not None:
+                    turn.step()
+        return wrapper
+    return decorator
+
+def record_tool(tool: str, seconds: float):
+    _record(tool_seconds, "tools", tool, seconds, tool=tool)
+
+def timed_calendar_call(func):
+    """Times a calendar_tools function; worker threads see the turn through the copied context."""
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        started = time.perf_counter()
+        try:
+            return func(*args, **kwargs)
+        except Exception:
+            calendar_errors.inc(function=func.__name__)
+            raise
+        finally:
+            _record(calendar_seconds, "calendar", func.__name__, time.perf_counter() - started, function=func.__name__)
+    return wrapper
+
+class LLMMetricsHandler(BaseCallbackHandler):
+    """Records the duration and token usage of every model call."""
+
+    run_inline = True
+
+    def __init__(self):
+        self._started: dict = {}
+
+    def on_chat_model_start(self, serialized, messages, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_start(self, serialized, prompts, *, run_id, **kwargs):
+        self._started[run_id] = time.perf_counter()
+
+    def on_llm_end(self, response, *, run_id, **kwargs):
+        self._finish(run_id, response)
+
+    def on_llm_error(self, error, *, run_id, **kwargs):
+        self._finish(run_id, None)
+
+    def _finish(self, run_id, response):
+        started = self._started.pop(run_id, None)
+        if started is not None:
+            seconds = time.perf_counter() - started
+            _record(llm_seconds, "llm", "seconds", seconds)
+            turn = current_turn.get()
+            if turn is not None:
+                turn.add("llm", "calls", 1)
+        usage = None
+        if response is not None and response.generations and response.generations[0]:
+            message = getattr(response.generations[0][0], "message", None)
+            usage = getattr(message, "usage_metadata", None)
+        if usage:
+            for direction, key in (("input", "input_tokens"), ("output", "output_tokens")):
+                llm_tokens.inc(usage.get(key, 0), direction=direction)
+                turn = current_turn.get()
+                if turn is not None:
+                    turn.add("llm", key, usage.get(key, 0))
+            # Input tokens served from a context cache (explicit or implicit)
+            cached = (usage.get("input_token_details") or {}).get("cache_read")
+            if cached:
+                record_prefix_saved(cached, "cache_read")
+
+llm_metrics_handler = LLMMetricsHandler()
+
+def record_prefix_saved(tokens: int, how: str):
+    if tokens <= 0:
+        return
+    prefix_saved.inc(tokens, how=how)
+    turn = current_turn.get()
+    if turn is not None:
+        turn.add("llm", "prefix_tokens_saved", tokens)
+
+def start_turn() -> TurnTimings:
+    turn = TurnTimings()
+    current_turn.set(turn)
+    return turn
+
+def finish_turn(turn: TurnTimings) -> dict:
+    summary = turn.summary()
+    turn_seconds.observe(summary["total"])
+    turn_steps.observe(summary["steps"])
+    return summary
@@ -2,13 +2,22 @@ import os
 import json
 import logging
 import base64
+import hashlib
+import threading
+from typing import Optional
+import httplib2
 from fastapi import APIRouter, Request, Depends, HTTPException
 from fastapi.responses import RedirectResponse, HTMLResponse
 from google_auth_oauthlib.flow import Flow
 from google.oauth2.credentials import Credentials
-from googleapiclient.discovery import build
+from google.auth.exceptions import RefreshError
+from google_auth_httplib2 import AuthorizedHttp
+from googleapiclient.discovery import build, Resource
+from googleapiclient.http import HttpRequest
+from starlette.concurrency import run_in_threadpool
 from starlette.responses import Response
 from starlette.status import HTTP_401_UNAUTHORIZED
+from backend.cache import TTLCache
 
 SCOPES = [
     'https://www.googleapis.com/auth/calendar',
@@ -21,10 +30,73 @@ REDIRECT_URI = os.getenv("GOOGLE_REDIRECT_URI", "http://localhost:8000/oauth2cal
 
 router = APIRouter()
 
+def _cache_key(token_data: dict) -> str:
+    """Hashes the refresh token so raw tokens are never kept as cache keys."""
+    secret = token_data.get("refresh_token") or token_data.get("token") or ""
+    return hashlib.sha256(secret.encode("utf-8")).hexdigest()
+
+class CachedUser:
+    """Credentials and the Calendar service built for them, cached per user."""
+
+    def __init__(self, creds: Credentials):
+        self.creds = creds
+        self.service: Optional[Resource] = None
+        self.lock = threading.Lock()
+
+_eviction_listeners: list = []
+
+def on_user_evicted(callback):
+    """Calls ``callback(key, user)`` whenever a user leaves the user cache."""
+    _eviction_listeners.append(callback)
+
+def _user_evicted(key: str, user: CachedUser):
+    for callback in _eviction_listeners:
+        try:
+            callback(key, user)
+        except Exception:
+            logging.exception("A user cache eviction listener failed.")
+
+# Keyed on a hash of the refresh token, so a user's credentials are refreshed
+# once and the discovery-based Resource is built once, not on every request.
+_user_cache = TTLCache(
+    maxsize=int(os.getenv("USER_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("USER_CACHE_TTL", "3600")),
+    on_evict=_user_evicted,
+)
+
+def _refresh_credentials(user: CachedUser):
+    from google.auth.transport.requests import Request as GoogleRequest
+    with user.lock:
+        # Another request may have refreshed while we waited for the lock
+        if not user.creds.valid:
+            user.creds.refresh(GoogleRequest())
+
+def _build_calendar_service(creds: Credentials) -> Resource:
+    """Builds a Calendar service that is safe to share between threads.
+
+    httplib2 connections are not thread-safe, so every thread gets its own
+    authorized Http while the parsed discovery document is shared.
+    """
+    local = threading.local()
+
+    def thread_http():
+        if not hasattr(local, "http"):
+            local.http = AuthorizedHttp(creds, http=httplib2.Http())
+        return local.http
+
+    def request_builder(_http, *args, **kwargs):
+        return HttpRequest(thread_http(), *args, **kwargs)
+
+    return build('calendar', 'v3', http=thread_http(), requestBuilder=request_builder)
+
+def refreshed_token_headers(request: Request) -> dict:
+    """Response headers handing a refreshed token back to the client, if any."""
+    token_b64 = getattr(request.state, "refreshed_token", None)
+    return {"X-Refreshed-Token": token_b64} if token_b64 else {}
+
 async def get_current_user(request: Request) -> Credentials:
     logging.info("--- Attempting to authenticate user ---")
     auth_header = request.headers.get("Authorization")
-    logging.info(f"Received Authorization header: {auth_header}")
 
     if not auth_header or not auth_header.startswith("Bearer "):
         logging.warning("Authentication failed: Missing or malformed 'Bearer' token.")
@@ -35,21 +107,30 @@ async def get_current_user(request: Request) -> Credentials:
         )
     
     token_str_b64 = auth_header.split(" ")[1]
-    logging.info(f"Extracted Base64 token string: {token_str_b64}")
 
     try:
         token_str = base64.b64decode(token_str_b64).decode('utf-8')
-        logging.info(f"Decoded token string: {token_str}")
         token_data = json.loads(token_str)
-        logging.info("Successfully parsed token string into JSON.")
-        creds = Credentials.from_authorized_user_info(token_data, SCOPES)
-        
-        if not creds.valid:
+        key = _cache_key(token_data)
+        user = _user_cache.get(key)
+        if user is None:
+            logging.info("No cached credentials for this user, parsing token.")
+            user = CachedUser(Credentials.from_authorized_user_info(token_data, SCOPES))
+
+        if not user.creds.valid:
             logging.warning("Token is not valid. Checking if it can be refreshed.")
-            if creds.expired and creds.refresh_token:
+            if user.creds.expired and user.creds.refresh_token:
                 logging.info("Token is expired, attempting to refresh.")
-                from google.auth.transport.requests import Request as GoogleRequest
-                creds.refresh(GoogleRequest())
+                try:
+                    await run_in_threadpool(_refresh_credentials, user)
+                except RefreshError as e:
+                    _user_cache.pop(key)
+                    logging.error(f"Token refresh failed: {e}")
+                    raise HTTPException(
+                        status_code=HTTP_401_UNAUTHORIZED,
+                        detail="Token is invalid or expired and cannot be refreshed",
+                        headers={"WWW-Authenticate": "Bearer"},
+                    )
                 logging.info("Token refreshed successfully.")
             else:
                 logging.error("Token is invalid or expired and cannot be refreshed.")
@@ -58,27 +139,39 @@ async def get_current_user(request: Request) -> Credentials:
                     detail="Token is invalid or expired and cannot be refreshed",
                     headers={"WWW-Authenticate": "Bearer"},
                 )
+        _user_cache.set(key, user)
+
+        # Hand the refreshed token back so the client stops sending a stale one
+        if user.creds.token != token_data.get("token"):
+            request.state.refreshed_token = base64.b64encode(user.creds.to_json().encode('utf-8')).decode('utf-8')
+        request.state.cached_user = user
+        request.state.user_key = key
         logging.info("Authentication successful, returning credentials.")
-        return creds
+        return user.creds
     except (json.JSONDecodeError, KeyError) as e:
         logging.error(f"Authentication failed: Invalid token format. Error: {e}")
-        logging.error(f"Problematic token string: {token_str}")
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail=f"Invalid token format: {e}",
             headers={"WWW-Authenticate": "Bearer"},
         )
 
-def get_google_calendar_service(creds: Credentials = Depends(get_current_user)):
+def user_cache_stats() -> dict:
+    return {"hits": _user_cache.hits, "misses": _user_cache.misses, "size": len(_user_cache)}
+
+def get_google_calendar_service(request: Request, creds: Credentials = Depends(get_current_user)):
     if not creds or not creds.valid:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
             detail="Invalid or expired credentials",
             headers={"WWW-Authenticate": "Bearer"},
         )
+    user = request.state.cached_user
     try:
-        service = build('calendar', 'v3', credentials=creds)
-        return service
+        with user.lock:
+            if user.service is None:
+                user.service = _build_calendar_service(creds)
+        return user.service
     except Exception as e:
         raise HTTPException(
             status_code=HTTP_401_UNAUTHORIZED,
@@ -0,0 +1,213 @@
+import asyncio
+import json
+import logging
+import os
+import random
+import re
+import time
+from typing import Optional
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import SystemMessage
+from langchain_core.runnables import Runnable, RunnableLambda
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from .memory import estimate_tokens
+from .metrics import record_prefix_saved
+
+# The system prompt (with the tool list, for the JSON engine) and the tool
+# declarations (for native tool calling) are the same on every model call of
+# every conversation. PROMPT_CACHE decides how that prefix is sent:
+#   "gemini" keeps it in a Gemini cached content, created once and kept alive,
+#            and each call only names it. A prefix below the model's minimum
+#            cache size (CACHE_MIN_TOKENS) is sent as written instead,
+#            without trying; so is every call while a failed create is
+#            retried with backoff, or for good after a permanent failure
+#            (no google-genai, the request is refused)
+#   "local"  sends it minimized (no trailing spaces, blank line runs or
+#            repeated paragraphs); only worth it for hand-written prompts
+#            with a lot of slack, ours lose a few tokens at most
+#   "off"    sends the prompt as written
+#   "auto"   "gemini" for Gemini models, "off" otherwise
+# Tokens the prefix didn't cost are counted in llm_prefix_tokens_saved_total
+# and in the turn's timings.
+PROMPT_CACHE = os.getenv("PROMPT_CACHE", "auto").lower()
+PROMPT_CACHE_TTL = float(os.getenv("PROMPT_CACHE_TTL", "3600"))
+PROMPT_CACHE_RETRY_BASE = float(os.getenv("PROMPT_CACHE_RETRY_BASE", "30"))
+PROMPT_CACHE_RETRY_MAX = float(os.getenv("PROMPT_CACHE_RETRY_MAX", "3600"))
+
+# The smallest prefix Gemini will hold in a cached content, by model family
+# (longest matching name prefix wins); unknown models get the default
+CACHE_MIN_TOKENS = {
+    "gemini-1.5": 32768,
+    "gemini-2.0": 4096,
+    "gemini-2.5-flash": 1024,
+    "gemini-2.5-pro": 4096,
+}
+DEFAULT_CACHE_MIN_TOKENS = int(os.getenv("PROMPT_CACHE_MIN_TOKENS", "4096"))
+
+def min_cache_tokens(model: Optional[str]) -> int:
+    name = (model or "").removeprefix("models/")
+    matches = [family for family in CACHE_MIN_TOKENS if name.startswith(family)]
+    return CACHE_MIN_TOKENS[max(matches, key=len)] if matches else DEFAULT_CACHE_MIN_TOKENS
+
+def is_transient(error: Exception) -> bool:
+    """Whether creating the cache may work later: rate limits, server and network errors."""
+    code = getattr(error, "code", None)
+    if isinstance(code, int):
+        return code in (408, 429) or code >= 500
+    return isinstance(error, (ConnectionError, TimeoutError)) or type(error).__module__.startswith("httpx")
+
+_RULE = re.compile(r"^\s*([-=*_])\1{2,}\s*$")
+
+def minimize_prompt(text: str) -> str:
+    """Drops trailing spaces, horizontal rules, runs of blank lines and
+    paragraphs that repeat an earlier one."""
+    paragraphs, seen = [], set()
+    for paragraph in re.split(r"\n[ \t]*\n", text):
+        lines = [line.rstrip() for line in paragraph.strip("\n").splitlines() if not _RULE.match(line)]
+        key = " ".join(" ".join(lines).split()).lower()
+        if key and key not in seen:
+            seen.add(key)
+            paragraphs.append("\n".join(lines))
+    return "\n\n".join(paragraphs)
+
+class GenAICacheClient:
+    """Gemini's cached-content API, through the google-genai SDK.
+
+    Clients may set ``min_tokens`` to override ``min_cache_tokens``."""
+
+    min_tokens: Optional[int] = None
+
+    def __init__(self, api_key: Optional[str] = None):
+        from google import genai
+        from google.genai import types
+        self._client = genai.Client(api_key=api_key or os.getenv("GEMINI_API_KEY"))
+        self._types = types
+
+    def create(self, model: str, system_instruction: str, tools: list, ttl: float) -> str:
+        """Creates the cached content and returns its name."""
+        types = self._types
+        declarations = [
+            types.FunctionDeclaration(name=spec["name"], description=spec["description"],
+                                      parameters_json_schema=spec["parameters"])
+            for spec in (convert_to_openai_tool(tool)["function"] for tool in tools)
+        ]
+        cache = self._client.caches.create(model=model, config=types.CreateCachedContentConfig(
+            display_name="calendar-agent-prefix",
+            system_instruction=system_instruction,
+            tools=[types.Tool(function_declarations=declarations)] if declarations else None,
+            ttl=f"{int(ttl)}s",
+        ))
+        return cache.name
+
+    def extend(self, name: str, ttl: float):
+        self._client.caches.update(name=name, config=self._types.UpdateCachedContentConfig(ttl=f"{int(ttl)}s"))
+
+def resolve_mode(mode: str, llm: BaseChatModel) -> str:
+    if mode != "auto":
+        return mode
+    return "gemini" if type(llm).__name__ == "ChatGoogleGenerativeAI" else "off"
+
+def _declarations_text(tools: list) -> str:
+    return json.dumps([convert_to_openai_tool(tool) for tool in tools], separators=(",", ":"))
+
+class PromptPrefix:
+    """The static start of every agent request and how it is sent (see PROMPT_CACHE).
+
+    Build it once per graph: ``messages()`` goes at the start of the prompt
+    template and ``model(llm)`` is the model to call, with the tools bound.
+    ``client`` creates Gemini cached contents (GenAICacheClient by
+    default; benchmarks pass a fake)."""
+
+    def __init__(self, system_prompt: str, tools: Optional[list] = None, mode: str = "local",
+                 model_name: Optional[str] = None, client=None, ttl: float = PROMPT_CACHE_TTL):
+        if mode not in ("gemini", "local", "off"):
+            raise ValueError(f"Unknown prompt cache mode {mode!r}; use 'auto', 'gemini', 'local' or 'off'.")
+        self.raw_tokens = estimate_tokens(system_prompt)
+        self.system_prompt = minimize_prompt(system_prompt) if mode == "local" else system_prompt
+        self.tokens = estimate_tokens(self.system_prompt)
+        self.tools = list(tools or [])
+        self.model_name = model_name
+        self.ttl = ttl
+        if mode == "gemini":
+            cached_tokens = self.tokens + estimate_tokens(_declarations_text(self.tools)) if self.tools else self.tokens
+            minimum = getattr(client, "min_tokens", None)
+            if minimum is None:
+                minimum = min_cache_tokens(model_name)
+            if cached_tokens < minimum:
+                logging.info("The prompt prefix (~%d tokens) is below the %d tokens Gemini caches for %s; "
+                             "sending it with every call.", cached_tokens, minimum, model_name)
+                mode = "off"
+        self.mode = mode
+        self._client = client
+        self._name: Optional[str] = None
+        self._refresh_at = 0.0
+        self._failed = False
+        # After a transient failure: when to try again, and how many in a row
+        self._retry_at = 0.0
+        self._failures = 0
+        self._lock = asyncio.Lock()
+
+    def messages(self) -> list:
+        """The prefix as it goes into the prompt template; empty when Gemini holds it."""
+        return [] if self.mode == "gemini" else [SystemMessage(content=self.system_prompt)]
+
+    def model(self, llm: BaseChatModel) -> Runnable:
+        bound = llm.bind_tools(self.tools) if self.tools else llm
+        if self.mode != "gemini":
+            return bound
+
+        async def call(prompt, config, **kwargs):
+            name = await self.cache_name()
+            if name is None:
+                # No cache: send the prefix (and tools) like the off mode
+                messages = [SystemMessage(content=self.system_prompt)] + prompt.to_messages()
+                return await bound.ainvoke(messages, config, **kwargs)
+            return await llm.ainvoke(prompt, config, cached_content=name, **kwargs)
+
+        return RunnableLambda(call, name=type(llm).__name__)
+
+    def record_call(self):
+        """Counts what minimizing saved on a model call that sent the prefix."""
+        if self.mode == "local":
+            record_prefix_saved(self.raw_tokens - self.tokens, "minimized")
+        # Reads from Gemini's cache are counted from the response's usage
+
+    async def cache_name(self) -> Optional[str]:
+        """The name of the cached content holding the prefix, created or kept
+        alive as needed; None if Gemini caching isn't available right now."""
+        if self._failed or time.monotonic() < self._retry_at:
+            return None
+        if self._name and time.monotonic() < self._refresh_at:
+            return self._name
+        async with self._lock:
+            if self._failed or time.monotonic() < self._retry_at:
+                return None
+            if self._name and time.monotonic() < self._refresh_at:
+                return self._name
+            try:
+                if self._client is None:
+                    self._client = GenAICacheClient()
+                if self._name:
+                    try:
+                        await asyncio.to_thread(self._client.extend, self._name, self.ttl)
+                    except Exception:
+                        logging.info("Prompt cache %s is gone, creating a new one.", self._name)
+                        self._name = None
+                if not self._name:
+                    self._name = await asyncio.to_thread(self._client.create, self.model_name, self.system_prompt, self.tools, self.ttl)
+                # Extended at half its lifetime so it never expires under a request
+                self._refresh_at = time.monotonic() + self.ttl / 2
+                self._failures = 0
+            except Exception as e:
+                self._name = None
+                if is_transient(e):
+                    # Full jitter, so workers don't retry in lockstep
+                    delay = random.uniform(0, min(PROMPT_CACHE_RETRY_MAX, PROMPT_CACHE_RETRY_BASE * 2 ** self._failures))
+                    self._failures += 1
+                    self._retry_at = time.monotonic() + delay
+                    logging.warning("Creating the Gemini prompt cache failed (%s); sending the prompt with each call, "
+                                    "retrying in %.0fs.", e, delay)
+                else:
+                    self._failed = True
+                    logging.warning("Gemini context caching is unavailable (%s); sending the prompt with each call.", e)
+            return self._name
@@ -0,0 +1,526 @@
+import asyncio
+import dataclasses
+import hmac
+import logging
+import os
+import secrets
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+from dataclasses import dataclass
+from typing import Mapping, Optional
+from googleapiclient.discovery import Resource
+from .calendar_client import execute
+from .calendar_tools import run_blocking
+from .event_store import EVENT_MIRROR_ENABLED, get_event_mirror, peek_event_mirror
+from .metrics import registry
+from .sessions import SESSION_REDIS_URL, SESSION_SQLITE_PATH
+
+# Calendar push notifications keep each active user's event mirror warm. The
+# first /chat request of a user opens an ``events.watch`` channel on their
+# primary calendar, pointing at CALENDAR_WEBHOOK_URL (the public address of
+# /calendar/notifications). Google then posts a notification whenever the
+# calendar changes.
+#
+# Channels are kept where sessions are (SESSION_REDIS_URL or
+# SESSION_SQLITE_PATH, else in this process), so with several workers there
+# is one channel per user, and whichever worker a notification reaches can
+# check it and count it against the user. A worker that has the user's
+# Calendar service also syncs their mirror in the background. Every worker's
+# mirror trusts itself for up to CALENDAR_WATCH_MAX_STALENESS seconds
+# (instead of EVENT_MIRROR_MAX_STALENESS) only while that count hasn't moved
+# since its last sync, and syncs on the next read once it has.
+#
+# Channels live CALENDAR_WATCH_TTL seconds; one is replaced when it has less
+# than CALENDAR_WATCH_RENEW_BEFORE left (Google channels can't be extended),
+# unless nobody has used it for CALENDAR_WATCH_IDLE seconds. A failed open is
+# retried with exponential backoff. A worker stops a user's channel when the
+# user leaves its user cache, or on shutdown, unless another worker used it
+# since. Without CALENDAR_WEBHOOK_URL (or with the mirror off) push is off.
+CALENDAR_WEBHOOK_URL = os.getenv("CALENDAR_WEBHOOK_URL")
+PUSH_ENABLED = bool(CALENDAR_WEBHOOK_URL) and EVENT_MIRROR_ENABLED
+CALENDAR_WATCH_TTL = float(os.getenv("CALENDAR_WATCH_TTL", "86400"))
+CALENDAR_WATCH_RENEW_BEFORE = float(os.getenv("CALENDAR_WATCH_RENEW_BEFORE", "3600"))
+CALENDAR_WATCH_CHECK_INTERVAL = float(os.getenv("CALENDAR_WATCH_CHECK_INTERVAL", "60"))
+CALENDAR_WATCH_MAX_STALENESS = float(os.getenv("CALENDAR_WATCH_MAX_STALENESS", "600"))
+CALENDAR_WATCH_IDLE = float(os.getenv("CALENDAR_WATCH_IDLE", os.getenv("USER_CACHE_TTL", "3600")))
+CALENDAR_WATCH_RETRY_BASE = float(os.getenv("CALENDAR_WATCH_RETRY_BASE", "30"))
+CALENDAR_WATCH_RETRY_MAX = float(os.getenv("CALENDAR_WATCH_RETRY_MAX", "3600"))
+
+notifications = registry.counter("calendar_push_notifications_total", "Calendar push notifications received, by resource state and outcome.")
+channel_events = registry.counter("calendar_watch_channels_total", "Calendar watch channels opened, renewed, stopped or failed to open.")
+refreshes = registry.counter("calendar_push_refreshes_total", "Background mirror syncs run for push notifications.")
+
+@dataclass
+class Channel:
+    """A user's watch channel, as every worker sees it."""
+    # The user's key (a hash of their token, see oauth.py)
+    user: str
+    id: str
+    token: str
+    resource_id: str
+    # POSIX time, seconds
+    expiration: float
+    # Notifications received for the calendar; carried over when renewed
+    changes: int = 0
+    # POSIX time the user was last active, on any worker
+    last_seen: float = 0.0
+
+class MemoryChannelStore:
+    """Channels known to this process only; enough for a single worker."""
+
+    def __init__(self):
+        self._by_user: dict[str, Channel] = {}
+        self._users_by_id: dict[str, str] = {}
+        self._lock = threading.Lock()
+
+    def _current(self, user: str) -> Optional[Channel]:
+        channel = self._by_user.get(user)
+        if channel is not None and channel.expiration <= time.time():
+            del self._by_user[user]
+            self._users_by_id.pop(channel.id, None)
+            return None
+        return channel
+
+    def get(self, user: str) -> Optional[Channel]:
+        with self._lock:
+            channel = self._current(user)
+            return dataclasses.replace(channel) if channel is not None else None
+
+    def find(self, channel_id: str) -> Optional[Channel]:
+        with self._lock:
+            user = self._users_by_id.get(channel_id)
+            channel = self._current(user) if user is not None else None
+            return dataclasses.replace(channel) if channel is not None and channel.id == channel_id else None
+
+    def publish(self, channel: Channel, replaces: Optional[str]) -> bool:
+        """Makes ``channel`` the user's, if theirs is still ``replaces``."""
+        with self._lock:
+            current = self._current(channel.user)
+            if (current.id if current is not None else None) != replaces:
+                return False
+            if current is not None:
+                channel = dataclasses.replace(channel, changes=current.changes,
+                                              last_seen=max(current.last_seen, channel.last_seen))
+                del self._users_by_id[current.id]
+            self._by_user[channel.user] = channel
+            self._users_by_id[channel.id] = channel.user
+            return True
+
+    def remove(self, user: str, channel_id: str) -> bool:
+        with self._lock:
+            current = self._current(user)
+            if current is None or current.id != channel_id:
+                return False
+            del self._by_user[user]
+            del self._users_by_id[channel_id]
+            return True
+
+    def changed(self, user: str):
+        with self._lock:
+            current = self._current(user)
+            if current is not None:
+                current.changes += 1
+
+    def touch(self, user: str, now: float) -> Optional[Channel]:
+        """Records that the user is active; returns their channel."""
+        with self._lock:
+            current = self._current(user)
+            if current is None:
+                return None
+            current.last_seen = max(current.last_seen, now)
+            return dataclasses.replace(current)
+
+class SQLiteChannelStore:
+    """Channels in a table of the sessions' SQLite file, seen by every worker on the machine."""
+
+    COLUMNS = "user, id, token, resource_id, expiration, changes, last_seen"
+
+    def __init__(self, path: str):
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS watch_channels (user TEXT PRIMARY KEY, id TEXT UNIQUE, token TEXT, "
+                               "resource_id TEXT, expiration REAL, changes INTEGER, last_seen REAL)")
+
+    def _select(self, column: str, value: str) -> Optional[Channel]:
+        with self._lock:
+            row = self._conn.execute(f"SELECT {self.COLUMNS} FROM watch_channels WHERE {column} = ? AND expiration > ?",
+                                     (value, time.time())).fetchone()
+        return Channel(*row) if row is not None else None
+
+    def get(self, user: str) -> Optional[Channel]:
+        return self._select("user", user)
+
+    def find(self, channel_id: str) -> Optional[Channel]:
+        return self._select("id", channel_id)
+
+    def publish(self, channel: Channel, replaces: Optional[str]) -> bool:
+        """Makes ``channel`` the user's, if theirs is still ``replaces``."""
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM watch_channels WHERE expiration <= ?", (time.time(),))
+            if replaces is None:
+                cursor = self._conn.execute(f"INSERT OR IGNORE INTO watch_channels ({self.COLUMNS}) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                                            dataclasses.astuple(channel))
+            else:
+                cursor = self._conn.execute(
+                    "UPDATE watch_channels SET id = ?, token = ?, resource_id = ?, expiration = ?, last_seen = MAX(last_seen, ?) "
+                    "WHERE user = ? AND id = ?",
+                    (channel.id, channel.token, channel.resource_id, channel.expiration, channel.last_seen, channel.user, replaces))
+            return cursor.rowcount == 1
+
+    def remove(self, user: str, channel_id: str) -> bool:
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM watch_channels WHERE user = ? AND id = ?", (user, channel_id)).rowcount == 1
+
+    def changed(self, user: str):
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE watch_channels SET changes = changes + 1 WHERE user = ?", (user,))
+
+    def touch(self, user: str, now: float) -> Optional[Channel]:
+        """Records that the user is active; returns their channel."""
+        with self._lock, self._conn:
+            self._conn.execute("UPDATE watch_channels SET last_seen = MAX(last_seen, ?) WHERE user = ?", (now, user))
+        return self.get(user)
+
+class RedisChannelStore:
+    """Channels in Redis, shared by all workers: a hash per user, and the
+    user's key under each channel id."""
+
+    # Updates a field of the user's hash only if it still holds a channel
+    _UPDATE = """
+    if redis.call('HEXISTS', KEYS[1], 'id') == 0 then return 0 end
+    if ARGV[1] == 'incr' then return redis.call('HINCRBY', KEYS[1], 'changes', 1) end
+    local seen = tonumber(redis.call('HGET', KEYS[1], 'last_seen') or '0')
+    if tonumber(ARGV[2]) > seen then redis.call('HSET', KEYS[1], 'last_seen', ARGV[2]) end
+    return 1
+    """
+
+    def __init__(self, url: str, prefix: str = "calendar-watch:"):
+        import redis
+        self._redis = redis.Redis.from_url(url, decode_responses=True)
+        self._watch_error = redis.WatchError
+        self._update = self._redis.register_script(self._UPDATE)
+        self.prefix = prefix
+
+    def _user_key(self, user: str) -> str:
+        return f"{self.prefix}user:{user}"
+
+    def _channel_key(self, channel_id: str) -> str:
+        return f"{self.prefix}channel:{channel_id}"
+
+    @staticmethod
+    def _channel(user: str, fields: dict) -> Optional[Channel]:
+        if "id" not in fields or float(fields["expiration"]) <= time.time():
+            return None
+        return Channel(user, fields["id"], fields["token"], fields["resource_id"], float(fields["expiration"]),
+                       int(fields.get("changes", 0)), float(fields.get("last_seen", 0)))
+
+    def get(self, user: str) -> Optional[Channel]:
+        return self._channel(user, self._redis.hgetall(self._user_key(user)))
+
+    def find(self, channel_id: str) -> Optional[Channel]:
+        user = self._redis.get(self._channel_key(channel_id))
+        channel = self.get(user) if user is not None else None
+        return channel if channel is not None and channel.id == channel_id else None
+
+    def publish(self, channel: Channel, replaces: Optional[str]) -> bool:
+        """Makes ``channel`` the user's, if theirs is still ``replaces``."""
+        key = self._user_key(channel.user)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                current = self._channel(channel.user, pipe.hgetall(key))
+                if (current.id if current is not None else None) != replaces:
+                    return False
+                pipe.multi()
+                if current is None:
+                    pipe.delete(key)
+                    pipe.hset(key, mapping={"changes": channel.changes, "last_seen": channel.last_seen})
+                else:
+                    pipe.delete(self._channel_key(current.id))
+                    pipe.hset(key, "last_seen", max(current.last_seen, channel.last_seen))
+                pipe.hset(key, mapping={"id": channel.id, "token": channel.token, "resource_id": channel.resource_id,
+                                        "expiration": channel.expiration})
+                pipe.expireat(key, int(channel.expiration) + 1)
+                pipe.set(self._channel_key(channel.id), channel.user, exat=int(channel.expiration) + 1)
+                pipe.execute()
+                return True
+            except self._watch_error:
+                # Another worker changed the user's channel meanwhile
+                return False
+
+    def remove(self, user: str, channel_id: str) -> bool:
+        key = self._user_key(user)
+        with self._redis.pipeline() as pipe:
+            try:
+                pipe.watch(key)
+                if pipe.hget(key, "id") != channel_id:
+                    return False
+                pipe.multi()
+                pipe.delete(key, self._channel_key(channel_id))
+                pipe.execute()
+                return True
+            except self._watch_error:
+                return False
+
+    def changed(self, user: str):
+        self._update(keys=[self._user_key(user)], args=["incr", 0])
+
+    def touch(self, user: str, now: float) -> Optional[Channel]:
+        """Records that the user is active; returns their channel."""
+        self._update(keys=[self._user_key(user)], args=["seen", now])
+        return self.get(user)
+
+def create_channel_store():
+    """The channel store for the session backend configured by SESSION_*."""
+    if SESSION_REDIS_URL:
+        return RedisChannelStore(SESSION_REDIS_URL)
+    if SESSION_SQLITE_PATH:
+        return SQLiteChannelStore(SESSION_SQLITE_PATH)
+    return MemoryChannelStore()
+
+@dataclass
+class WatchedUser:
+    """What one worker keeps about a user whose calendar it watches."""
+    service: "weakref.ref[Resource]"
+    # POSIX time of this worker's last request for the user
+    last_seen: float = 0.0
+    opening: bool = False
+    # Failed opens in a row, and the monotonic time the next one may be tried
+    failures: int = 0
+    retry_at: float = 0.0
+    refreshing: bool = False
+    # A notification came in while a refresh was running
+    pending: bool = False
+
+class WatchChannels:
+    """This worker's side of the users' watch channels (kept in ``store``),
+    and the refreshes their notifications trigger.
+
+    Holds services weakly: a user whose service has been dropped is left to
+    ``forget``. Blocking API calls run on the calendar executor through
+    ``run_blocking``."""
+
+    def __init__(self, address: str, store=None, ttl: float = CALENDAR_WATCH_TTL,
+                 renew_before: float = CALENDAR_WATCH_RENEW_BEFORE, max_staleness: float = CALENDAR_WATCH_MAX_STALENESS,
+                 idle: float = CALENDAR_WATCH_IDLE, retry_base: float = CALENDAR_WATCH_RETRY_BASE,
+                 retry_max: float = CALENDAR_WATCH_RETRY_MAX):
+        self.address = address
+        self.store = store if store is not None else MemoryChannelStore()
+        self.ttl, self.renew_before, self.max_staleness, self.idle = ttl, renew_before, max_staleness, idle
+        self.retry_base, self.retry_max = retry_base, retry_max
+        self._users: dict[str, WatchedUser] = {}
+        # Keeps background tasks referenced until they finish
+        self._tasks: set[asyncio.Task] = set()
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def channel_for(self, user: str) -> Optional[Channel]:
+        return self.store.get(user)
+
+    def changes(self, user: str) -> Optional[int]:
+        """Notifications received for the user's calendar; None without a channel."""
+        try:
+            channel = self.store.get(user)
+        except Exception as e:
+            logging.warning("Could not read the Calendar watch channel (%s); the event mirror polls meanwhile.", e)
+            return None
+        return channel.changes if channel is not None else None
+
+    def open(self, service: Resource, user: str) -> Channel:
+        """Opens a channel on the user's primary calendar (blocking)."""
+        channel_id, token = str(uuid.uuid4()), secrets.token_urlsafe(32)
+        body = {"id": channel_id, "type": "web_hook", "address": self.address, "token": token,
+                "params": {"ttl": str(int(self.ttl))}}
+        # A channel id can only be used once, so a failed watch is not resent
+        response = execute(service, service.events().watch(calendarId='primary', body=body), idempotent=False)
+        expiration = int(response["expiration"]) / 1000 if response.get("expiration") else time.time() + self.ttl
+        return Channel(user, channel_id, token, response["resourceId"], expiration)
+
+    def stop(self, service: Resource, channel: Channel):
+        """Stops a channel with Google (blocking); nothing more is sent for it."""
+        execute(service, service.channels().stop(body={"id": channel.id, "resourceId": channel.resource_id}))
+        channel_events.inc(event="stopped")
+
+    def _spawn(self, coroutine):
+        task = asyncio.create_task(coroutine)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return task
+
+    def _stop_later(self, service: Resource, channel: Channel):
+        """Stops a channel in the background, or right away outside the event loop."""
+        async def stop():
+            try:
+                await run_blocking(service, lambda s: self.stop(s, channel))
+            except Exception as e:
+                logging.warning("Could not stop Calendar watch channel %s (%s).", channel.id, e)
+
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            try:
+                self.stop(service, channel)
+            except Exception as e:
+                logging.warning("Could not stop Calendar watch channel %s (%s).", channel.id, e)
+            return None
+        return self._spawn(stop())
+
+    def watch(self, service: Resource, user: str):
+        """Makes sure the user has a channel that isn't about to expire,
+        opening one in the background if not, and points their mirror at it."""
+        now = time.time()
+        watched = self._users.get(user)
+        if watched is None or watched.service() is not service:
+            watched = self._users[user] = WatchedUser(weakref.ref(service))
+        watched.last_seen = now
+        mirror = get_event_mirror(service)
+        mirror.notifications = lambda: self.changes(user)
+        mirror.max_staleness = self.max_staleness
+        channel = self.store.touch(user, now)
+        if channel is not None and channel.expiration - now > self.renew_before:
+            return None
+        return self._ensure(user, watched, service, channel)
+
+    def _ensure(self, user: str, watched: WatchedUser, service: Resource, old: Optional[Channel]):
+        if watched.opening or time.monotonic() < watched.retry_at:
+            return None
+        watched.opening = True
+        return self._spawn(self._replace(user, watched, service, old))
+
+    async def _replace(self, user: str, watched: WatchedUser, service: Resource, old: Optional[Channel]):
+        try:
+            try:
+                channel = await run_blocking(service, self.open, user)
+            except Exception as e:
+                delay = min(self.retry_max, self.retry_base * 2 ** watched.failures)
+                watched.failures += 1
+                watched.retry_at = time.monotonic() + delay
+                channel_events.inc(event="failed")
+                logging.warning("Could not open a Calendar watch channel (%s); trying again in %.0fs.", e, delay)
+                return
+            watched.failures = 0
+            channel.last_seen = watched.last_seen
+            if self.store.publish(channel, old.id if old is not None else None):
+                channel_events.inc(event="renewed" if old is not None else "opened")
+                superseded = old
+            else:
+                # Another worker opened or renewed the user's channel first
+                superseded = channel
+            if superseded is not None:
+                task = self._stop_later(service, superseded)
+                if task is not None:
+                    await task
+        finally:
+            watched.opening = False
+
+    def notify(self, headers: Mapping[str, str]) -> int:
+        """Handles one notification; returns the HTTP status to answer with."""
+        channel = self.store.find(headers.get("x-goog-channel-id", ""))
+        state = headers.get("x-goog-resource-state", "")
+        if channel is None:
+            # Never opened, or stopped or replaced; Google doesn't retry a 404
+            notifications.inc(state=state, result="unknown_channel")
+            return 404
+        if not hmac.compare_digest(headers.get("x-goog-channel-token", ""), channel.token):
+            notifications.inc(state=state, result="bad_token")
+            return 403
+        if state == "sync":
+            # Sent once when the channel opens; nothing has changed
+            notifications.inc(state=state, result="ok")
+            return 200
+        # Every worker's mirror for the user syncs on its next read
+        self.store.changed(channel.user)
+        notifications.inc(state=state, result="ok")
+        watched = self._users.get(channel.user)
+        service = watched.service() if watched is not None else None
+        if service is not None:
+            # This worker has the user's service: bring its mirror up to date now
+            if watched.refreshing:
+                watched.pending = True
+            else:
+                watched.refreshing = True
+                self._spawn(self._refresh(watched, service))
+        return 200
+
+    async def _refresh(self, watched: WatchedUser, service: Resource):
+        """Syncs the mirror, once more if notifications arrived meanwhile."""
+        try:
+            while True:
+                watched.pending = False
+                await run_blocking(service, lambda s: get_event_mirror(s).sync(s, force=True))
+                refreshes.inc()
+                if not watched.pending:
+                    return
+        except Exception:
+            logging.exception("Background sync after a push notification failed.")
+        finally:
+            watched.refreshing = False
+
+    def forget(self, user: str, service: Optional[Resource] = None):
+        """Drops a user this worker no longer serves (e.g. evicted from the
+        user cache) and stops their channel, unless another worker has used
+        it since this one last did."""
+        watched = self._users.pop(user, None)
+        if watched is None:
+            return None
+        service = service or watched.service()
+        if service is None:
+            return None
+        mirror = peek_event_mirror(service)
+        if mirror is not None:
+            mirror.notifications = mirror.max_staleness = None
+        channel = self.store.get(user)
+        if channel is None or channel.last_seen > watched.last_seen or not self.store.remove(user, channel.id):
+            return None
+        return self._stop_later(service, channel)
+
+    async def renew_expiring(self):
+        """Replaces this worker's users' channels that are about to expire;
+        lets those nobody has used for ``idle`` seconds go instead."""
+        now = time.time()
+        tasks = []
+        for user, watched in list(self._users.items()):
+            service = watched.service()
+            if service is None:
+                self._users.pop(user, None)
+                continue
+            channel = self.store.get(user)
+            if channel is None or channel.expiration - now > self.renew_before:
+                continue
+            if now - channel.last_seen > self.idle:
+                task = self.forget(user, service)
+            else:
+                task = self._ensure(user, watched, service, channel)
+            if task is not None:
+                tasks.append(task)
+        await asyncio.gather(*tasks)
+
+    async def run_renewals(self, interval: float = CALENDAR_WATCH_CHECK_INTERVAL):
+        while True:
+            await asyncio.sleep(interval)
+            try:
+                await self.renew_expiring()
+            except Exception:
+                logging.exception("Renewing Calendar watch channels failed.")
+
+    async def close_all(self):
+        """Forgets every user, e.g. on shutdown."""
+        for task in list(self._tasks):
+            task.cancel()
+        stops = []
+        for user in list(self._users):
+            try:
+                task = self.forget(user)
+            except Exception as e:
+                logging.warning("Could not stop the Calendar watch channel of a user (%s).", e)
+                continue
+            if task is not None:
+                stops.append(task)
+        await asyncio.gather(*stops)
+
+watch_channels = WatchChannels(CALENDAR_WEBHOOK_URL, create_channel_store()) if PUSH_ENABLED else None
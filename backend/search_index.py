@@ -0,0 +1,192 @@
+import heapq
+import re
+from bisect import bisect_left, insort
+from collections import Counter, defaultdict
+from dataclasses import dataclass, field
+from typing import Any, Iterable, Optional
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+# How much a query word matching a document word counts, by how it matched
+EXACT, PREFIX, FUZZY = 1.0, 0.8, 0.6
+# Shorter query words only match exactly (prefix from 2 letters, typos from 4)
+MIN_PREFIX, MIN_FUZZY = 2, 4
+
+def tokenize(text: str) -> list[str]:
+    return _TOKEN.findall(text.lower())
+
+def _deletions(token: str) -> set[str]:
+    """The token with each single letter removed, for edit distance 1 lookups."""
+    return {token[:i] + token[i + 1:] for i in range(len(token))}
+
+@dataclass(slots=True)
+class SearchHit:
+    """A matching group (one event, or every instance of a recurring series)."""
+    group: str
+    score: float
+    # (start, end, payload) of the group's instances, ordered by start
+    instances: list = field(default_factory=list)
+
+    def next_instance(self, now: float) -> tuple:
+        """The first instance that hasn't ended, else the last one."""
+        for instance in self.instances:
+            if instance[1] > now:
+                return instance
+        return self.instances[-1]
+
+class SearchIndex:
+    """Inverted index for name lookups over documents of weighted text fields.
+
+    Every document belongs to a group (a recurring series, or just itself) and
+    searches return groups, so a weekly meeting is one hit, not fifty. Query
+    words match document words exactly, as a prefix ("stand" finds "standup")
+    or, failing those, with a typo ("stanup", "stnadup"): prefixes come from a sorted
+    vocabulary, typos from a map of single-letter deletions (symmetric
+    delete: a missing, extra, wrong or swapped letter), so a
+    lookup never scans the documents. Documents can be added and removed in
+    place; not thread-safe, the caller locks.
+    """
+
+    def __init__(self):
+        self._docs: dict[str, tuple[str, float, float, Any, dict[str, float]]] = {}
+        self._groups: dict[str, dict[str, tuple[float, float, Any]]] = {}
+        # Per group: how many of its documents have each (word, weight)
+        self._group_terms: dict[str, Counter] = {}
+        self._postings: dict[str, dict[str, float]] = {}
+        self._vocabulary: list[str] = []
+        self._deletes: dict[str, set[str]] = {}
+        # Per group: (ranking key by time, computed at, valid until)
+        self._time_keys: dict[str, tuple[tuple, float, float]] = {}
+
+    def __len__(self) -> int:
+        return len(self._docs)
+
+    @property
+    def groups(self) -> int:
+        return len(self._groups)
+
+    def add(self, doc_id: str, group: str, start: float, end: float, fields: Iterable[tuple[str, float]], payload: Any = None):
+        """Adds or replaces a document; ``fields`` are (text, weight) pairs."""
+        self.discard(doc_id)
+        terms: dict[str, float] = {}
+        for text, weight in fields:
+            for token in tokenize(text):
+                terms[token] = max(terms.get(token, 0.0), weight)
+        self._docs[doc_id] = (group, start, end, payload, terms)
+        self._groups.setdefault(group, {})[doc_id] = (start, end, payload)
+        self._time_keys.pop(group, None)
+        counts = self._group_terms.setdefault(group, Counter())
+        for term in terms.items():
+            counts[term] += 1
+            self._post(term[0], group, term[1])
+
+    def discard(self, doc_id: str):
+        doc = self._docs.pop(doc_id, None)
+        if doc is None:
+            return
+        group, _, _, _, terms = doc
+        instances = self._groups[group]
+        del instances[doc_id]
+        self._time_keys.pop(group, None)
+        counts = self._group_terms[group]
+        for token, weight in terms.items():
+            counts[token, weight] -= 1
+            if counts[token, weight] == 0:
+                del counts[token, weight]
+                remaining = [w for (t, w) in counts if t == token]
+                self._post(token, group, max(remaining) if remaining else 0.0)
+        if not instances:
+            del self._groups[group], self._group_terms[group]
+            self._time_keys.pop(group, None)
+
+    def discard_group(self, group: str):
+        """Removes every document of a group (a deleted recurring series)."""
+        for doc_id in list(self._groups.get(group, ())):
+            self.discard(doc_id)
+
+    def _post(self, token: str, group: str, weight: float):
+        """Sets the group's weight for a word; 0 removes it."""
+        postings = self._postings.get(token)
+        if weight:
+            if postings is None:
+                postings = self._postings[token] = {}
+                insort(self._vocabulary, token)
+                for variant in _deletions(token) | {token}:
+                    self._deletes.setdefault(variant, set()).add(token)
+            postings[group] = weight
+        elif postings is not None:
+            postings.pop(group, None)
+            if not postings:
+                del self._postings[token]
+                del self._vocabulary[bisect_left(self._vocabulary, token)]
+                for variant in _deletions(token) | {token}:
+                    self._deletes[variant].discard(token)
+                    if not self._deletes[variant]:
+                        del self._deletes[variant]
+
+    def _candidates(self, word: str) -> dict[str, float]:
+        """Vocabulary words a query word matches, with how well."""
+        matches = {}
+        if len(word) >= MIN_PREFIX:
+            i = bisect_left(self._vocabulary, word)
+            while i < len(self._vocabulary) and self._vocabulary[i].startswith(word):
+                matches[self._vocabulary[i]] = PREFIX
+                i += 1
+        if word in self._postings:
+            matches[word] = EXACT
+        # Typos only when the word isn't found as written
+        if not matches and len(word) >= MIN_FUZZY:
+            for variant in _deletions(word) | {word}:
+                for token in self._deletes.get(variant, ()):
+                    matches[token] = FUZZY
+        return matches
+
+    def search(self, query: str, now: float, limit: Optional[int] = 10) -> list[SearchHit]:
+        """Groups matching every query word that matches anything at all,
+        best first; ties go to the soonest upcoming, then the most recent."""
+        scores: Optional[dict[str, float]] = None
+        for word in dict.fromkeys(tokenize(query)):
+            word_scores: dict[str, float] = {}
+            for token, quality in self._candidates(word).items():
+                for group, weight in self._postings[token].items():
+                    word_scores[group] = max(word_scores.get(group, 0.0), quality * weight)
+            if not word_scores:
+                # Filler like "the" or "meeting" that no event mentions
+                continue
+            if scores is None:
+                scores = word_scores
+            else:
+                scores = {group: score + word_scores[group] for group, score in scores.items() if group in word_scores}
+        if not scores:
+            return []
+
+        # Scores take few distinct values, so only the best ones need ordering by time
+        by_score: dict[float, list[str]] = defaultdict(list)
+        for group, score in scores.items():
+            by_score[score].append(group)
+        best = []
+        for score in sorted(by_score, reverse=True):
+            ranked = [(self._time_key(group, now), group) for group in by_score[score]]
+            if limit is None:
+                best += [(score, group) for _, group in sorted(ranked)]
+                continue
+            best += [(score, group) for _, group in heapq.nsmallest(limit - len(best), ranked)]
+            if len(best) >= limit:
+                break
+        return [SearchHit(group, score, sorted(self._groups[group].values(), key=lambda instance: instance[0]))
+                for score, group in best]
+
+    def _time_key(self, group: str, now: float) -> tuple:
+        """Orders a group's upcoming instances soonest first, then past ones
+        most recent first. Kept until one of its upcoming instances ends."""
+        cached = self._time_keys.get(group)
+        if cached is not None and cached[1] <= now < cached[2]:
+            return cached[0]
+        instances = self._groups[group].values()
+        upcoming = [(start, end) for start, end, _ in instances if end > now]
+        if upcoming:
+            key, valid_until = (0, min(upcoming)[0]), min(end for _, end in upcoming)
+        else:
+            key, valid_until = (1, -max(start for start, _, _ in instances)), float("inf")
+        self._time_keys[group] = (key, now, valid_until)
+        return key
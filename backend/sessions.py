@@ -0,0 +1,112 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from dataclasses import dataclass, field
+from typing import Optional
+from .cache import TTLCache
+
+# Conversations are kept on the server so the client only sends the new
+# message and its session id. By default sessions live in this process (an LRU
+# of SESSION_CACHE_SIZE sessions, each kept SESSION_TTL seconds after its last
+# use). Set SESSION_SQLITE_PATH or SESSION_REDIS_URL to share them between
+# workers. Each turn rebuilds the graph's input from the session's history,
+# so the graph itself keeps no state between turns.
+SESSION_CACHE_SIZE = int(os.getenv("SESSION_CACHE_SIZE", "1024"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "86400"))
+SESSION_SQLITE_PATH = os.getenv("SESSION_SQLITE_PATH")
+SESSION_REDIS_URL = os.getenv("SESSION_REDIS_URL")
+
+@dataclass
+class Session:
+    """One conversation: its owner (a hash of the user's token) and the transcript."""
+    id: str
+    owner: str
+    history: list[dict] = field(default_factory=list)
+
+    def add_turn(self, message: str, response: str):
+        self.history.append({"role": "user", "content": message})
+        self.history.append({"role": "assistant", "content": response})
+
+    def to_json(self) -> str:
+        return json.dumps({"id": self.id, "owner": self.owner, "history": self.history})
+
+    @classmethod
+    def from_json(cls, value: str) -> "Session":
+        return cls(**json.loads(value))
+
+def new_session_id() -> str:
+    return uuid.uuid4().hex
+
+class MemorySessionStore:
+    """Sessions in this process, least recently used dropped first."""
+
+    def __init__(self, maxsize: int = SESSION_CACHE_SIZE, ttl: float = SESSION_TTL):
+        self._sessions = TTLCache(maxsize, ttl)
+
+    def get(self, session_id: str) -> Optional[Session]:
+        value = self._sessions.get(session_id)
+        # Stored serialized so callers never share a mutable session between requests
+        return Session.from_json(value) if value is not None else None
+
+    def save(self, session: Session):
+        self._sessions.set(session.id, session.to_json())
+
+    def delete(self, session_id: str):
+        self._sessions.pop(session_id)
+
+class SQLiteSessionStore:
+    """Sessions in a SQLite file, so every worker on the machine sees them."""
+
+    def __init__(self, path: str, ttl: float = SESSION_TTL):
+        self.ttl = ttl
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock, self._conn:
+            self._conn.execute("CREATE TABLE IF NOT EXISTS sessions (id TEXT PRIMARY KEY, body TEXT, updated_at REAL)")
+
+    def get(self, session_id: str) -> Optional[Session]:
+        with self._lock:
+            row = self._conn.execute("SELECT body, updated_at FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        if row is None or row[1] + self.ttl <= time.time():
+            return None
+        return Session.from_json(row[0])
+
+    def save(self, session: Session):
+        with self._lock, self._conn:
+            self._conn.execute("INSERT OR REPLACE INTO sessions (id, body, updated_at) VALUES (?, ?, ?)",
+                               (session.id, session.to_json(), time.time()))
+            self._conn.execute("DELETE FROM sessions WHERE updated_at <= ?", (time.time() - self.ttl,))
+
+    def delete(self, session_id: str):
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+class RedisSessionStore:
+    """Sessions in Redis (or anything speaking its protocol), shared by all workers."""
+
+    def __init__(self, url: str, ttl: float = SESSION_TTL, prefix: str = "session:"):
+        import redis
+        self._redis = redis.Redis.from_url(url)
+        self.ttl = int(ttl)
+        self.prefix = prefix
+
+    def get(self, session_id: str) -> Optional[Session]:
+        value = self._redis.get(self.prefix + session_id)
+        return Session.from_json(value) if value is not None else None
+
+    def save(self, session: Session):
+        self._redis.set(self.prefix + session.id, session.to_json(), ex=self.ttl)
+
+    def delete(self, session_id: str):
+        self._redis.delete(self.prefix + session_id)
+
+def create_session_store():
+    """The session store configured by the SESSION_* environment variables."""
+    if SESSION_REDIS_URL:
+        return RedisSessionStore(SESSION_REDIS_URL)
+    if SESSION_SQLITE_PATH:
+        return SQLiteSessionStore(SESSION_SQLITE_PATH)
+    return MemorySessionStore()
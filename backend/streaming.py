@@ -0,0 +1,88 @@
+import json
+import re
+
+# The agent answers with a JSON blob like
+#   {"action": "Final Answer", "action_input": "You have 3 meetings today..."}
+# FinalAnswerStreamParser reads the model output as it streams in and hands
+# back the text of the answer as soon as each piece of it arrives, so the user
+# doesn't wait for the whole blob to be generated and parsed.
+_FINAL_ANSWER_START = re.compile(r'"action"\s*:\s*"Final Answer"\s*,\s*"action_input"\s*:\s*"')
+_ESCAPES = {'"': '"', '\\': '\\', '/': '/', 'b': '\b', 'f': '\f', 'n': '\n', 'r': '\r', 't': '\t'}
+
+class FinalAnswerStreamParser:
+    """Incrementally extracts the ``action_input`` string of a Final Answer.
+
+    ``feed`` takes the next chunk of model output and returns the newly decoded
+    answer text (often ""). Tool calls, answers that aren't a JSON string and
+    output that doesn't follow the format yield nothing; the complete answer
+    still arrives once the agent step is parsed.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._pos = -1  # where the answer string continues, once found
+        self.done = False
+
+    def feed(self, chunk: str) -> str:
+        if self.done:
+            return ""
+        self._buffer += chunk
+        if self._pos < 0:
+            match = _FINAL_ANSWER_START.search(self._buffer)
+            if not match:
+                return ""
+            self._pos = match.end()
+        return self._decode()
+
+    def _decode(self) -> str:
+        out = []
+        buffer, i = self._buffer, self._pos
+        while i < len(buffer):
+            char = buffer[i]
+            if char == '"':
+                self.done = True
+                i += 1
+                break
+            if char != '\\':
+                out.append(char)
+                i += 1
+                continue
+            # An escape sequence; wait for the rest of it if it was split between chunks
+            if i + 1 >= len(buffer):
+                break
+            code = buffer[i + 1]
+            if code == 'u':
+                if i + 6 > len(buffer):
+                    break
+                try:
+                    code_point = int(buffer[i + 2:i + 6], 16)
+                    if 0xD800 <= code_point <= 0xDBFF:
+                        # A character outside the BMP is written as a pair of escapes
+                        if i + 12 > len(buffer):
+                            break
+                        out.append(json.loads(f'"{buffer[i:i + 12]}"'))
+                        i += 12
+                        continue
+                except ValueError:
+                    self.done = True  # not valid JSON; leave it to the full parse
+                    break
+                out.append(chr(code_point))
+                i += 6
+                continue
+            out.append(_ESCAPES.get(code, code))
+            i += 2
+        self._pos = i
+        return "".join(out)
+
+def message_text(content) -> str:
+    """The text of a message's content, which may be a list of parts."""
+    if isinstance(content, str):
+        return content
+    return "".join(part if isinstance(part, str) else part.get("text", "") for part in content)
+
+class TextStreamParser:
+    """For the native tool-calling engine, where the answer is the message text
+    itself: ``feed`` returns each chunk's text, tool call chunks add nothing."""
+
+    def feed(self, chunk) -> str:
+        return message_text(chunk)
@@ -0,0 +1,48 @@
+import datetime
+
+# The current time and the dates that relative expressions resolve to, worked
+# out once per request in the user's timezone and sent with their message. The
+# model reads "next Friday" off the table instead of calling get_current_time
+# and doing date arithmetic itself.
+_WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+def _day(date: datetime.date) -> str:
+    return f"{date:%a} {date.isoformat()}"
+
+def _span(first: datetime.date, last: datetime.date) -> str:
+    return f"{_day(first)} to {_day(last)}"
+
+def _month_end(first: datetime.date) -> datetime.date:
+    return (first.replace(day=28) + datetime.timedelta(days=4)).replace(day=1) - datetime.timedelta(days=1)
+
+def relative_dates(today: datetime.date) -> list[tuple[str, str]]:
+    """(expression, resolved date or range) pairs for ``today``."""
+    one_day = datetime.timedelta(days=1)
+    monday = today - today.weekday() * one_day
+    saturday = monday + 5 * one_day
+    month = today.replace(day=1)
+    next_month = _month_end(month) + one_day
+    rows = [
+        ("today", _day(today)),
+        ("tomorrow", _day(today + one_day)),
+        ("day after tomorrow", _day(today + 2 * one_day)),
+        ("yesterday", _day(today - one_day)),
+        ("this week", _span(monday, monday + 6 * one_day)),
+        ("next week", _span(monday + 7 * one_day, monday + 13 * one_day)),
+        ("last week", _span(monday - 7 * one_day, monday - one_day)),
+        ("this weekend", _span(saturday, saturday + one_day)),
+        ("this month", _span(month, _month_end(month))),
+        ("next month", _span(next_month, _month_end(next_month))),
+    ]
+    # "Friday" or "next Friday": the first one after today
+    for offset in range(1, 8):
+        day = today + offset * one_day
+        rows.append((f"{_WEEKDAYS[day.weekday()]} (coming)", _day(day)))
+    return rows
+
+def render_time_context(now: datetime.datetime, timezone: str) -> str:
+    """The block put in front of the user's message."""
+    lines = [f"Current time: {now.isoformat(timespec='minutes')} ({now:%A}), timezone {timezone}.",
+             "Relative dates:"]
+    lines += [f"- {expression}: {resolved}" for expression, resolved in relative_dates(now.date())]
+    return "\n".join(lines)
@@ -0,0 +1,143 @@
+"""The JSON-blob agent vs. native tool calling, on the same scripted tasks.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_agent_engines
+
+Each task is a fixed sequence of decisions (tool calls, then an answer) that
+``ScriptedChatModel`` replays in both formats: as JSON blobs in the reply text
+for the "json" engine, and as structured tool calls for the "tools" engine.
+For each engine the script reports prompt tokens per task (system prompt,
+history, scratchpad and, for tool calling, the function declarations, about
+four characters a token), model calls per task, parse failures and tasks
+that reached their intended answer. It also shows the fixed part of each
+prompt: the JSON engine describes the tools in its long system prompt without
+their arguments, while tool calling sends a short prompt plus a declaration
+with the argument schema of every tool. Declarations are counted as compact
+JSON, which somewhat overstates the Optional fields Gemini receives as
+``nullable``.
+
+Decisions are identical, so token and step counts compare the formats alone.
+Parse failures come from two scripted JSON-mode replies with mistakes that
+free-form JSON invites (a trailing comma, prose in front of the blob); in
+tool mode the same decisions arrive as structured calls. They show what a
+slip costs each engine, not how often Gemini makes one.
+"""
+import asyncio
+import datetime
+import json
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+os.environ["EVENT_MIRROR"] = "false"
+
+from langchain_core.messages import AIMessage
+from langchain_core.utils.function_calling import convert_to_openai_tool
+
+from backend.agent_graph import PARALLEL_TOOL_CALLS_PROMPT, SYSTEM_PROMPT, TOOL_CALLING_PROMPT, create_agent_graph, render_json_prompt, tools
+from backend.metrics import parse_failures
+from benchmarks.fakes import FakeCalendarService, ScriptedChatModel
+
+START = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _iso(days: float) -> str:
+    return (START + datetime.timedelta(days=days)).isoformat()
+
+
+# message -> decisions; a decision is a list of (tool, args) calls or the answer text
+TASKS = {
+    "When is my next design review?": [
+        [("search_events", {"query": "Design review"})],
+        "Your next design review is on Tuesday at 10:00.",
+    ],
+    "What do I have next Monday?": [
+        [("list_events", {"start": _iso(3), "end": _iso(4)})],
+        "Next Monday you have standup at 09:30 and a 1:1 with Priya at 15:00.",
+    ],
+    "Book a 30 minute sync with Priya tomorrow": [
+        [("find_free_slots", {"duration_minutes": 30, "start": _iso(1), "end": _iso(2), "max_results": 1})],
+        [("create_event", {"summary": "Sync with Priya", "start": _iso(1.4), "end": _iso(1.42),
+                           "attendees": ["priya@example.com"]})],
+        "Booked a 30 minute sync with Priya tomorrow at 09:36.",
+    ],
+    "Move my standup to 11am": [
+        [("search_events", {"query": "Standup"})],
+        [("update_event", {"event_id": "evt3", "start": _iso(1.458), "end": _iso(1.48)})],
+        "Your standup now starts at 11:00.",
+    ],
+    "Cancel everything on Friday and tell me what is left next week": [
+        [("list_events", {"start": _iso(5), "end": _iso(6)}), ("list_events", {"start": _iso(7), "end": _iso(14)})],
+        [("bulk_delete_events", {"event_ids": ["evt5", "evt9"]})],
+        "Cancelled your two Friday meetings. Next week you still have 21 events.",
+    ],
+}
+
+# JSON-mode replies with a malformed blob: (task, decision index) -> raw reply
+JSON_SLIPS = {
+    ("Move my standup to 11am", 1):
+        '```json\n{"action": "update_event", "action_input": {"event_id": "evt3", "start": "%s", "end": "%s",}}\n```'
+        % (_iso(1.458), _iso(1.48)),
+    ("Cancel everything on Friday and tell me what is left next week", 1):
+        'I found two meetings on Friday, deleting them now. {"action": "bulk_delete_events", '
+        '"action_input": {"event_ids": ["evt5", "evt9"]}}',
+}
+
+
+def json_reply(message: str, step: int, decision, slips: dict = JSON_SLIPS) -> str:
+    if (message, step) in slips:
+        return slips[message, step]
+    if isinstance(decision, str):
+        blob = {"action": "Final Answer", "action_input": decision}
+    elif len(decision) == 1:
+        blob = {"action": decision[0][0], "action_input": decision[0][1]}
+    else:
+        blob = [{"action": tool, "action_input": args} for tool, args in decision]
+    return "```json\n" + json.dumps(blob, indent=2) + "\n```"
+
+
+def tools_reply(message: str, step: int, decision) -> AIMessage:
+    if isinstance(decision, str):
+        return AIMessage(content=decision)
+    return AIMessage(content="", tool_calls=[
+        {"name": tool, "args": args, "id": f"call_{step}_{i}"} for i, (tool, args) in enumerate(decision)
+    ])
+
+
+async def _run(engine: str) -> dict:
+    make_reply = json_reply if engine == "json" else tools_reply
+    model = ScriptedChatModel(scripts={
+        message: [make_reply(message, step, decision) for step, decision in enumerate(decisions)]
+        for message, decisions in TASKS.items()
+    })
+    graph = create_agent_graph(llm=model, engine=engine, fast_path=False).compile()
+    completed = 0
+    for message, decisions in TASKS.items():
+        service = FakeCalendarService(size=200, start=START)
+        state = {"input": message, "chat_history": [], "intermediate_steps": None}
+        result = await graph.ainvoke(state, config={"configurable": {"service": service}})
+        completed += result["agent_outcome"].return_values["output"] == decisions[-1]
+    return {"tokens": model.input_tokens, "calls": model.calls, "failures": parse_failures.value(engine=engine),
+            "completed": completed}
+
+
+def _tokens(text: str) -> int:
+    return (len(text) + 3) // 4
+
+
+def main() -> None:
+    json_prompt = _tokens(render_json_prompt(SYSTEM_PROMPT + PARALLEL_TOOL_CALLS_PROMPT, tools))
+    declarations = _tokens(json.dumps([convert_to_openai_tool(tool) for tool in tools], separators=(",", ":")))
+    print(f"{len(TASKS)} tasks, {sum(len(d) for d in TASKS.values())} decisions, "
+          f"{len(JSON_SLIPS)} malformed JSON-mode replies")
+    print(f"fixed prompt: json {json_prompt} tokens (instructions and tool list); "
+          f"tools {_tokens(TOOL_CALLING_PROMPT)} tokens of instructions + {declarations} of function declarations")
+    print(f"{'engine':<7} {'prompt tokens/task':>19} {'tokens/call':>12} {'calls/task':>11} {'parse failures':>15} {'completed':>10}")
+    for engine in ("json", "tools"):
+        result = asyncio.run(_run(engine))
+        print(f"{engine:<7} {result['tokens'] / len(TASKS):>19.0f} {result['tokens'] / result['calls']:>12.0f} "
+              f"{result['calls'] / len(TASKS):>11.2f} {result['failures']:>15.0f} {result['completed']:>7}/{len(TASKS)}")
+
+
+if __name__ == "__main__":
+    main()
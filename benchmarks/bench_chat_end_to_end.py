@@ -0,0 +1,129 @@
+"""End-to-end benchmark: /chat scenarios through FastAPI's test client, fully offline.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_chat_end_to_end [requests] [concurrency] [llm_latency_s] [calendar_latency_s]
+
+Every request goes through the real app (auth dependency aside), agent graph,
+tools and calendar layer. Gemini is replaced by ``ScriptedChatModel`` and each
+simulated user gets a ``FakeCalendarService``. For each scenario the script
+reports throughput, p50/p95/p99 latency, LLM calls per request and the peak
+memory allocated while it ran (tracemalloc, in a separate untimed pass).
+
+Scenarios:
+
+- agenda:   "what's on today?" (answered by the fast path, no LLM call)
+- lookup:   search_events, then the answer
+- overview: list_events and search_events in parallel, then the answer
+- booking:  find_free_slots, create_event, then the answer
+
+The LLM response cache is off so every turn reaches the model.
+"""
+import datetime
+import json
+import os
+import sys
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+os.environ["LLM_CACHE"] = "false"
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from backend import main as backend_main
+from backend.agent_graph import create_agent_graph
+from backend.oauth import get_google_calendar_service
+from benchmarks.fakes import FakeCalendarService, ScriptedChatModel
+
+USERS = 20
+EVENTS_PER_USER = 500
+START = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _blob(action: str, action_input) -> str:
+    return "```json\n" + json.dumps({"action": action, "action_input": action_input}) + "\n```"
+
+
+def _iso(days: float) -> str:
+    return (START + datetime.timedelta(days=days)).isoformat()
+
+
+SCENARIOS = {
+    "agenda": ("what's on today?", []),
+    "lookup": ("When is my next design review?", [
+        _blob("search_events", {"query": "Design review"}),
+        _blob("Final Answer", "Your next design review is on Tuesday at 10:00."),
+    ]),
+    "overview": ("Summarize my week and find my 1:1s", [
+        "```json\n" + json.dumps([
+            {"action": "list_events", "action_input": {"start": _iso(0), "end": _iso(7)}},
+            {"action": "search_events", "action_input": {"query": "1:1"}},
+        ]) + "\n```",
+        _blob("Final Answer", "You have 23 events this week, including three 1:1s with Priya on Monday, "
+                              "Wednesday and Friday. Thursday is the busiest day."),
+    ]),
+    "booking": ("Book a 30 minute sync with Priya tomorrow", [
+        _blob("find_free_slots", {"duration_minutes": 30, "start": _iso(1), "end": _iso(2), "max_results": 1}),
+        _blob("create_event", {"summary": "Sync with Priya", "start": _iso(1.4), "end": _iso(1.42),
+                               "attendees": ["priya@example.com"]}),
+        _blob("Final Answer", "Booked a 30 minute sync with Priya tomorrow."),
+    ]),
+}
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+def _post(client: TestClient, message: str, user: int) -> float:
+    t0 = time.perf_counter()
+    response = client.post("/chat", json={"message": message}, headers={"X-Bench-User": str(user)})
+    response.raise_for_status()
+    if '"response"' not in response.text:
+        raise RuntimeError(f"no answer in {response.text[:200]}")
+    return time.perf_counter() - t0
+
+
+def main(requests: int = 200, concurrency: int = 20, llm_latency: float = 0.3, calendar_latency: float = 0.02) -> None:
+    model = ScriptedChatModel(scripts={message: replies for message, replies in SCENARIOS.values() if replies},
+                              latency=llm_latency)
+    backend_main.compiled_graph = create_agent_graph(llm=model).compile()
+    services = [FakeCalendarService(size=EVENTS_PER_USER, latency=calendar_latency, seed=user, start=START)
+                for user in range(USERS)]
+
+    def calendar_service(request: Request):
+        return services[int(request.headers["X-Bench-User"])]
+
+    backend_main.app.dependency_overrides[get_google_calendar_service] = calendar_service
+    print(f"{requests} requests per scenario, {concurrency} concurrent, {USERS} users with {EVENTS_PER_USER} events, "
+          f"LLM latency {llm_latency}s, calendar latency {calendar_latency}s")
+    print(f"{'scenario':<10} {'req/s':>8} {'p50':>8} {'p95':>8} {'p99':>8} {'LLM calls':>10} {'peak MB':>8}")
+    with TestClient(backend_main.app) as client, ThreadPoolExecutor(concurrency) as pool:
+        def run(message: str) -> list[float]:
+            return list(pool.map(lambda i: _post(client, message, i % USERS), range(requests)))
+
+        for name, (message, _) in SCENARIOS.items():
+            calls_before = model.calls
+            t0 = time.perf_counter()
+            latencies = run(message)
+            wall = time.perf_counter() - t0
+            steps = (model.calls - calls_before) / requests
+            # tracemalloc slows everything down, so memory is measured in a second pass
+            tracemalloc.start()
+            run(message)
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            print(f"{name:<10} {requests / wall:>8.1f} {_percentile(latencies, 50):>7.2f}s {_percentile(latencies, 95):>7.2f}s "
+                  f"{_percentile(latencies, 99):>7.2f}s {steps:>10.2f} {peak / 2**20:>8.1f}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 200,
+         int(args[1]) if len(args) > 1 else 20,
+         float(args[2]) if len(args) > 2 else 0.3,
+         float(args[3]) if len(args) > 3 else 0.02)
@@ -0,0 +1,105 @@
+"""Benchmark: calendar reads answered live vs. from the synced event mirror.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_event_mirror [calendar_size] [calendar_latency_s]
+
+Replays a conversation's worth of list/search/availability reads over
+overlapping ranges and reports API calls and wall time for both paths. It then
+edits the fake calendar behind the mirror's back, expires the sync token, and
+checks that incremental and full (410 Gone) resyncs agree with the fake's events.
+"""
+import datetime
+import os
+import sys
+import tempfile
+import time
+
+from backend import calendar_tools, event_store
+from benchmarks.fakes import FakeCalendarService
+
+
+def _busy(service, start: str, end: str) -> list:
+    """What the check_availability tool reports as busy (conflicts only exist with the mirror)."""
+    return calendar_tools.check_availability(service, start, end)['busy']
+
+
+def _reads(start: datetime.datetime):
+    day = datetime.timedelta(days=1)
+    for offset in range(5):
+        yield calendar_tools.list_events, (start + offset * day).isoformat(), (start + (offset + 2) * day).isoformat()
+        yield _busy, (start + offset * day).isoformat(), (start + offset * day + datetime.timedelta(hours=1)).isoformat()
+        yield calendar_tools.search_events, "standup"
+
+
+def _replay(service, mirror_enabled: bool) -> tuple[float, list]:
+    calendar_tools.EVENT_MIRROR_ENABLED = mirror_enabled
+    results = []
+    t0 = time.perf_counter()
+    for func, *args in _reads(service.start):
+        results.append(func(service, *args))
+    return time.perf_counter() - t0, results
+
+
+def _check_consistency(service) -> None:
+    start, end = service.start.isoformat(), (service.start + datetime.timedelta(days=90)).isoformat()
+    mirror = event_store.get_event_mirror(service)
+
+    def mirrored_ids():
+        calendar_tools.EVENT_MIRROR_ENABLED = True
+        return {event['id'] for event in calendar_tools.list_events(service, start, end)}
+
+    def live_ids():
+        return {event['id'] for event in service.sorted_events()}
+
+    # Edits made elsewhere arrive with the next incremental sync
+    service.put(service.random_event())
+    service.remove(next(iter(mirror.events)))
+    mirror.sync(service, force=True)
+    assert mirrored_ids() == live_ids(), "incremental sync diverged from the live calendar"
+
+    # An expired sync token (410 Gone) falls back to a full sync
+    service.put(service.random_event())
+    service.expire_sync_tokens()
+    mirror.sync(service, force=True)
+    assert mirrored_ids() == live_ids(), "full resync after 410 diverged from the live calendar"
+
+    # Writes through calendar_tools show up in the mirror immediately
+    created = calendar_tools.create_event(service, "Mirror check", start, (service.start + datetime.timedelta(hours=1)).isoformat())
+    assert created['id'] in mirror.events
+    calendar_tools.delete_event(service, created['id'])
+    assert created['id'] not in mirror.events
+    print("consistency: incremental sync, 410 full resync and write-through all match the fake calendar")
+
+
+def _check_sqlite(size: int) -> None:
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "mirror.db")
+        service = FakeCalendarService(size=size)
+        first = event_store.EventMirror(event_store.SQLiteEventStore(path))
+        first.sync(service)
+        service.put(service.random_event())
+        calls = service.calls
+        # A new process picks up the stored sync token and only syncs the change
+        second = event_store.EventMirror(event_store.SQLiteEventStore(path))
+        second.sync(service)
+        assert second.events.keys() == {e['id'] for e in service.sorted_events()}
+        print(f"sqlite: restarted mirror resumed with {service.calls - calls} calls instead of a full sync")
+
+
+def main(size: int = 2000, latency: float = 0.05) -> None:
+    live_service = FakeCalendarService(size=size, latency=latency)
+    mirror_service = FakeCalendarService(size=size, latency=latency)
+    live_time, live_results = _replay(live_service, mirror_enabled=False)
+    mirror_time, mirror_results = _replay(mirror_service, mirror_enabled=True)
+    assert live_results == mirror_results, "mirror answers differ from the live API"
+    print(f"{size} events, {latency}s per API call, {len(live_results)} reads")
+    print(f"live   : {live_service.calls:3d} API calls  {live_time * 1e3:8.1f} ms")
+    print(f"mirror : {mirror_service.calls:3d} API calls  {mirror_time * 1e3:8.1f} ms (includes the initial full sync)")
+    _check_consistency(mirror_service)
+    _check_sqlite(size)
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 2000, float(args[1]) if len(args) > 1 else 0.05)
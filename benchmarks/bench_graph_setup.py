@@ -0,0 +1,93 @@
+"""Microbenchmark: per-request graph setup cost before and after compiling once.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_graph_setup [iterations]
+
+"Before" does what /chat used to on every request: it wraps each tool in a
+closure over the user's service and builds a new StructuredTool for it, then
+builds the LLM client, prompt and agent runnable around those tools and
+compiles the LangGraph graph. "After" reuses a graph compiled at startup and
+only builds the per-request run config.
+No network calls are made; a placeholder API key is used if none is set.
+"""
+import os
+import sys
+import time
+import statistics
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+
+from langchain.tools import StructuredTool
+
+from backend import agent_graph
+from backend.agent_graph import create_agent_graph
+
+
+def _closure_tools(service) -> list[StructuredTool]:
+    """The tools as they used to be built per request: one closure per tool,
+    capturing the user's service, wrapped in a new StructuredTool."""
+    config = {"configurable": {"service": service}}
+    per_request = []
+    for shared in agent_graph.tools:
+        def bind(coroutine):
+            async def call(**kwargs):
+                return await coroutine(config=config, **kwargs)
+            return call
+        per_request.append(StructuredTool.from_function(coroutine=bind(shared.coroutine), name=shared.name,
+                                                        description=shared.description, args_schema=shared.args_schema))
+    return per_request
+
+
+def _build_per_request(service):
+    """Builds and compiles a graph around per-request tools. The graph reads
+    the module's tool list, so it is swapped in for the build."""
+    shared, shared_by_name = agent_graph.tools, agent_graph.tools_by_name
+    agent_graph.tools = _closure_tools(service)
+    agent_graph.tools_by_name = {tool.name: tool for tool in agent_graph.tools}
+    try:
+        return create_agent_graph().compile()
+    finally:
+        agent_graph.tools, agent_graph.tools_by_name = shared, shared_by_name
+
+
+def _time_per_call(fn, iterations: int) -> list[float]:
+    samples = []
+    for _ in range(iterations):
+        t0 = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def _report(label: str, samples: list[float]) -> None:
+    samples = sorted(samples)
+    p95 = samples[int(0.95 * (len(samples) - 1))]
+    print(f"{label:<34} mean={statistics.mean(samples) * 1e3:9.3f} ms  "
+          f"median={statistics.median(samples) * 1e3:9.3f} ms  p95={p95 * 1e3:9.3f} ms")
+
+
+def main(iterations: int = 50) -> None:
+    service = object()  # stands in for the per-user calendar Resource
+
+    def before():
+        return _build_per_request(service), {"configurable": {"service": service}}
+
+    compiled_once = create_agent_graph().compile()
+
+    def after():
+        return compiled_once, {"configurable": {"service": service}}
+
+    before_samples = _time_per_call(before, iterations)
+    after_samples = _time_per_call(after, iterations)
+    print(f"Per-request setup over {iterations} iterations")
+    _report("before (tools + build + compile)", before_samples)
+    _report("after (compiled at startup)", after_samples)
+    # "After" is only building a dict, so a ratio would mean little; the
+    # time saved is what a request no longer pays
+    saved = statistics.mean(before_samples) - statistics.mean(after_samples)
+    print(f"setup time removed per request: {saved * 1e3:.2f} ms")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 50)
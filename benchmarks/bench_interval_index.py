@@ -0,0 +1,80 @@
+"""Benchmark: interval index vs. linear scans over synthetic calendars.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_interval_index [sizes...]
+
+For calendars of 10k-100k events (spread over ~5 years, some multi-day) it times
+building the index and answering overlap and busy-block queries for random
+one-day windows. A linear scan answers the same queries and its results are
+checked against the index.
+"""
+import random
+import sys
+import time
+
+from backend.intervals import IntervalIndex
+
+HOUR = 3600.0
+DAY = 24 * HOUR
+QUERIES = 200
+
+
+def _calendar(size: int, rng: random.Random) -> list[tuple[float, float, int]]:
+    span = 5 * 365 * DAY
+    intervals = []
+    for i in range(size):
+        start = rng.randrange(0, int(span / 1800)) * 1800.0
+        duration = rng.choice([1800.0, HOUR, HOUR, 2 * HOUR]) if rng.random() > 0.01 else rng.randint(1, 5) * DAY
+        intervals.append((start, start + duration, i))
+    return intervals
+
+
+def _linear_overlapping(intervals, start, end):
+    return sorted((s, p) for s, e, p in intervals if s < end and e > start)
+
+
+def _linear_busy_blocks(intervals, start, end):
+    blocks = []
+    for s, e in sorted((max(s, start), min(e, end)) for s, e, _ in intervals if s < end and e > start):
+        if blocks and s <= blocks[-1][1]:
+            blocks[-1] = (blocks[-1][0], max(blocks[-1][1], e))
+        else:
+            blocks.append((s, e))
+    return blocks
+
+
+def _timed(fn, windows):
+    t0 = time.perf_counter()
+    results = [fn(*window) for window in windows]
+    return (time.perf_counter() - t0) / len(windows), results
+
+
+def main(sizes: list[int]) -> None:
+    print(f"{'events':>8} {'build':>10} {'overlap':>12} {'linear':>12} {'busy blocks':>12} {'linear':>12}")
+    for size in sizes:
+        rng = random.Random(size)
+        intervals = _calendar(size, rng)
+        t0 = time.perf_counter()
+        index = IntervalIndex(intervals)
+        build = time.perf_counter() - t0
+
+        windows = []
+        for _ in range(QUERIES):
+            start = rng.randrange(0, 5 * 365) * DAY
+            windows.append((start, start + DAY))
+
+        overlap_time, found = _timed(index.overlapping, windows)
+        linear_time, expected = _timed(lambda s, e: _linear_overlapping(intervals, s, e), windows)
+        for positions, linear in zip(found, expected):
+            assert sorted((index.starts[i], index.payloads[i]) for i in positions) == linear
+        blocks_time, blocks = _timed(index.busy_blocks, windows)
+        linear_blocks_time, linear_blocks = _timed(lambda s, e: _linear_busy_blocks(intervals, s, e), windows)
+        assert blocks == linear_blocks
+
+        print(f"{size:>8} {build * 1e3:>8.1f}ms {overlap_time * 1e6:>10.1f}us {linear_time * 1e6:>10.1f}us "
+              f"{blocks_time * 1e6:>10.1f}us {linear_blocks_time * 1e6:>10.1f}us")
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or [10_000, 50_000, 100_000])
@@ -0,0 +1,87 @@
+"""What the static prompt prefix costs per model call, by PROMPT_CACHE mode.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_prompt_prefix
+
+Replays the scripted tasks of ``bench_agent_engines`` (without the malformed
+JSON replies) with both agent engines and each way of sending the system
+prompt and tool declarations:
+
+- off:      the prompt as written, sent on every call
+- local:    the minimized prompt, sent on every call
+- gemini:   the prefix held in a (fake) Gemini cached content; calls name it
+            and are charged its tokens as cache reads
+- small:    gemini mode with a prefix under the model's minimum cache size;
+            no cache is tried and the prompt is sent as written, like off
+
+For each it reports input tokens per call, how many of them still had to be
+processed as new input (not read from a cache), and the prefix tokens saved
+per call as counted by llm_prefix_tokens_saved_total. Token counts are
+``ScriptedChatModel`` estimates of about four characters a token. Every task
+must reach its intended answer in every mode.
+"""
+import asyncio
+import os
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+os.environ["EVENT_MIRROR"] = "false"
+
+from backend.agent_graph import create_agent_graph
+from backend.metrics import prefix_saved
+from benchmarks.bench_agent_engines import START, TASKS, json_reply, tools_reply
+from benchmarks.fakes import FakeCalendarService, FakeContextCacheClient, ScriptedChatModel
+
+MODES = ("off", "local", "gemini", "small")
+
+
+def _saved() -> dict[str, float]:
+    return {how: prefix_saved.value(how=how) for how in ("minimized", "cache_read")}
+
+
+async def _run(engine: str, mode: str) -> dict:
+    model = ScriptedChatModel(scripts={
+        message: [json_reply(message, step, decision, slips={}) if engine == "json" else tools_reply(message, step, decision)
+                  for step, decision in enumerate(decisions)]
+        for message, decisions in TASKS.items()
+    })
+    client = FakeContextCacheClient(model, min_tokens=10 ** 6 if mode == "small" else 0)
+    graph = create_agent_graph(llm=model, engine=engine, fast_path=False,
+                               prompt_cache="gemini" if mode == "small" else mode,
+                               context_cache_client=client).compile()
+    before = _saved()
+    completed = 0
+    for message, decisions in TASKS.items():
+        state = {"input": message, "chat_history": [], "intermediate_steps": None}
+        result = await graph.ainvoke(state, config={"configurable": {"service": FakeCalendarService(size=200, start=START)}})
+        completed += result["agent_outcome"].return_values["output"] == decisions[-1]
+    saved = {how: value - before[how] for how, value in _saved().items()}
+    return {"calls": model.calls, "tokens": model.input_tokens, "saved": saved, "completed": completed,
+            "caches": client.created, "attempts": client.attempts}
+
+
+def main() -> None:
+    print(f"{len(TASKS)} tasks per run")
+    print(f"{'engine':<7} {'mode':<9} {'input tokens/call':>18} {'new input/call':>15} "
+          f"{'prefix saved/call':>18} {'caches':>7} {'completed':>10}")
+    for engine in ("json", "tools"):
+        results = {}
+        for mode in MODES:
+            result = results[mode] = asyncio.run(_run(engine, mode))
+            calls = result["calls"]
+            new_input = result["tokens"] - result["saved"]["cache_read"]
+            print(f"{engine:<7} {mode:<9} {result['tokens'] / calls:>18.0f} {new_input / calls:>15.0f} "
+                  f"{sum(result['saved'].values()) / calls:>18.0f} {result['caches']:>7} "
+                  f"{result['completed']:>7}/{len(TASKS)}")
+            assert result["completed"] == len(TASKS), f"{engine}/{mode}: tasks did not reach their answer"
+        off, local, gemini, small = (results[mode] for mode in MODES)
+        assert local["tokens"] <= off["tokens"], "the minimized prompt is longer than the original"
+        assert gemini["caches"] == 1, "the prefix cache was not created once and reused"
+        assert gemini["tokens"] - gemini["saved"]["cache_read"] < local["tokens"], "cached calls still sent the prefix"
+        assert small["tokens"] == off["tokens"], "the too-small prefix was not sent as written"
+        assert small["attempts"] == 0, "a cache was tried for a prefix below the minimum size"
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main()
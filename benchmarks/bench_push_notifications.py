@@ -0,0 +1,178 @@
+"""Push notifications vs. polling: how fresh reads are and what they cost.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_push_notifications [edits] [calendar_latency_s]
+
+A local stand-in for Google: the app runs under FastAPI's test client with a
+``FakeCalendarService`` as the user's calendar. A fast-path /chat request
+(no LLM call) opens the watch channel, then the script changes the calendar
+``edits`` times (default 20) "elsewhere", as another client would, and each
+time reads the day through ``list_events``, the way the agent's read tools
+do. Three setups:
+
+- polling:  the mirror trusts itself for 0s, so every read syncs first
+- stale:    the mirror trusts itself for EVENT_MIRROR_MAX_STALENESS (30s)
+- push:     after each edit the fake posts the notifications Google would
+            send to /calendar/notifications; the mirror syncs in the
+            background and reads are served from memory
+
+For each it reports API calls and mean time per read, how many reads saw the
+edit, and for push the time from posting the notification to the mirror
+holding the edit. Reads that follow a change include rebuilding the mirror's
+interval index, so push reads cost more than stale ones.
+
+Also checks that the "sync" handshake changes nothing, that a forged token
+gets 403 and an unknown channel 404, that a channel near expiry is replaced
+(and the old one stopped) by the renewal loop, and that shutdown stops every
+channel and puts the mirror back on EVENT_MIRROR_MAX_STALENESS. How workers
+share channels is covered by tests/test_push.py.
+"""
+import dataclasses
+import datetime
+import os
+import sys
+import time
+from urllib.parse import urlsplit
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+os.environ["EVENT_MIRROR"] = "true"
+os.environ["CALENDAR_WEBHOOK_URL"] = "https://agent.example/calendar/notifications"
+os.environ["CALENDAR_WATCH_CHECK_INTERVAL"] = "0.05"
+
+from fastapi import Request
+from fastapi.testclient import TestClient
+
+from backend import event_store
+from backend import main as backend_main
+from backend.agent_graph import create_agent_graph
+from backend.calendar_tools import list_events
+from backend.event_store import get_event_mirror
+from backend.oauth import get_google_calendar_service
+from backend.push import watch_channels
+from benchmarks.fakes import FakeCalendarService, ScriptedChatModel
+
+START = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+EVENTS = 2000
+USER = "bench-user"
+
+
+def _wait(condition, timeout: float = 10.0) -> float:
+    """Seconds until ``condition()`` holds; fails after ``timeout``."""
+    t0 = time.perf_counter()
+    while not condition():
+        if time.perf_counter() - t0 > timeout:
+            raise AssertionError("timed out waiting")
+        time.sleep(0.0005)
+    return time.perf_counter() - t0
+
+
+def _deliver(client: TestClient, service: FakeCalendarService, state: str = "exists", **overrides) -> list[int]:
+    """Posts the notifications for the service's open channels; returns the statuses."""
+    return [client.post(urlsplit(address).path, headers={**headers, **overrides}).status_code
+            for address, headers in service.notifications(state)]
+
+
+def _edit(service: FakeCalendarService, n: int) -> str:
+    """Adds an event today, as a change made from another device would."""
+    begin = START + datetime.timedelta(hours=8, minutes=n)
+    event_id = service.next_id()
+    service.put({'id': event_id, 'status': 'confirmed', 'summary': f"Added elsewhere {n}",
+                 'start': {'dateTime': begin.isoformat()},
+                 'end': {'dateTime': (begin + datetime.timedelta(minutes=30)).isoformat()}})
+    return event_id
+
+
+def _read(service: FakeCalendarService, event_id: str) -> tuple[int, float, bool]:
+    """API calls, seconds and whether the edit was seen for one read of the day."""
+    calls, t0 = service.calls, time.perf_counter()
+    events = list_events(service, START.isoformat(), (START + datetime.timedelta(days=1)).isoformat())
+    return service.calls - calls, time.perf_counter() - t0, any(event['id'] == event_id for event in events)
+
+
+def _report(name: str, reads: list[tuple[int, float, bool]], notified: list[float] = ()):
+    calls = sum(r[0] for r in reads) / len(reads)
+    seconds = sum(r[1] for r in reads) / len(reads)
+    fresh = sum(r[2] for r in reads)
+    latency = f"{sum(notified) / len(notified) * 1e3:>8.1f}ms" if notified else f"{'-':>10}"
+    print(f"{name:<8} {calls:>10.2f} {seconds * 1e3:>10.2f}ms {fresh:>5}/{len(reads):<5} {latency}")
+    return calls, fresh
+
+
+def _polling(edits: int, latency: float, max_staleness: float) -> list[tuple[int, float, bool]]:
+    service = FakeCalendarService(size=EVENTS, latency=latency, start=START)
+    get_event_mirror(service).sync(service)
+    event_store.EVENT_MIRROR_MAX_STALENESS = max_staleness
+    try:
+        return [_read(service, _edit(service, n)) for n in range(edits)]
+    finally:
+        event_store.EVENT_MIRROR_MAX_STALENESS = float(os.getenv("EVENT_MIRROR_MAX_STALENESS", "30"))
+
+
+def main(edits: int = 20, latency: float = 0.02) -> None:
+    assert watch_channels is not None, "push notifications are off"
+    backend_main.compiled_graph = create_agent_graph(llm=ScriptedChatModel(scripts={})).compile()
+    service = FakeCalendarService(size=EVENTS, latency=latency, start=START)
+
+    def calendar_service(request: Request):
+        # What get_current_user would have set for a signed-in user
+        request.state.user_key = USER
+        return service
+
+    backend_main.app.dependency_overrides[get_google_calendar_service] = calendar_service
+    print(f"{edits} edits, {EVENTS} events, calendar latency {latency}s")
+    print(f"{'setup':<8} {'calls/read':>10} {'read time':>12} {'fresh':>11} {'notified→fresh':>12}")
+
+    polling = _report("polling", _polling(edits, latency, 0))
+    stale = _report("stale", _polling(edits, latency, event_store.EVENT_MIRROR_MAX_STALENESS))
+
+    with TestClient(backend_main.app) as client:
+        client.post("/chat", json={"message": "what's on today?"}).raise_for_status()
+        _wait(lambda: watch_channels.channel_for(USER) is not None)
+        channel = watch_channels.channel_for(USER)
+        mirror = get_event_mirror(service)
+        mirror.sync(service)
+        assert mirror.notifications is not None and mirror.max_staleness == watch_channels.max_staleness, \
+            "the open channel did not relax the mirror's staleness"
+
+        synced = mirror.last_sync
+        assert _deliver(client, service, "sync") == [200]
+        time.sleep(0.05)
+        assert mirror.last_sync == synced, "the sync handshake started a refresh"
+        assert _deliver(client, service, **{"X-Goog-Channel-Token": "forged"}) == [403], "a forged token was accepted"
+        assert _deliver(client, service, **{"X-Goog-Channel-ID": "no-such-channel"}) == [404], "an unknown channel was accepted"
+
+        reads, notified = [], []
+        for n in range(edits):
+            event_id = _edit(service, n)
+            t0 = time.perf_counter()
+            assert _deliver(client, service) == [200]
+            _wait(lambda: event_id in mirror.events)
+            notified.append(time.perf_counter() - t0)
+            reads.append(_read(service, event_id))
+        push = _report("push", reads, notified)
+
+        assert watch_channels.changes(USER) == edits, "notifications were not counted against the user"
+        watch_channels.store.publish(dataclasses.replace(channel, expiration=time.time() + 1), channel.id)
+        _wait(lambda: channel.id in service.stopped_channels)
+        renewed = watch_channels.channel_for(USER)
+        assert renewed is not None and renewed.id != channel.id, "the expiring channel was not replaced"
+        assert renewed.changes == edits, "renewal lost the notification count"
+        assert list(service.watches) == [renewed.id], "renewal left extra channels open"
+        assert _deliver(client, service) == [200], "the renewed channel does not take notifications"
+        assert client.post("/calendar/notifications", headers={"X-Goog-Channel-ID": channel.id}).status_code == 404, \
+            "the replaced channel still took notifications"
+        print(f"renewal  replaced channel {channel.id[:8]} before expiry and stopped it")
+    assert not service.watches and len(watch_channels) == 0, "shutdown left channels open"
+    assert mirror.notifications is None and mirror.max_staleness is None, "a closed channel still relaxed the mirror's staleness"
+    print(f"shutdown stopped {len(service.stopped_channels) - 1} channel(s)")
+
+    assert polling[1] == edits and push[1] == edits, "a read missed an edit"
+    assert push[0] < polling[0], "push reads still called the API"
+    assert stale[1] < edits, "the stale mirror saw every edit"
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 20, float(args[1]) if len(args) > 1 else 0.02)
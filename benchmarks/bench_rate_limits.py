@@ -0,0 +1,104 @@
+"""Calendar calls against a fake that enforces a request quota and answers 429.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_rate_limits [quota_per_second]
+
+The fake Calendar service admits ``quota_per_second`` requests per second and
+turns the rest away with 429 Rate Limit Exceeded, like Google does. Three
+scenarios, each checked so a regression fails loudly:
+
+- burst:    60 concurrent list_events calls for different days, first with the
+            client's rate limit and retries turned off (calls fail with 429),
+            then with them on (every call succeeds).
+- coalesce: 50 concurrent identical list_events calls; with request
+            coalescing they share one HTTP request.
+- bulk:     bulk_create_events of 120 events, where calls inside the batch get
+            429s of their own; those are sent again until all are created.
+
+The event mirror is off so every read goes to the (fake) API.
+"""
+import asyncio
+import datetime
+import os
+import sys
+import time
+
+os.environ["EVENT_MIRROR"] = "false"
+
+from googleapiclient.errors import HttpError
+
+from backend import calendar_client
+from backend.calendar_tools import alist_events, bulk_create_events, list_events, run_blocking
+from benchmarks.fakes import FakeCalendarService
+
+START = datetime.datetime.now(datetime.timezone.utc).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _day(offset: int) -> tuple[str, str]:
+    day = START + datetime.timedelta(days=offset)
+    return day.isoformat(), (day + datetime.timedelta(days=1)).isoformat()
+
+
+async def _gather(calls) -> tuple[int, int]:
+    results = await asyncio.gather(*calls, return_exceptions=True)
+    failed = sum(isinstance(result, HttpError) for result in results)
+    return len(results) - failed, failed
+
+
+def burst(quota: int) -> None:
+    for label, rate, max_retries in (("no limiter, no retries", 0, 0),
+                                     ("token bucket + backoff", quota, calendar_client.CALENDAR_MAX_RETRIES)):
+        calendar_client.CALENDAR_RATE_LIMIT, calendar_client.CALENDAR_RATE_BURST = rate, quota
+        saved_retries, calendar_client.CALENDAR_MAX_RETRIES = calendar_client.CALENDAR_MAX_RETRIES, max_retries
+        service = FakeCalendarService(size=300, latency=0.02, start=START, rate_limit=quota)
+        t0 = time.perf_counter()
+        ok, failed = asyncio.run(_gather(alist_events(service, *_day(day)) for day in range(60)))
+        wall = time.perf_counter() - t0
+        calendar_client.CALENDAR_MAX_RETRIES = saved_retries
+        print(f"burst    {label:<24} ok {ok:>3}  failed {failed:>3}  429s {service.rate_limited:>3}  "
+              f"requests {service.calls:>3}  {wall:5.2f}s")
+        if max_retries:
+            assert failed == 0, "calls failed despite retries"
+
+
+def coalesce() -> None:
+    window = _day(0)
+    for label, call in (("separate calls", lambda service: run_blocking(service, list_events, *window, None)),
+                        ("coalesced", lambda service: alist_events(service, *window))):
+        service = FakeCalendarService(size=300, latency=0.05, start=START)
+        t0 = time.perf_counter()
+        ok, failed = asyncio.run(_gather(call(service) for _ in range(50)))
+        wall = time.perf_counter() - t0
+        print(f"coalesce {label:<24} ok {ok:>3}  failed {failed:>3}  requests {service.calls:>3}  {wall:5.2f}s")
+        assert failed == 0
+    assert service.calls == 1, "identical in-flight calls were not coalesced"
+
+
+def bulk(quota: int) -> None:
+    calendar_client.CALENDAR_RATE_LIMIT, calendar_client.CALENDAR_RATE_BURST = quota, quota
+    service = FakeCalendarService(start=START, rate_limit=quota)
+    events = []
+    for i in range(120):
+        begin = START + datetime.timedelta(days=1, minutes=30 * i)
+        events.append({"summary": f"Session {i}", "start": begin.isoformat(),
+                       "end": (begin + datetime.timedelta(minutes=30)).isoformat()})
+    t0 = time.perf_counter()
+    results = bulk_create_events(service, events)
+    wall = time.perf_counter() - t0
+    created = sum(result["ok"] for result in results)
+    print(f"bulk     {'batch + per-call retries':<24} ok {created:>3}  failed {len(results) - created:>3}  "
+          f"429s {service.rate_limited:>3}  batches {service.batch_calls:>3}  {wall:5.2f}s")
+    assert created == len(events), "events were left out after rate limit errors"
+
+
+def main(quota: int = 10) -> None:
+    print(f"fake Calendar quota: {quota} requests per second")
+    burst(quota)
+    coalesce()
+    bulk(quota * 3)
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10)
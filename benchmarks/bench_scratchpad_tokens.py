@@ -0,0 +1,56 @@
+"""Measurement: list_events output size in the agent scratchpad, before and after.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_scratchpad_tokens [events_per_day]
+
+Builds a sample calendar of full event resources (etag, creator, organizer,
+attendees, reminders, conferenceData, ...) and renders one day and one week
+of events the old way (``json.dumps`` of the raw resources) and the new way
+(``fields=`` projection plus compact one-line events).
+
+Token counts are estimates: word pieces and punctuation, with long words split
+every 4 characters, which tracks SentencePiece/BPE counts closely enough to
+compare the two formats. No API calls are made.
+"""
+import datetime
+import json
+import re
+import sys
+
+from backend import calendar_tools
+from backend.event_store import compact_events
+from benchmarks.fakes import FakeCalendarService
+
+_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text: str) -> int:
+    return sum(max(1, (len(piece) + 3) // 4) for piece in _PIECES.findall(text))
+
+
+def _render(service, start: datetime.datetime, end: datetime.datetime) -> tuple[str, str]:
+    calendar_tools.EVENT_MIRROR_ENABLED = False
+    raw = service.events().list(calendarId='primary', timeMin=start.isoformat(), timeMax=end.isoformat(),
+                                singleEvents=True, orderBy='startTime').execute()['items']
+    before = json.dumps(raw)
+    after = compact_events(calendar_tools.list_events(service, start.isoformat(), end.isoformat()))
+    return before, after
+
+
+def main(events_per_day: int = 6) -> None:
+    service = FakeCalendarService(size=events_per_day * 90, rich=True, seed=1)
+    print(f"{'range':<8} {'events':>6} {'chars before':>13} {'chars after':>12} {'~tokens before':>15} {'~tokens after':>14} {'saved':>6}")
+    for label, days in (("1 day", 1), ("1 week", 7)):
+        end = service.start + datetime.timedelta(days=days)
+        before, after = _render(service, service.start, end)
+        events = after.count("\n")
+        saved = 1 - estimate_tokens(after) / estimate_tokens(before)
+        print(f"{label:<8} {events:>6} {len(before):>13} {len(after):>12} {estimate_tokens(before):>15} "
+              f"{estimate_tokens(after):>14} {saved:>6.0%}")
+    print("\nSample compact output:")
+    print("\n".join(after.splitlines()[:4]))
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 6)
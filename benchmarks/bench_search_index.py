@@ -0,0 +1,146 @@
+"""Name-to-ID lookups: local search index vs. a linear scan vs. the Calendar API.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_search_index [events]
+
+The fake calendar holds ``events`` one-off events (default 10000) with
+attendees, spread over the search horizon (90 days back, 365 ahead), plus a
+daily standup and weekly syncs as recurring series. The script reports:
+
+- build:   filling the index in bulk from the mirror, and adding or removing
+           one event in place
+- lookups: mean time per query for exact, prefix, typo, attendee and rarer
+           words,
+           with the search index, a substring scan over the mirrored events
+           (how the mirror searched before) and ``search_events`` through the
+           API (one round trip of ``API_LATENCY`` seconds, title match only),
+           plus how many results each found (at most 10). Index lookups cost
+           about a microsecond per matching event: words on an eighth of the
+           calendar take a millisecond or two, rarer names microseconds
+- lines:   what ``search_events`` gives the model for "daily standup": one
+           line with the series id from the index, against ten occurrences
+
+Checks that typos and attendees are found, that a series collapses to one
+line, that in-place updates show up at once and that a background refresh
+swaps in a rebuilt index.
+"""
+import datetime
+import os
+import sys
+import time
+
+os.environ["EVENT_MIRROR"] = "true"
+
+from backend import calendar_tools, event_store
+from backend.event_store import get_event_mirror
+from benchmarks.fakes import FakeCalendarService
+
+NOW = datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+API_LATENCY = 0.1
+QUERIES = {
+    "exact": "standup",
+    "prefix": "stand",
+    "typo": "stnadup",
+    "attendee": "priya",
+    "two words": "design review",
+    "rare word": "dentist",
+    "notes": "insurance",
+}
+REPEAT = 200
+
+
+def _calendar(size: int) -> FakeCalendarService:
+    past = NOW - datetime.timedelta(days=event_store.SEARCH_PAST_DAYS)
+    service = FakeCalendarService(start=past, rich=True)
+    days = int(event_store.SEARCH_PAST_DAYS + event_store.SEARCH_FUTURE_DAYS)
+    for _ in range(size):
+        service.put(service.random_event(days=days))
+    service.add_series("Daily standup", past + datetime.timedelta(hours=9), days, every=datetime.timedelta(days=1))
+    for team in ("platform", "mobile", "growth", "data"):
+        service.add_series(f"Weekly {team} sync", past + datetime.timedelta(hours=14), days // 7,
+                           attendees=[{"email": "priya@example.com"}, {"email": f"{team}-lead@example.com"}])
+    dentist = NOW + datetime.timedelta(days=12, hours=3)
+    service.put({'id': service.next_id(), 'status': 'confirmed', 'summary': "Dentist",
+                 'description': "Bring the insurance card", 'start': {'dateTime': dentist.isoformat()},
+                 'end': {'dateTime': (dentist + datetime.timedelta(hours=1)).isoformat()}})
+    return service
+
+
+def _linear_search(events: list[dict], query: str, now: datetime.datetime, limit: int = 10) -> list[dict]:
+    """The mirror's search before the index: a substring scan of every event."""
+    query = query.lower()
+    matches = []
+    for event in events:
+        text = " ".join(event.get(field, '') for field in ('summary', 'description', 'location')).lower()
+        if query in text:
+            start, end = event_store.event_bounds(event)
+            if end > now:
+                matches.append((start, event))
+    matches.sort(key=lambda item: item[0])
+    return [event for _, event in matches[:limit]]
+
+
+def _timed(fn, repeat: int = REPEAT) -> tuple[float, object]:
+    t0 = time.perf_counter()
+    for _ in range(repeat):
+        result = fn()
+    return (time.perf_counter() - t0) / repeat, result
+
+
+def main(size: int = 10000) -> None:
+    service = _calendar(size)
+    mirror = get_event_mirror(service)
+    mirror.sync(service)
+    total = len(mirror.events)
+
+    t0 = time.perf_counter()
+    index = mirror.search_index()
+    build = time.perf_counter() - t0
+    sample = dict(next(iter(mirror.events.values())), id="bench-added", summary="Quarterly budget review")
+    add, _ = _timed(lambda: mirror.apply(sample), 1000)
+    remove, _ = _timed(lambda: (mirror.apply(sample), mirror.remove("bench-added")), 1000)
+    print(f"{total} events ({len(index)} in the search horizon, {index.groups} groups)")
+    print(f"build    bulk fill {build * 1e3:.0f}ms   add/replace one {add * 1e6:.0f}us   "
+          f"add+remove one {remove * 1e6:.0f}us")
+
+    events = list(mirror.events.values())
+    now = NOW.timestamp()
+    print(f"{'lookup':<10} {'query':<14} {'index':>10} {'found':>6} {'scan':>10} {'found':>6} {'API':>10} {'found':>6}")
+    for kind, query in QUERIES.items():
+        indexed, hits = _timed(lambda: index.search(query, now, 10))
+        scanned, matches = _timed(lambda: _linear_search(events, query, NOW), 5)
+        api_service = FakeCalendarService(latency=API_LATENCY)
+        api_service.events_by_id, api_service.revisions = service.events_by_id, service.revisions
+        calendar_tools.EVENT_MIRROR_ENABLED = False
+        api, lines = _timed(lambda: calendar_tools.search_events(api_service, query), 1)
+        calendar_tools.EVENT_MIRROR_ENABLED = True
+        api_found = len(lines.splitlines()) - 1 if lines.startswith("id |") else 0
+        print(f"{kind:<10} {query:<14} {indexed * 1e6:>8.0f}us {len(hits):>6} {scanned * 1e6:>8.0f}us "
+              f"{len(matches):>6} {api * 1e3:>8.0f}ms {api_found:>6}")
+        assert hits, f"the index found nothing for {query!r}"
+
+    standup = calendar_tools.search_events(service, "daily standup")
+    assert standup.count("Daily standup") == 1 and "recurring" in standup, "the standup series was not collapsed"
+    before = _linear_search(events, "daily standup", NOW)
+    print(f"lines    'daily standup': {len(standup.splitlines()) - 1} with the index (the series id), "
+          f"{len(before)} occurrences from the scan")
+    print("  " + standup.splitlines()[1])
+
+    assert index.search("priya growth", now)[0].instances[0][2]['summary'] == "Weekly growth sync", \
+        "attendee search missed the recurring sync"
+    mirror.apply(dict(sample, id="bench-new", summary="Offsite planning"))
+    assert index.search("offsite", now)[0].group == "bench-new", "an added event was not searchable at once"
+    mirror.remove("bench-new")
+    assert not index.search("offsite", now), "a removed event was still found"
+    event_store.SEARCH_INDEX_REFRESH = 0
+    mirror.search_index()
+    deadline = time.monotonic() + 30
+    while mirror.search_index() is index and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert mirror.search_index() is not index, "the background refresh did not swap in a new index"
+    print("all checks passed")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
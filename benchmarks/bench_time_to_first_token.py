@@ -0,0 +1,68 @@
+"""Measurement: time until the user sees the answer start, per chat turn.
+
+Run from the repository root:
+
+    python -m benchmarks.bench_time_to_first_token [seconds_per_char]
+
+A scripted fake chat model stands in for Gemini and streams its reply one
+character at a time. The turn goes through /chat's event stream and the
+script reports when the first ``delta`` (streamed answer text) arrives and
+when the complete ``response`` arrives; before token streaming the user saw
+nothing until the latter.
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+os.environ["LLM_CACHE"] = "false"
+
+from langchain_core.language_models.fake_chat_models import FakeListChatModel
+
+from backend import agent_graph
+from benchmarks.fakes import FakeCalendarService
+
+ANSWER = ("Here is your week: Monday has the design review at 10:00 and a 1:1 with Priya at 15:00. "
+          "Tuesday is clear until the team lunch at 13:00. Wednesday and Thursday are busy with interviews "
+          "from 11:00 to 17:00. Friday only has the planning meeting at 09:30, so the afternoon is free.")
+SCRIPT = [
+    '```json\n{"action": "get_current_time", "action_input": {}}\n```',
+    '```json\n' + json.dumps({"action": "Final Answer", "action_input": ANSWER}) + '\n```',
+]
+
+
+def _install_fake_model(seconds_per_char: float) -> None:
+    class ScriptedModel(FakeListChatModel):
+        def __init__(self, **kwargs):
+            super().__init__(responses=SCRIPT, sleep=seconds_per_char)
+
+    agent_graph.ChatGoogleGenerativeAI = ScriptedModel
+
+
+async def _turn(main, service) -> tuple[float, float]:
+    request = main.ChatRequest(message="summarize my week")
+    session = main.load_session(None, "benchmark")
+    t0 = time.perf_counter()
+    first_delta = None
+    async for event in main.get_agent_response_stream(request, session, service):
+        data = json.loads(event[len("data: "):])
+        if "delta" in data and first_delta is None:
+            first_delta = time.perf_counter() - t0
+        if "response" in data:
+            return first_delta, time.perf_counter() - t0
+    raise RuntimeError("the turn ended without a response")
+
+
+def main(seconds_per_char: float = 0.003) -> None:
+    _install_fake_model(seconds_per_char)
+    from backend import main as backend_main
+    first_delta, complete = asyncio.run(_turn(backend_main, FakeCalendarService()))
+    print(f"fake model: {seconds_per_char * 1e3:.1f} ms per character, answer of {len(ANSWER)} characters")
+    print(f"first answer text (streamed): {first_delta:6.2f}s")
+    print(f"complete answer:              {complete:6.2f}s  (when anything was shown before streaming)")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else 0.003)
@@ -0,0 +1,643 @@
+"""In-memory stand-ins for the Google Calendar ``Resource`` used by calendar_tools.
+
+``FakeCalendarService`` mimics ``service.events().<method>(...).execute()``,
+``calendarList().list``, ``freebusy().query``, push channels and batch requests, including pagination
+(``maxResults``/``pageToken``) and incremental sync (``nextSyncToken``/
+``syncToken``, cancelled tombstones and 410 Gone once a token has been
+expired with ``expire_sync_tokens()``). ``execute`` sleeps for
+``latency`` seconds with a blocking ``time.sleep``, just like a real httplib2
+call would. With ``rate_limit`` set, requests over the quota fail with 429 the
+way Google turns them away; ``fail_next`` queues arbitrary errors.
+
+``ScriptedChatModel`` stands in for Gemini: pass it to ``create_agent_graph(llm=...)``.
+"""
+import asyncio
+import copy
+import datetime
+import itertools
+import json
+import random
+import threading
+import time
+from typing import Any, Iterator, AsyncIterator, Optional, Sequence, Union
+from zoneinfo import ZoneInfo
+
+import httplib2
+from googleapiclient.errors import HttpError
+from langchain_core.language_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage, HumanMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.utils.function_calling import convert_to_openai_tool
+from pydantic import Field, PrivateAttr
+
+DEFAULT_PAGE_SIZE = 250
+
+
+class FakeRequest:
+    def __init__(self, service, fn):
+        self._service = service
+        self._fn = fn
+
+    def execute(self):
+        self._service.calls += 1
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        self._service.admit()
+        return self._fn()
+
+
+def _parse_fields(fields: str) -> dict:
+    """Parses a partial-response field mask like ``a,b(c,d)`` into a nested dict."""
+    mask, stack, name = {}, [], ""
+    current = mask
+    for char in fields + ",":
+        if char in ",()":
+            if name.strip():
+                current[name.strip()] = {}
+            if char == "(":
+                stack.append(current)
+                current = current[name.strip()]
+            elif char == ")":
+                current = stack.pop()
+            name = ""
+        else:
+            name += char
+    return mask
+
+
+def project(value, fields):
+    """Applies a ``fields=`` mask the way the Google APIs do for partial responses."""
+    if not fields:
+        return value
+    mask = fields if isinstance(fields, dict) else _parse_fields(fields)
+    if isinstance(value, list):
+        return [project(item, mask) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: project(value[key], sub) if sub else value[key] for key, sub in mask.items() if key in value}
+
+
+def http_error(status: int, reason: str = "") -> HttpError:
+    return HttpError(httplib2.Response({'status': status}), reason.encode('utf-8'))
+
+
+def rate_limit_error(status: int = 429, reason: str = "rateLimitExceeded") -> HttpError:
+    """An error shaped like the Calendar API's usage limit responses."""
+    body = {'error': {'code': status, 'message': 'Rate Limit Exceeded',
+                      'errors': [{'domain': 'usageLimits', 'reason': reason, 'message': 'Rate Limit Exceeded'}]}}
+    return HttpError(httplib2.Response({'status': status}), json.dumps(body).encode('utf-8'))
+
+
+class FakeEvents:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, calendarId='primary', timeMin=None, timeMax=None, q=None, maxResults=None,
+             pageToken=None, syncToken=None, showDeleted=False, fields=None, **kwargs):
+        service = self._service
+
+        def run():
+            with service.lock:
+                if syncToken is not None:
+                    since = int(syncToken.removeprefix('sync'))
+                    if since < service.oldest_sync_revision:
+                        raise http_error(410, "Sync token is no longer valid, a full sync is required.")
+                    items = [e for e in service.sorted_events(include_deleted=True) if service.revisions[e['id']] > since]
+                else:
+                    items = [e for e in service.sorted_events(include_deleted=showDeleted) if _overlaps(e, timeMin, timeMax, ZoneInfo(service.timezone))]
+                    if q:
+                        items = [e for e in items if q.lower() in e.get('summary', '').lower()]
+                revision = service.revision
+            offset = int(pageToken) if pageToken else 0
+            page_size = maxResults or DEFAULT_PAGE_SIZE
+            result = {'timeZone': service.timezone, 'items': copy.deepcopy(items[offset:offset + page_size])}
+            if offset + page_size < len(items):
+                result['nextPageToken'] = str(offset + page_size)
+            elif not (timeMin or timeMax or q):
+                result['nextSyncToken'] = f"sync{revision}"
+            return project(result, fields)
+        return FakeRequest(service, run)
+
+    def get(self, calendarId='primary', eventId=None):
+        return FakeRequest(self._service, lambda: copy.deepcopy(self._service.series.get(eventId) or self._service.event(eventId)))
+
+    def insert(self, calendarId='primary', body=None):
+        def run():
+            event = dict(body, id=self._service.next_id())
+            event.setdefault('htmlLink', f"https://calendar.example/{event['id']}")
+            self._service.put(event)
+            return copy.deepcopy(event)
+        return FakeRequest(self._service, run)
+
+    def update(self, calendarId='primary', eventId=None, body=None):
+        def run():
+            self._service.event(eventId)
+            self._service.put(dict(body, id=eventId))
+            return copy.deepcopy(self._service.event(eventId))
+        return FakeRequest(self._service, run)
+
+    def patch(self, calendarId='primary', eventId=None, body=None):
+        def run():
+            if eventId in self._service.series:
+                return copy.deepcopy(self._service.patch_series(eventId, body))
+            event = dict(self._service.event(eventId), **body)
+            self._service.put(event)
+            return copy.deepcopy(event)
+        return FakeRequest(self._service, run)
+
+    def delete(self, calendarId='primary', eventId=None):
+        def run():
+            self._service.remove(eventId)
+            return ''
+        return FakeRequest(self._service, run)
+
+    def watch(self, calendarId='primary', body=None):
+        def run():
+            ttl = float(body.get('params', {}).get('ttl', 604800))
+            channel = dict(body, resourceId=f"resource-{calendarId}", resourceUri=f"https://calendar.example/{calendarId}/events",
+                           expiration=str(int((time.time() + ttl) * 1000)), messages=0)
+            with self._service.lock:
+                if body['id'] in self._service.watches:
+                    raise http_error(400, f"Channel id {body['id']} not unique")
+                self._service.watches[body['id']] = channel
+            return {key: channel[key] for key in ('id', 'resourceId', 'resourceUri', 'token', 'expiration')}
+        return FakeRequest(self._service, run)
+
+
+class FakeChannels:
+    def __init__(self, service):
+        self._service = service
+
+    def stop(self, body=None):
+        def run():
+            with self._service.lock:
+                channel = self._service.watches.get(body['id'])
+                if channel is None or channel['resourceId'] != body['resourceId']:
+                    raise http_error(404, f"Channel {body['id']} not found")
+                del self._service.watches[body['id']]
+                self._service.stopped_channels.append(body['id'])
+            return ''
+        return FakeRequest(self._service, run)
+
+
+class FakeBatch:
+    """Runs the added requests in one round trip, reporting each via the callback."""
+
+    def __init__(self, service, callback):
+        self._service = service
+        self._callback = callback
+        self._requests = []
+
+    def add(self, request, request_id=None, callback=None):
+        self._requests.append((request_id or str(len(self._requests)), request))
+
+    def execute(self):
+        self._service.calls += 1
+        self._service.batch_calls += 1
+        if self._service.latency:
+            time.sleep(self._service.latency)
+        for request_id, request in self._requests:
+            try:
+                # Each call in a batch counts against the quota on its own
+                self._service.admit()
+                response, exception = request._fn(), None
+            except HttpError as e:
+                response, exception = None, e
+            self._callback(request_id, response, exception)
+
+
+class FakeCalendars:
+    def __init__(self, service):
+        self._service = service
+
+    def get(self, calendarId='primary', fields=None):
+        return FakeRequest(self._service, lambda: project({'id': self._service.calendar_id, 'timeZone': self._service.timezone}, fields))
+
+
+class FakeCalendarList:
+    def __init__(self, service):
+        self._service = service
+
+    def list(self, minAccessRole=None, pageToken=None, **kwargs):
+        def run():
+            items = [{'id': self._service.calendar_id, 'primary': True, 'selected': True, 'accessRole': 'owner'}]
+            items += [{'id': calendar_id, 'selected': True, 'accessRole': 'owner'} for calendar_id in self._service.secondary_calendars]
+            return {'items': items}
+        return FakeRequest(self._service, run)
+
+
+class FakeFreeBusy:
+    def __init__(self, service):
+        self._service = service
+
+    def query(self, body=None):
+        service = self._service
+
+        def run():
+            time_min, time_max = _parse(body['timeMin']), _parse(body['timeMax'])
+            calendars = {}
+            for item in body['items']:
+                calendar_id = item['id']
+                if calendar_id in ('primary', service.calendar_id):
+                    tz = ZoneInfo(service.timezone)
+                    busy = [(_start(e, tz), _end(e, tz)) for e in service.sorted_events() if e.get('transparency') != 'transparent']
+                elif calendar_id in service.secondary_calendars or calendar_id in service.attendee_calendars:
+                    busy = [(_parse(s), _parse(e)) for s, e in
+                            service.secondary_calendars.get(calendar_id, service.attendee_calendars.get(calendar_id, []))]
+                else:
+                    calendars[calendar_id] = {'errors': [{'domain': 'global', 'reason': 'notFound'}], 'busy': []}
+                    continue
+                calendars[calendar_id] = {'busy': [
+                    {'start': max(s, time_min).isoformat(), 'end': min(e, time_max).isoformat()}
+                    for s, e in sorted(busy) if s < time_max and e > time_min
+                ]}
+            return {'timeMin': body['timeMin'], 'timeMax': body['timeMax'], 'calendars': calendars}
+        return FakeRequest(service, run)
+
+
+class FakeCalendarService:
+    """A fake Calendar ``Resource`` holding ``size`` synthetic events.
+
+    ``latency`` is the blocking delay, in seconds, added to every ``execute()``.
+    Changes made directly with ``put``/``remove`` play the part of edits made
+    elsewhere (another device, another user) and show up in incremental syncs.
+    ``secondary_calendars`` and ``attendee_calendars`` map calendar ids to
+    lists of busy ``(start, end)`` ISO strings served by freeBusy.
+    ``rate_limit`` allows that many requests per ``rate_window`` seconds and
+    answers the rest with 429; ``rate_limited`` counts them. ``timezone`` is
+    the primary calendar's timezone. ``add_series`` adds a recurring event,
+    listed as instances with a ``recurringEventId``; getting, patching or
+    deleting the series id acts on all of them, like the API.
+    ``events().watch`` opens push channels (kept in ``watches``) and
+    ``channels().stop`` closes them; ``notifications`` builds the requests
+    Google would post to the open channels, for a stand-in to deliver.
+    """
+
+    def __init__(self, size: int = 0, latency: float = 0.0, seed: int = 0, start: datetime.datetime = None,
+                 calendar_id: str = "user@example.com", secondary_calendars: dict = None, attendee_calendars: dict = None,
+                 rich: bool = False, rate_limit: int = 0, rate_window: float = 1.0, timezone: str = "UTC"):
+        self.latency = latency
+        self.timezone = timezone
+        self.rate_limit, self.rate_window = rate_limit, rate_window
+        self.rate_limited = 0
+        self._window = (0.0, 0)  # (start, requests admitted in it)
+        self._failures = []
+        self.rich = rich
+        self.secondary_calendars = secondary_calendars or {}
+        self.attendee_calendars = attendee_calendars or {}
+        self.calls = 0
+        self.batch_calls = 0
+        self.calendar_id = calendar_id
+        self.lock = threading.RLock()
+        self._ids = itertools.count(1)
+        self.events_by_id = {}
+        self.series = {}
+        self.watches = {}
+        self.stopped_channels = []
+        self.revisions = {}
+        self.revision = 0
+        self.oldest_sync_revision = 0
+        self.rng = random.Random(seed)
+        self.start = start or datetime.datetime.now(datetime.timezone.utc).replace(minute=0, second=0, microsecond=0)
+        for _ in range(size):
+            self.put(self.random_event())
+
+    def fail_next(self, *errors: HttpError):
+        """Makes the next requests fail with these errors, in order."""
+        with self.lock:
+            self._failures.extend(errors)
+
+    def admit(self):
+        """Turns the request away if an error is queued or the quota is used up."""
+        with self.lock:
+            if self._failures:
+                raise self._failures.pop(0)
+            if not self.rate_limit:
+                return
+            now = time.monotonic()
+            start, admitted = self._window
+            if now - start >= self.rate_window:
+                start, admitted = now, 0
+            if admitted >= self.rate_limit:
+                self.rate_limited += 1
+                raise rate_limit_error()
+            self._window = (start, admitted + 1)
+
+    def events(self):
+        return FakeEvents(self)
+
+    def calendars(self):
+        return FakeCalendars(self)
+
+    def calendarList(self):
+        return FakeCalendarList(self)
+
+    def freebusy(self):
+        return FakeFreeBusy(self)
+
+    def channels(self):
+        return FakeChannels(self)
+
+    def notifications(self, state: str = "exists") -> list[tuple[str, dict]]:
+        """(address, headers) of the notification each open channel gets for
+        a change ("exists") or right after it opens ("sync")."""
+        with self.lock:
+            posts = []
+            for channel in self.watches.values():
+                channel['messages'] += 1
+                posts.append((channel['address'], {
+                    "X-Goog-Channel-ID": channel['id'],
+                    "X-Goog-Channel-Token": channel.get('token', ''),
+                    "X-Goog-Channel-Expiration": time.strftime("%a, %d %b %Y %H:%M:%S GMT", time.gmtime(int(channel['expiration']) / 1000)),
+                    "X-Goog-Resource-ID": channel['resourceId'],
+                    "X-Goog-Resource-URI": channel['resourceUri'],
+                    "X-Goog-Resource-State": state,
+                    "X-Goog-Message-Number": str(channel['messages']),
+                }))
+            return posts
+
+    def new_batch_http_request(self, callback=None):
+        return FakeBatch(self, callback)
+
+    def next_id(self) -> str:
+        return f"evt{next(self._ids)}"
+
+    def random_event(self, days: int = 90) -> dict:
+        begin = self.start + datetime.timedelta(minutes=30 * self.rng.randrange(0, 24 * 2 * days))
+        end = begin + datetime.timedelta(minutes=30 * self.rng.randint(1, 4))
+        event_id = self.next_id()
+        event = {
+            'id': event_id,
+            'status': 'confirmed',
+            'summary': self.rng.choice(SUMMARIES),
+            'start': {'dateTime': begin.isoformat()},
+            'end': {'dateTime': end.isoformat()},
+            'htmlLink': f"https://calendar.example/{event_id}",
+        }
+        if self.rich:
+            event.update(self._rich_fields(event_id, begin))
+        return event
+
+    def _rich_fields(self, event_id: str, begin: datetime.datetime) -> dict:
+        """The rest of a typical events resource, as the API returns it by default."""
+        stamp = (begin - datetime.timedelta(days=7)).isoformat().replace('+00:00', '.000Z')
+        guests = self.rng.sample(GUESTS, self.rng.randint(1, 4))
+        return {
+            'kind': 'calendar#event',
+            'etag': f'"33{self.rng.randrange(10 ** 12)}000"',
+            'created': stamp,
+            'updated': stamp,
+            'creator': {'email': self.calendar_id, 'self': True},
+            'organizer': {'email': self.calendar_id, 'self': True},
+            'iCalUID': f"{event_id}@google.com",
+            'sequence': 0,
+            'eventType': 'default',
+            'attendees': [{'email': self.calendar_id, 'organizer': True, 'self': True, 'responseStatus': 'accepted'}]
+                         + [{'email': guest, 'responseStatus': 'needsAction'} for guest in guests],
+            'reminders': {'useDefault': True},
+            'hangoutLink': f"https://meet.google.com/abc-{event_id}-xyz",
+            'conferenceData': {
+                'entryPoints': [{'entryPointType': 'video', 'uri': f"https://meet.google.com/abc-{event_id}-xyz",
+                                 'label': f"meet.google.com/abc-{event_id}-xyz"}],
+                'conferenceSolution': {'key': {'type': 'hangoutsMeet'}, 'name': 'Google Meet',
+                                       'iconUri': 'https://fonts.gstatic.com/s/i/productlogos/meet_2020q4/v6/web-512dp/logo_meet_2020q4_color_2x_web_512dp.png'},
+                'conferenceId': f"abc-{event_id}-xyz",
+            },
+        }
+
+    def add_series(self, summary: str, first: datetime.datetime, count: int, every: datetime.timedelta = datetime.timedelta(days=7),
+                   duration: datetime.timedelta = datetime.timedelta(minutes=30), **fields) -> str:
+        """Adds a recurring event with ``count`` instances and returns the series id."""
+        with self.lock:
+            series_id = self.next_id()
+            self.series[series_id] = dict(fields, id=series_id, summary=summary, status='confirmed',
+                                          start={'dateTime': first.isoformat()},
+                                          end={'dateTime': (first + duration).isoformat()},
+                                          recurrence=[f"RRULE:FREQ=DAILY;INTERVAL={every.days};COUNT={count}"])
+            for i in range(count):
+                begin = first + i * every
+                self.put(dict(fields, id=f"{series_id}_{begin.astimezone(datetime.timezone.utc):%Y%m%dT%H%M%SZ}",
+                              recurringEventId=series_id, summary=summary, status='confirmed',
+                              start={'dateTime': begin.isoformat()}, end={'dateTime': (begin + duration).isoformat()}))
+            return series_id
+
+    def instances(self, series_id: str) -> list[dict]:
+        with self.lock:
+            return [e for e in self.events_by_id.values() if e.get('recurringEventId') == series_id and e.get('status') != 'cancelled']
+
+    def patch_series(self, series_id: str, body: dict) -> dict:
+        with self.lock:
+            fields = {key: value for key, value in body.items() if key not in ('start', 'end')}
+            self.series[series_id].update(fields)
+            for instance in self.instances(series_id):
+                self.put(dict(instance, **fields))
+            return self.series[series_id]
+
+    def put(self, event: dict):
+        with self.lock:
+            self.revision += 1
+            self.events_by_id[event['id']] = event
+            self.revisions[event['id']] = self.revision
+
+    def remove(self, event_id: str):
+        with self.lock:
+            if self.series.pop(event_id, None) is not None:
+                for instance in self.instances(event_id):
+                    self.remove(instance['id'])
+                return
+            event = self.event(event_id)
+            self.revision += 1
+            self.events_by_id[event_id] = dict(event, status='cancelled')
+            self.revisions[event_id] = self.revision
+
+    def expire_sync_tokens(self):
+        """Makes every sync token issued so far fail with 410 Gone."""
+        with self.lock:
+            # Tokens issued from now on carry the new revision and stay valid
+            self.revision += 1
+            self.oldest_sync_revision = self.revision
+
+    def event(self, event_id):
+        event = self.events_by_id.get(event_id)
+        if event is None or event.get('status') == 'cancelled':
+            raise http_error(404, f"Event {event_id} not found")
+        return event
+
+    def sorted_events(self, include_deleted: bool = False):
+        with self.lock:
+            events = [e for e in self.events_by_id.values() if include_deleted or e.get('status') != 'cancelled']
+        return sorted(events, key=_start)
+
+
+GUESTS = ["priya@example.com", "sam@example.com", "alex@example.com", "jordan@example.com", "lee@example.com"]
+SUMMARIES = ["Standup", "1:1 with Priya", "Design review", "Lunch", "Planning", "Interview", "Gym", "Team sync"]
+
+
+def _parse(value):
+    if value is None:
+        return None
+    value = value.replace('Z', '+00:00')
+    parsed = datetime.datetime.fromisoformat(value)
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=datetime.timezone.utc)
+
+
+def _bound(value, tz=datetime.timezone.utc):
+    """A start or end; dates are midnight in the calendar's timezone, like the API."""
+    if 'dateTime' in value:
+        return _parse(value['dateTime'])
+    return datetime.datetime.combine(datetime.date.fromisoformat(value['date']), datetime.time(), tzinfo=tz)
+
+
+def _start(event, tz=datetime.timezone.utc):
+    return _bound(event['start'], tz)
+
+
+def _end(event, tz=datetime.timezone.utc):
+    return _bound(event['end'], tz)
+
+
+def _overlaps(event, time_min, time_max, tz=datetime.timezone.utc):
+    if time_min and _end(event, tz) <= _parse(time_min):
+        return False
+    if time_max and _start(event, tz) >= _parse(time_max):
+        return False
+    return True
+
+
+class ScriptedChatModel(BaseChatModel):
+    """A chat model that replays a script instead of calling Gemini.
+
+    ``scripts`` maps a user message to the replies for each agent step of that
+    turn: the first reply for the first model call, the second once one tool
+    step is in the scratchpad, and so on (the last one repeats). Replies depend
+    only on the conversation, so concurrent chats don't interfere. Each call
+    waits ``latency`` seconds; streamed replies come in ``chunk_size``-character
+    chunks spread over that time. ``calls`` counts model calls.
+
+    A reply is text or, for the native tool-calling engine, an ``AIMessage``
+    with ``tool_calls``; ``bind_tools`` is supported. Every reply reports
+    estimated token usage (four characters a token, bound tool schemas
+    included as compact JSON), summed in ``input_tokens``. A call naming a
+    ``cached_content`` (see FakeContextCacheClient) also counts that cache's
+    tokens as input, reported as read from the cache.
+    """
+
+    scripts: dict[str, list[Union[str, AIMessage]]]
+    default: str = '```json\n{"action": "Final Answer", "action_input": "I can help with your calendar."}\n```'
+    latency: float = 0.0
+    chunk_size: int = 8
+    calls: int = 0
+    input_tokens: int = 0
+    context_caches: dict[str, int] = Field(default_factory=dict)
+    _lock: threading.Lock = PrivateAttr(default_factory=threading.Lock)
+
+    @property
+    def _llm_type(self) -> str:
+        return "scripted"
+
+    def bind_tools(self, tools: Sequence, **kwargs: Any):
+        return self.bind(tools=[convert_to_openai_tool(tool) for tool in tools], **kwargs)
+
+    def _script_for(self, message: HumanMessage) -> Optional[str]:
+        """The script for a user message, which may follow the agent's time context."""
+        content = str(message.content)
+        if content in self.scripts:
+            return content
+        return next((key for key in self.scripts if content.endswith("\n\n" + key)), None)
+
+    def _reply(self, messages: list[BaseMessage], tools: Optional[list] = None, cached_content: Optional[str] = None) -> AIMessage:
+        reply = self.default
+        for i in range(len(messages) - 1, -1, -1):
+            message = messages[i]
+            script = self._script_for(message) if isinstance(message, HumanMessage) else None
+            if script is not None:
+                replies = self.scripts[script]
+                step = sum(isinstance(later, AIMessage) for later in messages[i + 1:])
+                reply = replies[min(step, len(replies) - 1)]
+                break
+        reply = AIMessage(content=reply) if isinstance(reply, str) else reply.model_copy()
+        prompt = "".join(str(message.content) for message in messages) + json.dumps(tools or [], separators=(",", ":"))
+        prompt += "".join(json.dumps(message.tool_calls) for message in messages if isinstance(message, AIMessage))
+        cached = self.context_caches[cached_content] if cached_content else 0
+        input_tokens = _estimate_tokens(prompt) + cached
+        output_tokens = _estimate_tokens(str(reply.content) + json.dumps(reply.tool_calls))
+        reply.usage_metadata = {"input_tokens": input_tokens, "output_tokens": output_tokens,
+                                "total_tokens": input_tokens + output_tokens}
+        if cached:
+            reply.usage_metadata["input_token_details"] = {"cache_read": cached}
+        with self._lock:
+            self.calls += 1
+            self.input_tokens += input_tokens
+        return reply
+
+    def _chunks(self, reply: AIMessage) -> list[AIMessageChunk]:
+        text = reply.content
+        chunks = [AIMessageChunk(content=text[i:i + self.chunk_size]) for i in range(0, len(text), self.chunk_size)]
+        if reply.tool_calls:
+            chunks.append(AIMessageChunk(content="", tool_call_chunks=[
+                {"name": call["name"], "args": json.dumps(call["args"]), "id": call["id"], "index": i}
+                for i, call in enumerate(reply.tool_calls)
+            ]))
+        chunks = chunks or [AIMessageChunk(content="")]
+        chunks[-1].usage_metadata = reply.usage_metadata
+        return chunks
+
+    def _generate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        time.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs.get("tools"), kwargs.get("cached_content")))])
+
+    async def _agenerate(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> ChatResult:
+        await asyncio.sleep(self.latency)
+        return ChatResult(generations=[ChatGeneration(message=self._reply(messages, kwargs.get("tools"), kwargs.get("cached_content")))])
+
+    def _stream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        chunks = self._chunks(self._reply(messages, kwargs.get("tools"), kwargs.get("cached_content")))
+        for chunk in chunks:
+            time.sleep(self.latency / len(chunks))
+            chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: list[BaseMessage], stop: Optional[list[str]] = None, run_manager=None, **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        chunks = self._chunks(self._reply(messages, kwargs.get("tools"), kwargs.get("cached_content")))
+        for chunk in chunks:
+            await asyncio.sleep(self.latency / len(chunks))
+            chunk = ChatGenerationChunk(message=chunk)
+            if run_manager:
+                await run_manager.on_llm_new_token(chunk.text, chunk=chunk)
+            yield chunk
+
+
+class FakeContextCacheClient:
+    """Stands in for Gemini's cached-content API (``prompt_cache.GenAICacheClient``).
+
+    A created cache is registered with ``model`` under its name, so calls
+    naming it are charged its tokens as cache reads. Prefixes smaller than
+    ``min_tokens`` are refused, like Gemini's minimum cache size. Exceptions
+    queued in ``errors`` are raised by the next creates, one each."""
+
+    def __init__(self, model: ScriptedChatModel, min_tokens: int = 0):
+        self.model, self.min_tokens = model, min_tokens
+        self.created = self.extended = self.attempts = 0
+        self.errors: list[Exception] = []
+
+    def create(self, model: str, system_instruction: str, tools: list, ttl: float) -> str:
+        self.attempts += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        declarations = [convert_to_openai_tool(tool) for tool in tools]
+        tokens = _estimate_tokens(system_instruction + json.dumps(declarations, separators=(",", ":")))
+        if tokens < self.min_tokens:
+            raise ValueError(f"Cached content has {tokens} tokens, the minimum is {self.min_tokens}.")
+        self.created += 1
+        name = f"cachedContents/fake-{self.created}"
+        self.model.context_caches[name] = tokens
+        return name
+
+    def extend(self, name: str, ttl: float):
+        self.extended += 1
+
+
+def _estimate_tokens(text: str) -> int:
+    return (len(text) + 3) // 4
@@ -0,0 +1,82 @@
+"""Load test: per-chat latency with 50 concurrent chats against a slow Calendar.
+
+Run from the repository root:
+
+    python -m benchmarks.load_slow_service [chats] [calendar_latency_s]
+
+Each simulated chat alternates an LLM step (a non-blocking sleep) with a
+``list_events`` tool call against a fake service whose ``execute()`` blocks.
+The tool calls are made three ways:
+
+- inline:           the blocking call runs directly on the event loop
+- default executor: the loop's default executor (how LangGraph runs sync nodes)
+- calendar pool:    the async tools, on the bounded calendar executor
+"""
+import asyncio
+import os
+import sys
+import time
+
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-placeholder-key")
+# Measure the API calls themselves rather than reads served from the event mirror
+os.environ.setdefault("EVENT_MIRROR", "false")
+
+from backend import calendar_tools
+from backend.agent_graph import tools_by_name
+from benchmarks.fakes import FakeCalendarService
+
+STEPS_PER_CHAT = 2
+LLM_LATENCY = 0.5
+RANGE = {"start": "2025-01-01T00:00:00Z", "end": "2025-01-02T00:00:00Z"}
+
+
+async def _inline(service):
+    return calendar_tools.list_events(service, RANGE["start"], RANGE["end"])
+
+
+async def _default_executor(service):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, calendar_tools.list_events, service, RANGE["start"], RANGE["end"])
+
+
+async def _calendar_pool(service):
+    return await tools_by_name["list_events"].ainvoke(RANGE, config={"configurable": {"service": service}})
+
+
+async def _chat(call_tool, calendar_latency: float) -> float:
+    service = FakeCalendarService(size=20, latency=calendar_latency)
+    t0 = time.perf_counter()
+    for _ in range(STEPS_PER_CHAT):
+        await asyncio.sleep(LLM_LATENCY)
+        await call_tool(service)
+    await asyncio.sleep(LLM_LATENCY)  # final answer
+    return time.perf_counter() - t0
+
+
+def _percentile(samples: list[float], pct: float) -> float:
+    samples = sorted(samples)
+    return samples[min(len(samples) - 1, int(round(pct / 100 * (len(samples) - 1))))]
+
+
+async def _run(label: str, call_tool, chats: int, calendar_latency: float) -> None:
+    t0 = time.perf_counter()
+    latencies = await asyncio.gather(*(_chat(call_tool, calendar_latency) for _ in range(chats)))
+    wall = time.perf_counter() - t0
+    print(f"{label:<18} p50={_percentile(latencies, 50):7.2f}s  p95={_percentile(latencies, 95):7.2f}s  "
+          f"p99={_percentile(latencies, 99):7.2f}s  wall={wall:7.2f}s")
+
+
+def main(chats: int = 50, calendar_latency: float = 0.2) -> None:
+    ideal = (STEPS_PER_CHAT + 1) * LLM_LATENCY + STEPS_PER_CHAT * calendar_latency
+    print(f"{chats} concurrent chats, {STEPS_PER_CHAT} tool calls each, calendar latency {calendar_latency}s, "
+          f"LLM latency {LLM_LATENCY}s (uncontended chat: {ideal:.2f}s)")
+    print(f"calendar pool: {calendar_tools.CALENDAR_MAX_WORKERS} workers, "
+          f"{calendar_tools.CALENDAR_PER_USER_CONCURRENCY} per user")
+    asyncio.run(_run("inline", _inline, chats, calendar_latency))
+    asyncio.run(_run("default executor", _default_executor, chats, calendar_latency))
+    asyncio.run(_run("calendar pool", _calendar_pool, chats, calendar_latency))
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    main(int(args[0]) if args else 50, float(args[1]) if len(args) > 1 else 0.2)
@@ -5,8 +5,38 @@ import httpx
 import json
 import os
 import base64
+import time
 
 BACKEND_URL = os.getenv("BACKEND_URL", "http://localhost:8000")
+# Streamed answer text is re-rendered at most this often (seconds)
+RENDER_INTERVAL = float(os.getenv("RENDER_INTERVAL", "0.08"))
+
+@st.cache_resource
+def get_http_client() -> httpx.Client:
+    """One pooled client for the whole app, kept across reruns and sessions, so
+    chats reuse open (keep-alive, HTTP/2 where available) connections instead
+    of setting up TCP and TLS for every message."""
+    try:
+        import h2  # noqa: F401
+        http2 = True
+    except ImportError:
+        http2 = False
+    return httpx.Client(
+        base_url=BACKEND_URL,
+        http2=http2,
+        timeout=httpx.Timeout(300, connect=10),
+        limits=httpx.Limits(max_connections=100, max_keepalive_connections=20, keepalive_expiry=120),
+    )
+
+def auth_headers() -> dict:
+    """The Authorization header for the current token, encoded once per token."""
+    token_data = st.session_state.token_data
+    cached = st.session_state.get("auth_header")
+    if cached is None or cached[0] is not token_data:
+        token_data_json_string = json.dumps(token_data)
+        token_data_b64 = base64.b64encode(token_data_json_string.encode('utf-8')).decode('utf-8')
+        cached = st.session_state.auth_header = (token_data, {"Authorization": f"Bearer {token_data_b64}"})
+    return cached[1]
 
 st.set_page_config(page_title="Super Calendar Agent", page_icon="📅")
 st.title("Super Calendar Agent")
@@ -37,6 +67,10 @@ authenticated = isinstance(st.session_state.get("token_data"), dict)
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
 
+# The backend keeps the conversation; we only send it the id of our session
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
+
 # JS listener for postMessage from popup
 components.html(
     """
@@ -124,28 +158,43 @@ else:
             message_placeholder = st.empty()
             full_response = ""
             try:
-                token_data_json_string = json.dumps(st.session_state.token_data)
-                token_data_b64 = base64.b64encode(token_data_json_string.encode('utf-8')).decode('utf-8')
-
-                headers = {
-                    "Authorization": f"Bearer {token_data_b64}"
-                }
-
-                with httpx.stream(
+                with get_http_client().stream(
                     "POST",
-                    f"{BACKEND_URL}/chat",
-                    json={"message": user_input, "history": st.session_state.chat_history},
-                    headers=headers,
-                    timeout=300
+                    "/chat",
+                    json={"message": user_input, "session_id": st.session_state.session_id},
+                    headers=auth_headers(),
                 ) as response:
                     response.raise_for_status()
+                    st.session_state.session_id = response.headers.get("X-Session-Id", st.session_state.session_id)
+                    # The backend returns a refreshed token so it doesn't have to refresh again next time
+                    refreshed_token_b64 = response.headers.get("X-Refreshed-Token")
+                    if refreshed_token_b64:
+                        refreshed_token_str = base64.b64decode(refreshed_token_b64).decode('utf-8')
+                        st.session_state.token_data = json.loads(refreshed_token_str)
+                        # The header value already is the encoded token
+                        st.session_state.auth_header = (st.session_state.token_data, {"Authorization": f"Bearer {refreshed_token_b64}"})
+                        st_javascript(
+                            f"window.localStorage.setItem('token_data', {json.dumps(refreshed_token_str)});",
+                            key=f"store_refreshed_token_{len(st.session_state.chat_history)}"
+                        )
+                    last_render = 0.0
                     for line in response.iter_lines():
                         if line.startswith('data:'):
                             try:
                                 data = json.loads(line[len('data: '):])
                                 if "tool" in data:
+                                    # Text streamed before a tool call isn't part of the answer
+                                    full_response = ""
+                                    last_render = 0.0
                                     tool_name = data["tool"]
                                     message_placeholder.markdown(f"🤖 Using tool: `{tool_name}`...")
+                                elif "delta" in data:
+                                    # The answer arrives piece by piece while it is being written
+                                    full_response += data["delta"]
+                                    # Re-rendering on every small delta makes Streamlit churn; batch them
+                                    if time.monotonic() - last_render >= RENDER_INTERVAL:
+                                        message_placeholder.markdown(full_response + "▌")
+                                        last_render = time.monotonic()
                                 elif "response" in data:
                                     full_response = data.get("response", "")
                                     message_placeholder.markdown(full_response + "▌")
@@ -0,0 +1,7 @@
+import os
+
+# Importing the backend reads these at module level
+os.environ.setdefault("GEMINI_API_KEY", "test-placeholder-key")
+os.environ.setdefault("EVENT_MIRROR", "true")
+os.environ.pop("EVENT_MIRROR_SQLITE_PATH", None)
+os.environ.pop("CALENDAR_WEBHOOK_URL", None)
@@ -0,0 +1,33 @@
+import asyncio
+
+from langchain_core.agents import AgentAction
+
+from backend.agent_graph import create_agent_graph, format_scratchpad
+from benchmarks.fakes import FakeCalendarService, ScriptedChatModel
+
+LOOKUP = '```json\n{"action": "get_current_time", "action_input": {}}\n```'
+BOTH = '```json\n[{"action": "get_current_time", "action_input": {}}, {"action": "get_current_time", "action_input": {}}]\n```'
+
+
+def test_identical_actions_on_consecutive_turns_stay_apart():
+    action = AgentAction("get_current_time", {}, LOOKUP)
+    messages = format_scratchpad([(action, "10:00", 0), (action, "10:01", 1)])
+    assert [message.type for message in messages] == ["ai", "human", "ai", "human"]
+    assert "10:00" in messages[1].content and "10:01" in messages[3].content
+
+
+def test_a_parallel_batch_shares_one_message():
+    steps = [(AgentAction("get_current_time", {}, BOTH), "10:00", 0), (AgentAction("get_current_time", {}, BOTH), "10:00", 0),
+             (AgentAction("get_current_time", {}, LOOKUP), "10:01", 2)]
+    messages = format_scratchpad(steps)
+    assert [message.type for message in messages] == ["ai", "human", "ai", "human"]
+    assert messages[1].content.count("returned:") == 2
+
+
+def test_the_graph_numbers_each_batch():
+    script = [BOTH, LOOKUP, LOOKUP, '```json\n{"action": "Final Answer", "action_input": "done"}\n```']
+    graph = create_agent_graph(llm=ScriptedChatModel(scripts={"what time is it?": script}), fast_path=False,
+                               parallel_tool_calls=True, prompt_cache="off").compile()
+    state = {"input": "what time is it?", "chat_history": [], "intermediate_steps": None, "timezone": "UTC"}
+    result = asyncio.run(graph.ainvoke(state, config={"configurable": {"service": FakeCalendarService()}}))
+    assert [batch for _, _, batch in result["intermediate_steps"]] == [0, 0, 2, 3]
@@ -0,0 +1,131 @@
+import datetime
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from backend import calendar_client
+from backend.calendar_client import TokenBucket, execute, execute_batch
+from benchmarks.fakes import FakeCalendarService, http_error, rate_limit_error
+
+START = datetime.datetime(2025, 3, 3, tzinfo=datetime.timezone.utc)
+
+
+class FakeClock:
+    """Stands in for the ``time`` module: ``sleep`` advances ``monotonic``."""
+
+    def __init__(self):
+        self.now = 1000.0
+        self.slept = []
+
+    def monotonic(self) -> float:
+        return self.now
+
+    def sleep(self, seconds: float):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(calendar_client, "time", clock)
+    return clock
+
+
+def _insert(service, i: int):
+    begin = START + datetime.timedelta(hours=i)
+    return service.events().insert(calendarId='primary', body={
+        'summary': f"Session {i}", 'start': {'dateTime': begin.isoformat()},
+        'end': {'dateTime': (begin + datetime.timedelta(minutes=30)).isoformat()}})
+
+
+def test_token_bucket_allows_a_burst_then_paces(clock):
+    bucket = TokenBucket(rate=10, burst=5)
+    waits = [bucket.acquire() for _ in range(8)]
+    assert waits[:5] == [0.0] * 5
+    assert waits[5:] == pytest.approx([0.1, 0.1, 0.1])
+    # Idle time refills the bucket up to the burst, no further
+    clock.now += 60
+    assert [bucket.acquire() for _ in range(5)] == [0.0] * 5
+    assert bucket.acquire() == pytest.approx(0.1)
+
+
+def test_token_bucket_charges_a_batch_by_its_calls(clock):
+    bucket = TokenBucket(rate=10, burst=10)
+    assert bucket.acquire(10) == 0.0
+    assert bucket.acquire(5) == pytest.approx(0.5)
+
+
+def test_rate_zero_disables_the_bucket(clock):
+    bucket = TokenBucket(rate=0, burst=1)
+    assert [bucket.acquire() for _ in range(100)] == [0.0] * 100
+    assert not clock.slept
+
+
+def test_execute_retries_rate_limits(clock):
+    service = FakeCalendarService(start=START)
+    service.fail_next(rate_limit_error(429), rate_limit_error(403, "userRateLimitExceeded"))
+    created = execute(service, _insert(service, 0), idempotent=False)
+    assert created['summary'] == "Session 0"
+    assert service.calls == 3
+    assert len(service.sorted_events()) == 1
+
+
+def test_execute_retries_server_errors_only_when_idempotent(clock):
+    service = FakeCalendarService(start=START)
+    service.fail_next(http_error(503))
+    assert execute(service, service.calendars().get(calendarId='primary'))['id'] == service.calendar_id
+    service.fail_next(http_error(503))
+    with pytest.raises(HttpError):
+        execute(service, _insert(service, 0), idempotent=False)
+
+
+def test_execute_gives_up_after_max_retries(clock, monkeypatch):
+    monkeypatch.setattr(calendar_client, "CALENDAR_MAX_RETRIES", 2)
+    service = FakeCalendarService(start=START)
+    service.fail_next(*[rate_limit_error() for _ in range(3)])
+    with pytest.raises(HttpError):
+        execute(service, service.calendars().get(calendarId='primary'))
+    assert service.calls == 3
+
+
+def test_permission_errors_are_not_retried(clock):
+    service = FakeCalendarService(start=START)
+    service.fail_next(http_error(403, "Forbidden"))
+    with pytest.raises(HttpError):
+        execute(service, service.calendars().get(calendarId='primary'))
+    assert service.calls == 1
+
+
+def test_execute_batch_resends_only_rate_limited_calls(clock):
+    service = FakeCalendarService(start=START)
+    # The first two calls inside the batch are turned away, the third fails for good
+    service.fail_next(rate_limit_error(), rate_limit_error(403, "rateLimitExceeded"), http_error(400, "Bad Request"))
+    results = execute_batch(service, [_insert(service, i) for i in range(6)], idempotent=False)
+
+    assert service.batch_calls == 2
+    errors = [error for _, error in results if error is not None]
+    assert len(errors) == 1 and errors[0].resp.status == 400
+    created = sorted(event['summary'] for event in service.sorted_events())
+    assert created == sorted(f"Session {i}" for i in (0, 1, 3, 4, 5))
+    assert [response['summary'] for response, _ in results if response] == [f"Session {i}" for i in (0, 1, 3, 4, 5)]
+
+
+def test_execute_batch_splits_batches_to_the_burst(clock, monkeypatch):
+    monkeypatch.setattr(calendar_client, "CALENDAR_RATE_LIMIT", 10)
+    monkeypatch.setattr(calendar_client, "CALENDAR_RATE_BURST", 20)
+    service = FakeCalendarService(start=START)
+    results = execute_batch(service, [_insert(service, i) for i in range(45)], idempotent=False)
+    assert all(error is None for _, error in results)
+    assert service.batch_calls == 3
+    # 20 calls from the burst, then 20 and 5 more paced at 10 per second
+    assert sum(clock.slept) == pytest.approx(2.5)
+
+
+def test_execute_batch_stops_resending_after_max_retries(clock, monkeypatch):
+    monkeypatch.setattr(calendar_client, "CALENDAR_MAX_RETRIES", 1)
+    service = FakeCalendarService(start=START)
+    service.fail_next(*[rate_limit_error() for _ in range(2)])
+    results = execute_batch(service, [_insert(service, 0)])
+    assert service.batch_calls == 2
+    assert results[0][1].resp.status == 429
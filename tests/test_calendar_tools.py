@@ -0,0 +1,139 @@
+import asyncio
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+
+from backend import calendar_tools
+from backend.agent_graph import create_agent_graph, tools_by_name
+from backend.calendar_tools import check_availability, create_event, find_free_slots, list_events
+from benchmarks.fakes import FakeCalendarService, ScriptedChatModel
+
+LOS_ANGELES = ZoneInfo("America/Los_Angeles")
+KOLKATA = ZoneInfo("Asia/Kolkata")
+
+
+@pytest.fixture(params=[True, False], ids=["mirror", "live"])
+def mirror_enabled(request, monkeypatch):
+    monkeypatch.setattr(calendar_tools, "EVENT_MIRROR_ENABLED", request.param)
+    return request.param
+
+
+def _service_with_evening_event() -> FakeCalendarService:
+    """A Los Angeles calendar with an event at 20:00 local (04:00 UTC the next day)."""
+    service = FakeCalendarService(timezone="America/Los_Angeles")
+    begin = datetime.datetime(2025, 3, 5, 20, tzinfo=LOS_ANGELES)
+    service.put({'id': "evening", 'status': 'confirmed', 'summary': "Dinner",
+                 'start': {'dateTime': begin.isoformat()},
+                 'end': {'dateTime': (begin + datetime.timedelta(hours=1)).isoformat()}})
+    return service
+
+
+def test_times_without_offset_are_local_to_the_calendar(mirror_enabled):
+    service = _service_with_evening_event()
+    events = list_events(service, "2025-03-05T00:00:00", "2025-03-06T00:00:00")
+    assert [event['id'] for event in events] == ["evening"]
+
+
+def test_times_without_offset_use_the_given_timezone(mirror_enabled):
+    service = _service_with_evening_event()
+    assert list_events(service, "2025-03-05T00:00:00", "2025-03-06T00:00:00", timezone="UTC") == []
+    events = list_events(service, "2025-03-06T00:00:00", "2025-03-07T00:00:00", timezone="UTC")
+    assert [event['id'] for event in events] == ["evening"]
+
+
+def test_times_with_an_offset_are_kept(mirror_enabled):
+    service = _service_with_evening_event()
+    events = list_events(service, "2025-03-06T00:00:00Z", "2025-03-06T12:00:00+00:00", timezone="Asia/Kolkata")
+    assert [event['id'] for event in events] == ["evening"]
+
+
+def test_free_slots_default_to_the_calendars_timezone():
+    service = FakeCalendarService(timezone="America/Los_Angeles")
+    tomorrow = datetime.datetime.now(LOS_ANGELES).date() + datetime.timedelta(days=1)
+    start = datetime.datetime.combine(tomorrow, datetime.time(), tzinfo=LOS_ANGELES)
+    slots = find_free_slots(service, 60, start.isoformat(), (start + datetime.timedelta(days=3)).isoformat(),
+                            include_weekends=True, max_results=1)
+    assert slots[0][0] == datetime.datetime.combine(tomorrow, datetime.time(9), tzinfo=LOS_ANGELES)
+
+
+def test_tools_use_the_turns_timezone():
+    service = FakeCalendarService(timezone="America/Los_Angeles")
+    config = {"configurable": {"service": service, "timezone": "Pacific/Auckland"}}
+    now = asyncio.run(tools_by_name["get_current_time"].ainvoke({}, config=config))
+    assert datetime.datetime.fromisoformat(now).utcoffset() == datetime.datetime.now(ZoneInfo("Pacific/Auckland")).utcoffset()
+    # Without an override it is the calendar's
+    config = {"configurable": {"service": service}}
+    now = asyncio.run(tools_by_name["get_current_time"].ainvoke({}, config=config))
+    assert datetime.datetime.fromisoformat(now).utcoffset() == datetime.datetime.now(LOS_ANGELES).utcoffset()
+
+
+def test_the_agents_tools_get_the_requested_timezone():
+    script = ['```json\n{"action": "get_current_time", "action_input": {}}\n```',
+              '```json\n{"action": "Final Answer", "action_input": "done"}\n```']
+    graph = create_agent_graph(llm=ScriptedChatModel(scripts={"what time is it in auckland?": script}),
+                               fast_path=False, prompt_cache="off").compile()
+    service = FakeCalendarService(timezone="America/Los_Angeles")
+    state = {"input": "what time is it in auckland?", "chat_history": [], "intermediate_steps": None,
+             "timezone": "Pacific/Auckland"}
+    result = asyncio.run(graph.ainvoke(state, config={"configurable": {"service": service}}))
+    (_, observation, _), = result["intermediate_steps"]
+    assert datetime.datetime.fromisoformat(observation).utcoffset() == datetime.datetime.now(ZoneInfo("Pacific/Auckland")).utcoffset()
+
+
+def _kolkata_service() -> FakeCalendarService:
+    """A Kolkata calendar with an event from 10:00 to 11:00 local on 2025-03-05."""
+    service = FakeCalendarService(timezone="Asia/Kolkata")
+    begin = datetime.datetime(2025, 3, 5, 10, tzinfo=KOLKATA)
+    service.put({'id': "standup", 'status': 'confirmed', 'summary': "Standup",
+                 'start': {'dateTime': begin.isoformat()},
+                 'end': {'dateTime': (begin + datetime.timedelta(hours=1)).isoformat()}})
+    return service
+
+
+def test_availability_reads_times_without_offset_in_the_users_timezone(mirror_enabled):
+    service = _kolkata_service()
+    availability = check_availability(service, "2025-03-05T10:00:00", "2025-03-05T11:00:00")
+    begin = datetime.datetime(2025, 3, 5, 10, tzinfo=KOLKATA)
+    assert availability['busy'] == [(begin, begin + datetime.timedelta(hours=1))]
+    if mirror_enabled:
+        assert [event['id'] for event in availability['conflicts']] == ["standup"]
+    # The same wall-clock hour in UTC is free
+    assert check_availability(service, "2025-03-05T10:00:00", "2025-03-05T11:00:00", timezone="UTC")['busy'] == []
+
+
+def test_created_events_are_local_to_the_user():
+    service = _kolkata_service()
+    event = create_event(service, "Review", "2025-03-05T15:00:00", "2025-03-05T16:00:00")
+    assert event['start'] == {'dateTime': "2025-03-05T15:00:00+05:30", 'timeZone': "Asia/Kolkata"}
+    assert event['end'] == {'dateTime': "2025-03-05T16:00:00+05:30", 'timeZone': "Asia/Kolkata"}
+
+
+def test_write_tools_use_the_turns_timezone():
+    service = _kolkata_service()
+    config = {"configurable": {"service": service, "timezone": "Europe/Berlin"}}
+    asyncio.run(tools_by_name["create_event"].ainvoke(
+        {"summary": "Review", "start": "2025-03-05T15:00:00", "end": "2025-03-05T16:00:00"}, config=config))
+    asyncio.run(tools_by_name["bulk_create_events"].ainvoke(
+        {"events": [{"summary": "Retro", "start": "2025-03-06T15:00:00", "end": "2025-03-06T16:00:00"}]}, config=config))
+    asyncio.run(tools_by_name["update_event"].ainvoke(
+        {"event_id": "standup", "start": "2025-03-05T09:00:00", "end": "2025-03-05T10:00:00"}, config=config))
+    by_summary = {event['summary']: event for event in service.sorted_events()}
+    assert by_summary["Review"]['start'] == {'dateTime': "2025-03-05T15:00:00+01:00", 'timeZone': "Europe/Berlin"}
+    assert by_summary["Retro"]['start'] == {'dateTime': "2025-03-06T15:00:00+01:00", 'timeZone': "Europe/Berlin"}
+    assert by_summary["Standup"]['start'] == {'dateTime': "2025-03-05T09:00:00+01:00", 'timeZone': "Europe/Berlin"}
+
+
+def test_bulk_updates_without_values_are_reported():
+    service = _kolkata_service()
+    config = {"configurable": {"service": service, "timezone": "Asia/Kolkata"}}
+    report = asyncio.run(tools_by_name["bulk_update_events"].ainvoke(
+        {"updates": [{"event_id": "empty"}, {"event_id": "standup", "summary": "Daily"}]}, config=config))
+    assert report.splitlines() == [
+        "1 of 2 events updated:",
+        "- empty: failed (no update values provided)",
+        "- standup: updated",
+    ]
+    assert [event['summary'] for event in service.sorted_events()] == ["Daily"]
+    report = asyncio.run(tools_by_name["bulk_update_events"].ainvoke({"updates": [{"event_id": "standup"}]}, config=config))
+    assert report == "0 of 1 events updated:\n- standup: failed (no update values provided)"
@@ -0,0 +1,166 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+import pytest
+from googleapiclient.errors import HttpError
+
+from backend import event_store
+from backend.event_store import EventMirror
+from benchmarks.fakes import FakeCalendarService, http_error
+
+START = datetime.datetime(2025, 3, 3, tzinfo=datetime.timezone.utc)
+
+
+@pytest.fixture
+def service():
+    return FakeCalendarService(size=300, start=START)
+
+
+def live_ids(service):
+    return {event['id'] for event in service.sorted_events()}
+
+
+def test_full_sync_mirrors_the_calendar(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    assert mirror.events.keys() == live_ids(service)
+    assert mirror.sync_token is not None
+
+
+def test_sync_is_skipped_while_the_mirror_is_fresh(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    calls = service.calls
+    service.put(service.random_event())
+    mirror.sync(service)
+    assert service.calls == calls
+
+
+def test_incremental_sync_applies_changes_made_elsewhere(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    version, calls = mirror.version, service.calls
+    added = service.random_event()
+    service.put(added)
+    removed = next(iter(mirror.events))
+    service.remove(removed)
+    moved = dict(service.event(next(iter(live_ids(service) - {added['id']}))), summary="Moved elsewhere")
+    service.put(moved)
+
+    mirror.sync(service, force=True)
+
+    assert service.calls == calls + 1, "an incremental sync should be one page of changes"
+    assert mirror.events.keys() == live_ids(service)
+    assert removed not in mirror.events
+    assert mirror.events[moved['id']]['summary'] == "Moved elsewhere"
+    assert mirror.version > version
+
+
+def test_incremental_sync_without_changes_keeps_the_version(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    version = mirror.version
+    mirror.sync(service, force=True)
+    assert mirror.version == version
+
+
+def test_expired_sync_token_falls_back_to_a_full_sync(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    stale_token = mirror.sync_token
+    service.put(service.random_event())
+    service.remove(next(iter(mirror.events)))
+    service.expire_sync_tokens()
+
+    mirror.sync(service, force=True)
+
+    assert mirror.events.keys() == live_ids(service)
+    assert mirror.sync_token != stale_token
+    # The new token works for the next incremental sync
+    calls = service.calls
+    mirror.sync(service, force=True)
+    assert service.calls == calls + 1
+
+
+def test_sync_errors_other_than_410_are_raised(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    service.fail_next(http_error(404, "Not Found"))
+    with pytest.raises(HttpError):
+        mirror.sync(service, force=True)
+
+
+def test_writes_show_up_before_the_next_sync(service):
+    mirror = EventMirror()
+    mirror.sync(service)
+    event = dict(service.random_event(), summary="Written through")
+    mirror.apply(event)
+    assert event in mirror.between(*event_store.event_bounds(event))
+    mirror.remove(event['id'])
+    assert event['id'] not in mirror.events
+
+
+def test_sqlite_store_resumes_with_an_incremental_sync(service, tmp_path):
+    path = str(tmp_path / "mirror.db")
+    EventMirror(event_store.SQLiteEventStore(path)).sync(service)
+    service.put(service.random_event())
+    calls = service.calls
+    restarted = EventMirror(event_store.SQLiteEventStore(path))
+    restarted.sync(service)
+    # calendars().get for the calendar id, then one page of changes
+    assert service.calls == calls + 2
+    assert restarted.events.keys() == live_ids(service)
+
+
+def _all_day(service, event_id: str, day: datetime.date) -> dict:
+    event = {'id': event_id, 'status': 'confirmed', 'summary': event_id,
+             'start': {'date': day.isoformat()}, 'end': {'date': (day + datetime.timedelta(days=1)).isoformat()}}
+    service.put(event)
+    return event
+
+
+@pytest.mark.parametrize("timezone", ["Asia/Kolkata", "America/Los_Angeles"])
+def test_all_day_events_fall_on_the_calendars_local_day(timezone):
+    tz = ZoneInfo(timezone)
+    service = FakeCalendarService(timezone=timezone)
+    today = datetime.date(2025, 3, 5)
+    for event_id, offset in (("yday", -1), ("today", 0), ("tmrw", 1)):
+        _all_day(service, event_id, today + datetime.timedelta(days=offset))
+    midnight = datetime.datetime.combine(today, datetime.time(), tzinfo=tz)
+    next_midnight = midnight + datetime.timedelta(days=1)
+
+    mirror = EventMirror()
+    mirror.sync(service)
+
+    assert mirror.timezone_name == timezone
+    assert [event['id'] for event in mirror.between(midnight, next_midnight)] == ["today"]
+    assert [event['id'] for event in mirror.conflicts(midnight, next_midnight)] == ["today"]
+    assert mirror.busy_blocks(midnight - datetime.timedelta(hours=1), midnight) == [
+        (midnight - datetime.timedelta(hours=1), midnight)]
+    # A timed event late in the local day overlaps only that day's all-day event
+    evening = midnight + datetime.timedelta(hours=22)
+    assert [event['id'] for event in mirror.between(evening, evening + datetime.timedelta(hours=1))] == ["today"]
+    # The live API reads dates the same way
+    live = service.events().list(timeMin=midnight.isoformat(), timeMax=next_midnight.isoformat()).execute()
+    assert [event['id'] for event in live['items']] == ["today"]
+
+
+def test_event_bounds_reads_dates_in_the_given_timezone():
+    event = {'start': {'date': "2025-03-05"}, 'end': {'date': "2025-03-06"}}
+    start, end = event_store.event_bounds(event, ZoneInfo("America/Los_Angeles"))
+    assert start.isoformat() == "2025-03-05T00:00:00-08:00"
+    assert end - start == datetime.timedelta(days=1)
+    timed = {'start': {'dateTime': "2025-03-05T09:00:00+05:30"}, 'end': {'dateTime': "2025-03-05T10:00:00+05:30"}}
+    assert event_store.event_bounds(timed, ZoneInfo("America/Los_Angeles"))[0].isoformat() == "2025-03-05T09:00:00+05:30"
+
+
+def test_search_horizon_uses_the_calendars_timezone():
+    service = FakeCalendarService(timezone="Asia/Kolkata")
+    day = datetime.date.today() + datetime.timedelta(days=5)
+    event = _all_day(service, "retreat", day)
+    mirror = EventMirror()
+    mirror.sync(service)
+    hit = mirror.search("retreat", datetime.datetime.now(datetime.timezone.utc))[0]
+    start, end, payload = hit.instances[0]
+    assert payload == event
+    assert start == datetime.datetime.combine(day, datetime.time(), tzinfo=ZoneInfo("Asia/Kolkata")).timestamp()
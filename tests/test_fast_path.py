@@ -0,0 +1,28 @@
+import datetime
+from zoneinfo import ZoneInfo
+
+from backend.fast_path import day_range, match_intent
+
+BERLIN = ZoneInfo("Europe/Berlin")
+
+
+def test_tonight_starts_in_the_evening():
+    now = datetime.datetime(2025, 3, 5, 9, 30, tzinfo=BERLIN)
+    assert match_intent("what do I have tonight?").day == "tonight"
+    start, end, label = day_range("tonight", now)
+    assert start == datetime.datetime(2025, 3, 5, 17, tzinfo=BERLIN)
+    assert end == datetime.datetime(2025, 3, 6, tzinfo=BERLIN)
+    assert label == "tonight (Wed 05 Mar)"
+
+
+def test_tonight_starts_now_once_the_evening_has_begun():
+    now = datetime.datetime(2025, 3, 5, 20, 15, tzinfo=BERLIN)
+    start, end, _ = day_range("tonight", now)
+    assert (start, end) == (now, datetime.datetime(2025, 3, 6, tzinfo=BERLIN))
+
+
+def test_today_is_the_whole_day():
+    now = datetime.datetime(2025, 3, 5, 20, 15, tzinfo=BERLIN)
+    start, end, label = day_range("today", now)
+    assert (start, end) == (datetime.datetime(2025, 3, 5, tzinfo=BERLIN), datetime.datetime(2025, 3, 6, tzinfo=BERLIN))
+    assert label == "today (Wed 05 Mar)"
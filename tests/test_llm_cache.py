@@ -0,0 +1,13 @@
+from backend.llm_cache import LLMCache
+
+
+def _state(now: str) -> dict:
+    return {"input": "What time is it in London?", "chat_history": [], "intermediate_steps": [],
+            "timezone": "Europe/Berlin", "now": now}
+
+
+def test_decisions_are_keyed_on_the_minute_the_prompt_shows():
+    cache = LLMCache()
+    key = cache.key(_state("2025-03-05T10:15:02+01:00"))
+    assert cache.key(_state("2025-03-05T10:15:59+01:00")) == key
+    assert cache.key(_state("2025-03-05T10:16:00+01:00")) != key
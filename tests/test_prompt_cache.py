@@ -0,0 +1,89 @@
+import asyncio
+
+import pytest
+from google.genai import errors
+
+from backend import prompt_cache
+from backend.prompt_cache import PromptPrefix, min_cache_tokens, resolve_mode
+from benchmarks.fakes import FakeContextCacheClient, ScriptedChatModel
+
+PROMPT = "You are a calendar assistant.\n" * 40
+
+
+class FakeClock:
+    """Stands in for the ``time`` module's ``monotonic``."""
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self) -> float:
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = FakeClock()
+    monkeypatch.setattr(prompt_cache, "time", clock)
+    # No jitter: retry after the full backoff
+    monkeypatch.setattr(prompt_cache.random, "uniform", lambda low, high: high)
+    return clock
+
+
+@pytest.fixture
+def client():
+    return FakeContextCacheClient(ScriptedChatModel(scripts={}))
+
+
+def test_min_cache_tokens_by_model_family():
+    assert min_cache_tokens("gemini-1.5-flash") == 32768
+    assert min_cache_tokens("models/gemini-2.5-flash-001") == 1024
+    assert min_cache_tokens("gemini-2.5-pro") == 4096
+    assert min_cache_tokens("some-other-model") == prompt_cache.DEFAULT_CACHE_MIN_TOKENS
+
+
+def test_auto_mode_never_minimizes():
+    assert resolve_mode("auto", ScriptedChatModel(scripts={})) == "off"
+    assert resolve_mode("local", ScriptedChatModel(scripts={})) == "local"
+
+
+def test_prefix_below_the_model_minimum_is_sent_without_trying_a_cache():
+    client = FakeContextCacheClient(ScriptedChatModel(scripts={}), min_tokens=None)
+    prefix = PromptPrefix(PROMPT, mode="gemini", model_name="gemini-1.5-flash", client=client)
+    assert prefix.mode == "off"
+    assert prefix.system_prompt == PROMPT
+    assert [message.content for message in prefix.messages()] == [PROMPT]
+    assert client.attempts == 0
+
+
+def test_prefix_above_the_minimum_is_cached(client):
+    prefix = PromptPrefix(PROMPT, mode="gemini", model_name="gemini-1.5-flash", client=client)
+    assert prefix.mode == "gemini" and prefix.messages() == []
+    assert asyncio.run(prefix.cache_name()) == "cachedContents/fake-1"
+
+
+def test_transient_failures_are_retried_with_backoff(clock, client, monkeypatch):
+    monkeypatch.setattr(prompt_cache, "PROMPT_CACHE_RETRY_BASE", 10.0)
+    client.errors = [errors.ServerError(503, {"error": {"message": "unavailable"}}),
+                     errors.ClientError(429, {"error": {"message": "quota"}})]
+    prefix = PromptPrefix(PROMPT, mode="gemini", client=client)
+
+    assert asyncio.run(prefix.cache_name()) is None
+    clock.now += 9
+    assert asyncio.run(prefix.cache_name()) is None and client.attempts == 1
+    clock.now += 1
+    # Second failure in a row: twice the wait
+    assert asyncio.run(prefix.cache_name()) is None and client.attempts == 2
+    clock.now += 19
+    assert asyncio.run(prefix.cache_name()) is None and client.attempts == 2
+    clock.now += 1
+    assert asyncio.run(prefix.cache_name()) == "cachedContents/fake-1"
+    assert client.attempts == 3
+
+
+def test_permanent_failure_stops_trying(clock, client):
+    client.errors = [errors.ClientError(400, {"error": {"message": "bad request"}})]
+    prefix = PromptPrefix(PROMPT, mode="gemini", client=client)
+    assert asyncio.run(prefix.cache_name()) is None
+    clock.now += 10 ** 6
+    assert asyncio.run(prefix.cache_name()) is None
+    assert client.attempts == 1
@@ -0,0 +1,192 @@
+import asyncio
+import datetime
+import logging
+
+import pytest
+
+from backend.cache import TTLCache
+from backend.event_store import get_event_mirror
+from backend.push import MemoryChannelStore, SQLiteChannelStore, WatchChannels
+from benchmarks.fakes import FakeCalendarService
+
+START = datetime.datetime(2025, 3, 3, tzinfo=datetime.timezone.utc)
+ADDRESS = "https://agent.example/calendar/notifications"
+USER = "user-key"
+
+
+class WorkerService:
+    """Another worker's Calendar service for the same user: its own object
+    (so its own mirror), talking to the same calendar."""
+
+    def __init__(self, service: FakeCalendarService):
+        self._service = service
+
+    def __getattr__(self, name):
+        return getattr(self._service, name)
+
+
+@pytest.fixture
+def service():
+    return FakeCalendarService(size=50, start=START)
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def store(request, tmp_path):
+    return MemoryChannelStore() if request.param == "memory" else SQLiteChannelStore(str(tmp_path / "sessions.db"))
+
+
+def _headers(service, state: str = "exists") -> list[dict]:
+    return [{name.lower(): value for name, value in headers.items()} for _, headers in service.notifications(state)]
+
+
+def _edit(service) -> str:
+    event_id = service.next_id()
+    begin = START + datetime.timedelta(hours=9)
+    service.put({'id': event_id, 'status': 'confirmed', 'summary': "Added elsewhere",
+                 'start': {'dateTime': begin.isoformat()},
+                 'end': {'dateTime': (begin + datetime.timedelta(minutes=30)).isoformat()}})
+    return event_id
+
+
+async def _settle(*channels: WatchChannels):
+    while any(watch._tasks for watch in channels):
+        await asyncio.gather(*(task for watch in channels for task in list(watch._tasks)))
+
+
+def test_workers_share_one_channel_per_user(service, store):
+    async def run():
+        first, second = WatchChannels(ADDRESS, store), WatchChannels(ADDRESS, store)
+        # Both see no channel and open one; only one is kept
+        first.watch(service, USER)
+        second.watch(WorkerService(service), USER)
+        await _settle(first, second)
+        assert list(service.watches) == [store.get(USER).id]
+        assert len(service.stopped_channels) == 1
+        # Later requests on either worker reuse it
+        first.watch(service, USER)
+        second.watch(WorkerService(service), USER)
+        await _settle(first, second)
+        assert len(service.watches) == 1
+
+    asyncio.run(run())
+
+
+def test_a_notification_on_another_worker_reaches_every_mirror(service, store):
+    async def run():
+        owner, other = WatchChannels(ADDRESS, store), WatchChannels(ADDRESS, store)
+        owner.watch(service, USER)
+        await _settle(owner)
+        mirror = get_event_mirror(service)
+        mirror.sync(service)
+
+        # Without a notification the mirror trusts itself
+        unnoticed = _edit(service)
+        mirror.sync(service)
+        assert unnoticed not in mirror.events
+
+        # The notification lands on a worker that doesn't serve the user
+        (headers,) = _headers(service)
+        assert other.notify(headers) == 200
+        mirror.sync(service)
+        assert unnoticed in mirror.events
+        assert owner.changes(USER) == 1
+
+    asyncio.run(run())
+
+
+def test_the_mirror_polls_once_the_channel_is_gone(service, store):
+    async def run():
+        watch = WatchChannels(ADDRESS, store)
+        watch.watch(service, USER)
+        await _settle(watch)
+        mirror = get_event_mirror(service)
+        assert mirror.max_staleness == watch.max_staleness
+        store.remove(USER, store.get(USER).id)
+        assert watch.changes(USER) is None
+        mirror.sync(service)
+        calls = service.calls
+        mirror.last_sync -= 31
+        mirror.sync(service)
+        assert service.calls > calls
+
+    asyncio.run(run())
+
+
+def test_notifications_for_unknown_channels_or_tokens_are_refused(service, store):
+    async def run():
+        watch = WatchChannels(ADDRESS, store)
+        watch.watch(service, USER)
+        await _settle(watch)
+        (headers,) = _headers(service)
+        assert watch.notify({**headers, "x-goog-channel-token": "forged"}) == 403
+        assert watch.notify({**headers, "x-goog-channel-id": "no-such-channel"}) == 404
+        assert watch.notify(_headers(service, "sync")[0]) == 200
+        assert watch.changes(USER) == 0
+
+    asyncio.run(run())
+
+
+def test_failed_opens_back_off(service, caplog):
+    async def run():
+        watch = WatchChannels(ADDRESS, retry_base=30)
+        attempts = []
+
+        def fail(_service, user):
+            attempts.append(user)
+            raise ConnectionError("calendar unreachable")
+
+        watch.open = fail
+        with caplog.at_level(logging.WARNING):
+            await watch.watch(service, USER)
+        # Further requests don't try again until the backoff has passed
+        assert watch.watch(service, USER) is None
+        assert len(attempts) == 1
+        assert watch._users[USER].retry_at > 0
+        (record,) = [r for r in caplog.records if "watch channel" in r.getMessage()]
+        assert record.exc_info is None and "30s" in record.getMessage()
+
+        watch._users[USER].retry_at = 0
+        await watch.watch(service, USER)
+        assert len(attempts) == 2
+        assert "60s" in caplog.records[-1].getMessage()
+
+    asyncio.run(run())
+
+
+def test_evicting_the_user_stops_their_channel(service, store):
+    async def run():
+        watch = WatchChannels(ADDRESS, store)
+        users = TTLCache(maxsize=1, on_evict=lambda key, value: watch.forget(key, value))
+        users.set(USER, service)
+        watch.watch(service, USER)
+        await _settle(watch)
+        channel_id = store.get(USER).id
+
+        users.set("someone-else", FakeCalendarService())
+        await _settle(watch)
+        assert service.stopped_channels == [channel_id] and not service.watches
+        assert store.get(USER) is None and len(watch) == 0
+        assert get_event_mirror(service).max_staleness is None
+
+    asyncio.run(run())
+
+
+def test_eviction_keeps_a_channel_another_worker_still_uses(service, store):
+    async def run():
+        first, second = WatchChannels(ADDRESS, store), WatchChannels(ADDRESS, store)
+        first.watch(service, USER)
+        await _settle(first)
+        other = WorkerService(service)
+        second.watch(other, USER)
+        # The other worker's request came later
+        later = second._users[USER].last_seen = first._users[USER].last_seen + 1
+        store.touch(USER, later)
+
+        first.forget(USER, service)
+        await _settle(first)
+        assert store.get(USER) is not None and len(service.watches) == 1
+
+        await second.close_all()
+        assert store.get(USER) is None and not service.watches
+
+    asyncio.run(run())
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from backend import main as backend_main
+from backend.sessions import MemorySessionStore, Session, SQLiteSessionStore
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = MemorySessionStore()
+    monkeypatch.setattr(backend_main, "session_store", store)
+    return store
+
+
+def test_new_conversations_get_a_server_id(store):
+    session = backend_main.load_session(None, "alice")
+    assert session.id and session.owner == "alice" and session.history == []
+
+
+def test_unknown_session_ids_are_not_reused(store):
+    session = backend_main.load_session("chosen-by-the-client", "alice")
+    assert session.id != "chosen-by-the-client"
+    assert session.history == []
+
+
+def test_known_sessions_continue(store):
+    session = Session(id="abc", owner="alice")
+    session.add_turn("hi", "hello")
+    store.save(session)
+    assert backend_main.load_session("abc", "alice").history == session.history
+
+
+def test_sessions_of_other_users_are_not_found(store):
+    store.save(Session(id="abc", owner="alice"))
+    with pytest.raises(HTTPException) as error:
+        backend_main.load_session("abc", "mallory")
+    assert error.value.status_code == 404
+
+
+def test_sqlite_sessions_expire(tmp_path, monkeypatch):
+    store = SQLiteSessionStore(str(tmp_path / "sessions.db"), ttl=60)
+    store.save(Session(id="abc", owner="alice"))
+    assert store.get("abc") is not None
+    now = time.time()
+    monkeypatch.setattr("backend.sessions.time.time", lambda: now + 61)
+    assert store.get("abc") is None
+    # Saving any session prunes the expired ones
+    store.save(Session(id="def", owner="alice"))
+    monkeypatch.undo()
+    assert store.get("abc") is None